@@ -0,0 +1,431 @@
+"""Load test: concurrent mixed traffic against the app, fully offline.
+
+Starts uvicorn with `--workers` processes (or targets a running server with
+`--url`), replaces Gemini with the fake chat backend
+(EXOVISION_CHAT_BACKEND=fake, latency from the scenario's `env`) and runs a
+scenario: a weighted mix of requests sent by `concurrency` clients, plus an
+optional training job started at the same time. Throughput and p50/p95/p99
+are reported per endpoint. A server started by the harness runs in a
+temporary directory with its own empty models/ and dataset/, where the
+scenario's `model` is first trained on synthetic data, so nothing the load
+test trains or stores is left in the repository (with `--url` the model
+must already be served). Run from the repository root:
+
+    python -m benchmarks.load
+    python -m benchmarks.load --scenario predict --workers 1 2 4
+    python -m benchmarks.load --scenario my_scenario.json --output load.json
+    python -m benchmarks.load --baseline load.json --tolerance 0.25
+
+A scenario is one of `SCENARIOS` or a JSON file with any of the keys of
+`DEFAULT_SCENARIO`. With `rate` set, requests arrive as a Poisson process
+(open loop) and latency counts from the scheduled send time, so a slow
+server cannot hide its queueing by slowing the clients down; otherwise
+every client sends its next request when the last one returns.
+"""
+
+from benchmarks.run import compare, percentiles
+from benchmarks.synthetic import make_koi_dataset
+from utils.constants import Constants
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import subprocess
+import argparse
+import datetime
+import platform
+import tempfile
+import asyncio
+import random
+import httpx
+import json
+import time
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SCENARIO = {
+    # seconds measured, after `warmup` seconds of unrecorded traffic
+    "duration": 30,
+    "warmup": 5,
+    # clients in closed loop; in open loop, the most requests in flight
+    "concurrency": 16,
+    # requests per second for open loop, None for closed loop
+    "rate": None,
+    # mean pause of a closed-loop client between requests
+    "think_ms": 0,
+    "model": "loadtest",
+    # relative weights of the request kinds in `LoadTest.REQUESTS`
+    "mix": {"manual": 40, "csv": 10, "model_info": 15, "confusion_matrix": 10, "chat": 25},
+    # CSV uploads pick one of these sizes
+    "csv_rows": [100, 1_000, 10_000],
+    # a training job submitted when the measurement starts, or None
+    "train": {"rows": 5_000, "search": "full"},
+    # extra environment of the server started by the harness
+    "env": {
+        "EXOVISION_CHAT_FAKE_FIRST_TOKEN_MS": "300",
+        "EXOVISION_CHAT_FAKE_TOKENS_PER_SECOND": "40",
+    },
+}
+
+SCENARIOS = {
+    "mixed": {},
+    "predict": {
+        "concurrency": 32,
+        "mix": {"manual": 80, "model_info": 10, "confusion_matrix": 10},
+        "train": None,
+    },
+    "chat": {"concurrency": 64, "mix": {"chat": 1}, "train": None},
+    "training": {
+        "mix": {"manual": 70, "csv": 10, "model_info": 20},
+        "train": {"rows": 10_000, "search": "full"},
+    },
+}
+
+
+def load_scenario(name_or_path: str) -> dict:
+    if name_or_path in SCENARIOS:
+        overrides = SCENARIOS[name_or_path]
+    else:
+        with open(name_or_path) as f:
+            overrides = json.load(f)
+    unknown = set(overrides) - set(DEFAULT_SCENARIO)
+    if unknown:
+        raise ValueError(f"Unknown scenario keys: {', '.join(sorted(unknown))}")
+    scenario = {**DEFAULT_SCENARIO, **overrides}
+    scenario["env"] = {**DEFAULT_SCENARIO["env"], **overrides.get("env", {})}
+    return scenario
+
+
+def ensure_model(name: str, models_dir="models"):
+    """Train a small model on synthetic data if `name` is not saved yet."""
+    from utils.model_creator import ExoplanetRandomForestModelGenerator
+    from utils.model_store import ModelStore
+
+    if name in ModelStore(models_dir).names():
+        return
+    print(f"Training {name} on synthetic data for the load test")
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_path = os.path.join(workdir, "train.csv")
+        make_koi_dataset(2_000, seed=1).to_csv(csv_path, index=False)
+        generator = ExoplanetRandomForestModelGenerator(csv_paths=[csv_path])
+        generator.load_and_validate()
+        X_train_res, X_test, y_train_res, y_test = generator.preprocess()
+        generator.train(X_train_res, y_train_res)
+        generator.evaluate(X_test, y_test)
+        generator.save(name, models_dir)
+
+
+@contextmanager
+def workspace():
+    """A scratch working directory for the server: models/ and dataset/ are
+    created in it and deleted with it; static/ and templates/ link back."""
+    with tempfile.TemporaryDirectory(prefix="exovision-load-") as workdir:
+        for name in (Constants.STATIC_DIR, Constants.TEMPLATE_DIR):
+            os.symlink(os.path.join(ROOT, name), os.path.join(workdir, name))
+        yield workdir
+
+
+@contextmanager
+def serve(workers: int, env: dict, workdir: str, port=8765):
+    """A uvicorn server with `workers` processes running in `workdir`, once
+    every worker is ready."""
+    # the app's paths are relative to the working directory, its code is not
+    python_path = os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")]))
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app", "--app-dir", ROOT,
+            "--port", str(port), "--workers", str(workers), "--log-level", "warning",
+        ],
+        cwd=workdir,
+        env={**os.environ, "PYTHONPATH": python_path, "EXOVISION_CHAT_BACKEND": "fake", **env},
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 120
+        ready = 0
+        # /ready answers from whichever worker takes the connection, so wait
+        # for a run of successes
+        while ready < 2 * workers:
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("server did not become ready")
+            try:
+                ready = ready + 1 if httpx.get(f"{url}/ready").status_code == 200 else 0
+            except httpx.HTTPError:
+                ready = 0
+            time.sleep(0.2)
+        yield url
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+class LoadTest:
+    """Runs one scenario against `base_url` and collects latencies."""
+
+    REQUESTS = ("manual", "csv", "model_info", "confusion_matrix", "chat")
+
+    def __init__(self, base_url: str, scenario: dict, seed=0):
+        unknown = set(scenario["mix"]) - set(self.REQUESTS)
+        if unknown:
+            raise ValueError(f"Unknown request kinds: {', '.join(sorted(unknown))}")
+        self.base_url = base_url
+        self.scenario = scenario
+        self.model = scenario["model"]
+        self.rng = random.Random(seed)
+        self.kinds = list(scenario["mix"])
+        self.weights = [scenario["mix"][kind] for kind in self.kinds]
+        # seconds and status codes per endpoint label
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        self.statuses: dict[str, Counter] = defaultdict(Counter)
+        self.dropped = 0
+        self.recording = False
+        self.training: dict | None = None
+
+        rows = make_koi_dataset(1_000, seed=seed + 2, with_target=False)
+        self.rows = rows.to_dict(orient="records")
+        self.csvs = {
+            n: make_koi_dataset(n, seed=seed + 3, with_target=False).to_csv(index=False).encode()
+            for n in (scenario["csv_rows"] if "csv" in scenario["mix"] else [])
+        }
+
+    async def manual(self, client):
+        response = await client.post(
+            "/predict/manual", json={"model": self.model, **self.rng.choice(self.rows)}
+        )
+        # the endpoint answers 200 with an "error" key when prediction fails
+        failed = response.status_code == 200 and "error" in response.json()
+        return "manual", "error" if failed else response.status_code
+
+    async def csv(self, client):
+        n_rows = self.rng.choice(list(self.csvs))
+        response = await client.post(
+            "/predict/csv",
+            data={"model": self.model},
+            files={"file": ("load.csv", self.csvs[n_rows], "text/csv")},
+        )
+        return f"csv.{n_rows}", response.status_code
+
+    async def model_info(self, client):
+        response = await client.get(f"/model/{self.model}")
+        return "model_info", response.status_code
+
+    async def confusion_matrix(self, client):
+        response = await client.get(f"/model/{self.model}/confusion-matrix")
+        return "confusion_matrix", response.status_code
+
+    async def chat(self, client):
+        started = time.perf_counter()
+        message = f"How does the transit method find planets? ({self.rng.randrange(10**6)})"
+        async with client.stream("POST", "/chat/stream", json={"message": message}) as response:
+            first_token = True
+            async for line in response.aiter_lines():
+                if first_token and line == "event: token":
+                    self.record("chat.first_token", time.perf_counter() - started, 200)
+                    first_token = False
+                elif line == "event: error":
+                    return "chat", "error"
+        return "chat", response.status_code
+
+    def record(self, label: str, seconds: float, status):
+        if self.recording:
+            self.statuses[label][status] += 1
+            if status == 200:
+                self.samples[label].append(seconds)
+
+    async def one(self, client, started=None):
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        started = time.perf_counter() if started is None else started
+        try:
+            label, status = await getattr(self, kind)(client)
+        except httpx.HTTPError as e:
+            label, status = kind, type(e).__name__
+        self.record(label, time.perf_counter() - started, status)
+
+    async def closed_loop(self, client, until: float):
+        think = self.scenario["think_ms"] / 1000
+        while time.perf_counter() < until:
+            await self.one(client)
+            if think:
+                await asyncio.sleep(self.rng.expovariate(1 / think))
+
+    async def open_loop(self, client, until: float):
+        in_flight = set()
+        scheduled = time.perf_counter()
+        while scheduled < until:
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            if len(in_flight) >= self.scenario["concurrency"]:
+                if self.recording:
+                    self.dropped += 1
+            else:
+                task = asyncio.create_task(self.one(client, started=scheduled))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            scheduled += self.rng.expovariate(self.scenario["rate"])
+        await asyncio.gather(*in_flight)
+
+    async def train(self, until: float):
+        spec = self.scenario["train"]
+        csv = make_koi_dataset(spec["rows"], seed=4).to_csv(index=False).encode()
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=120) as client:
+            started = time.perf_counter()
+            try:
+                response = await client.post(
+                    "/custom-model/train",
+                    data={"model_name": f"{self.model}-train", "search": spec["search"], "promote": "false"},
+                    files={"files": ("load-train.csv", csv, "text/csv")},
+                )
+                status = 200 if response.is_success else response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            # a rejected job (e.g. 429 with another one running) is a failed
+            # request like any other, not the end of the run
+            self.record("train", time.perf_counter() - started, status)
+            if status != 200:
+                self.training = {"status": f"not started ({status})", "seconds": 0.0, "resources": None}
+                return
+            job_id = response.json()["job_id"]
+            while True:
+                job = (await client.get(f"/custom-model/jobs/{job_id}")).json()
+                if job.get("status") in ("succeeded", "failed", "cancelled"):
+                    break
+                if time.perf_counter() >= until:
+                    # leave nothing running once the measurement is over
+                    await client.post(f"/custom-model/jobs/{job_id}/cancel")
+                    job["status"] = "running at the end"
+                    break
+                await asyncio.sleep(1)
+        self.training = {
+            "status": job.get("status"),
+            "seconds": time.perf_counter() - started,
+            "resources": job.get("resources"),
+        }
+
+    async def run(self) -> float:
+        scenario = self.scenario
+        async with httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=120,
+            limits=httpx.Limits(max_connections=scenario["concurrency"]),
+        ) as client:
+            start = time.perf_counter()
+            measure_from = start + scenario["warmup"]
+            until = measure_from + scenario["duration"]
+
+            async def start_recording():
+                await asyncio.sleep(scenario["warmup"])
+                self.recording = True
+                if scenario["train"]:
+                    await self.train(until)
+
+            tasks = [asyncio.create_task(start_recording())]
+            if scenario["rate"]:
+                tasks.append(asyncio.create_task(self.open_loop(client, until)))
+            else:
+                tasks += [
+                    asyncio.create_task(self.closed_loop(client, until))
+                    for _ in range(scenario["concurrency"])
+                ]
+            await asyncio.gather(*tasks)
+        # requests that finished after `until` still count
+        return time.perf_counter() - measure_from
+
+    def report(self, elapsed: float, prefix="") -> dict:
+        results = {}
+        for label in sorted(self.statuses):
+            statuses = self.statuses[label]
+            samples = self.samples[label]
+            results[f"{prefix}{label}.throughput"] = {
+                "value": len(samples) / elapsed, "unit": "req/s", "better": "higher"
+            }
+            for name, value in (percentiles(samples) if samples else {}).items():
+                results[f"{prefix}{label}.{name}"] = {"value": value, "unit": "ms", "better": "lower"}
+            failed = sum(count for status, count in statuses.items() if status != 200)
+            results[f"{prefix}{label}.error_rate"] = {
+                "value": failed / sum(statuses.values()), "unit": "", "better": "lower"
+            }
+        return results
+
+    def print_report(self, elapsed: float):
+        print(f"\n{'endpoint':<20}{'ok':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  failures")
+        for label in sorted(self.statuses):
+            statuses = self.statuses[label]
+            samples = self.samples[label]
+            p = percentiles(samples) if samples else {"p50": 0, "p95": 0, "p99": 0}
+            failures = ", ".join(f"{status}: {n}" for status, n in statuses.items() if status != 200)
+            print(
+                f"{label:<20}{len(samples):>8}{len(samples) / elapsed:>9.1f}"
+                f"{p['p50']:>10.1f}{p['p95']:>10.1f}{p['p99']:>10.1f}  {failures}"
+            )
+        if self.dropped:
+            print(f"{self.dropped} arrivals dropped with {self.scenario['concurrency']} already in flight")
+        if self.training is not None:
+            print(f"training job: {self.training['status']} after {self.training['seconds']:.1f} s")
+
+
+def run_scenario(url: str, scenario: dict, prefix="", seed=0) -> dict:
+    test = LoadTest(url, scenario, seed=seed)
+    elapsed = asyncio.run(test.run())
+    test.print_report(elapsed)
+    return {"results": test.report(elapsed, prefix), "training": test.training, "dropped": test.dropped}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", default="mixed", help=f"one of {', '.join(SCENARIOS)} or a JSON file")
+    parser.add_argument("--url", help="load a running server instead of starting one")
+    parser.add_argument(
+        "--workers", type=int, nargs="*", default=[1], help="uvicorn workers; several sizes run one after another"
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--duration", type=float, help="override the scenario's duration")
+    parser.add_argument("--concurrency", type=int, help="override the scenario's concurrency")
+    parser.add_argument("--rate", type=float, help="override the scenario's open-loop rate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--baseline", help="compare against a previous --output file")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario)
+    for key in ("duration", "concurrency", "rate"):
+        if getattr(args, key) is not None:
+            scenario[key] = getattr(args, key)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "scenario": scenario,
+        },
+        "results": {},
+        "runs": {},
+    }
+    if args.url:
+        run = run_scenario(args.url, scenario, seed=args.seed)
+        report["results"].update(run["results"])
+        report["runs"]["url"] = run
+    else:
+        with workspace() as workdir:
+            ensure_model(scenario["model"], os.path.join(workdir, "models"))
+            for workers in args.workers:
+                print(f"\n== {args.scenario} with {workers} worker(s) ==")
+                # keep result names stable when only one size is run
+                prefix = f"workers{workers}." if len(args.workers) > 1 else ""
+                with serve(workers, scenario["env"], workdir, port=args.port) as url:
+                    run = run_scenario(url, scenario, prefix, seed=args.seed)
+                report["results"].update(run["results"])
+                report["runs"][f"workers{workers}"] = run
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nComparing with {args.baseline} (tolerance {args.tolerance:.0%})")
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,181 @@
+"""Offline benchmarks for startup, inference, CSV ingestion and training.
+
+Everything runs on synthetic data from `benchmarks.synthetic`, so no network
+or Kepler tables are needed. Run from the repository root:
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --baseline bench.json --tolerance 0.25
+
+With `--baseline`, every metric is compared to the stored run and the
+process exits with status 1 if any got worse by more than the tolerance.
+"""
+
+from benchmarks.synthetic import make_koi_dataset
+from benchmarks.startup import profile_imports
+from utils.constants import Constants
+import numpy as np
+import argparse
+import datetime
+import platform
+import tempfile
+import json
+import time
+import sys
+import os
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    return {
+        f"p{q}": float(np.percentile(samples, q) * 1000) for q in (50, 95, 99)
+    }
+
+
+class Benchmarks:
+    def __init__(self, workdir: str, quick=False):
+        self.workdir = workdir
+        self.quick = quick
+        self.results: dict[str, dict] = {}
+        self.models_dir = os.path.join(workdir, "models")
+
+    def record(self, name, value, unit, better="lower"):
+        self.results[name] = {"value": float(value), "unit": unit, "better": better}
+        print(f"{name:<45} {value:>14.3f} {unit}")
+
+    def bench_startup(self):
+        report = profile_imports("main", runs=1 if self.quick else 3)
+        self.record("startup.import_main", report["total_seconds"], "s")
+
+    def bench_training(self):
+        from utils.model_creator import ExoplanetRandomForestModelGenerator
+
+        csv_path = os.path.join(self.workdir, "train.csv")
+        make_koi_dataset(2000 if self.quick else 10_000, seed=1).to_csv(csv_path, index=False)
+
+        generator = ExoplanetRandomForestModelGenerator(csv_paths=[csv_path])
+        _, seconds = timed(generator.load_and_validate)
+        self.record("training.load", seconds, "s")
+        (X_train_res, X_test, y_train_res, y_test), _ = timed(generator.preprocess)
+        self.record("training.scale", generator.stage_seconds["scale"], "s")
+        self.record("training.smote", generator.stage_seconds["smote"], "s")
+        _, seconds = timed(generator.train, X_train_res, y_train_res)
+        self.record("training.search", seconds, "s")
+        _, seconds = timed(generator.save, "benchmark", self.models_dir)
+        self.record("training.save", seconds, "s")
+
+    def bench_predict(self):
+        from utils.main import ExoPlanetsClassifier
+        from utils.model_store import ModelStore
+
+        store = ModelStore(self.models_dir)
+        classifier = ExoPlanetsClassifier(
+            store.artifact_path("benchmark", store.current("benchmark")), name="benchmark"
+        )
+        X = make_koi_dataset(100_000, seed=2, with_target=False).to_numpy(dtype=float)
+
+        samples = []
+        for row in X[: 50 if self.quick else 300]:
+            _, seconds = timed(classifier.predict, list(row))
+            samples.append(seconds)
+        for name, value in percentiles(samples).items():
+            self.record(f"predict.single.{name}", value, "ms")
+
+        for n_rows in (100, 1_000, 10_000) if self.quick else (100, 1_000, 10_000, 100_000):
+            _, seconds = timed(classifier.predict_batch, X[:n_rows])
+            self.record(f"predict.batch.{n_rows}.rows_per_s", n_rows / seconds, "rows/s", "higher")
+
+    def bench_csv_endpoint(self):
+        from fastapi.testclient import TestClient
+        from utils.model_store import ModelStore
+        import main
+
+        # serve the benchmark model instead of whatever is in models/
+        main.models.store = ModelStore(self.models_dir)
+        main.models.refresh()
+        main.prediction_cache.clear()
+        client = TestClient(main.app)
+
+        for n_rows in (100, 1_000) if self.quick else (100, 1_000, 10_000):
+            csv = make_koi_dataset(n_rows, seed=3, with_target=False).to_csv(index=False)
+            samples = []
+            for _ in range(3):
+                main.prediction_cache.clear()
+                response, seconds = timed(
+                    client.post,
+                    "/predict/csv",
+                    data={"model": "benchmark"},
+                    files={"file": ("bench.csv", csv.encode(), "text/csv")},
+                )
+                response.raise_for_status()
+                samples.append(seconds)
+            self.record(f"csv_endpoint.{n_rows}.p50", percentiles(samples)["p50"], "ms")
+
+    def run(self, only=None):
+        stages = {
+            "startup": self.bench_startup,
+            "training": self.bench_training,
+            "predict": self.bench_predict,
+            "csv_endpoint": self.bench_csv_endpoint,
+        }
+        for name, bench in stages.items():
+            # later stages need the model produced by training
+            if only and name not in only and name != "training":
+                continue
+            bench()
+        return {
+            "meta": {
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "quick": self.quick,
+            },
+            "results": self.results,
+        }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, base in baseline["results"].items():
+        result = current["results"].get(name)
+        if result is None or base["value"] == 0:
+            continue
+        ratio = result["value"] / base["value"]
+        worse = ratio > 1 + tolerance if base["better"] == "lower" else ratio < 1 - tolerance
+        print(f"{name:<45} {base['value']:>12.3f} -> {result['value']:>12.3f} ({ratio:.2f}x)"
+              + ("  REGRESSION" if worse else ""))
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--baseline", help="compare against a previous --output file")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--quick", action="store_true", help="smaller datasets and fewer repeats")
+    parser.add_argument(
+        "--only", nargs="*", choices=["startup", "training", "predict", "csv_endpoint"]
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        report = Benchmarks(workdir, quick=args.quick).run(only=args.only)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\nComparing with {args.baseline} (tolerance {args.tolerance:.0%})")
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
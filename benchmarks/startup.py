@@ -0,0 +1,82 @@
+"""Import-time profile of the app, to hold the cold-start budget.
+
+Imports `main` in fresh interpreters with `python -X importtime` and reports
+the slowest modules. Run from the repository root:
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --budget 1.5 --top 30
+
+Exits with status 1 if the import takes longer than `--budget` seconds or
+pulls in any of `LAZY_MODULES`, which must only load on first use.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+
+# heavy packages that only chat, training or the lifespan warm-up may import
+LAZY_MODULES = ("google.generativeai", "sklearn", "imblearn", "scipy", "pandas", "matplotlib")
+
+
+def profile_imports(module="main", runs=3) -> dict:
+    """Best of `runs` cold imports of `module`, with per-module timings."""
+    check = f"import sys, json; import {module}; print(json.dumps(sorted(sys.modules)))"
+    best = None
+    for _ in range(runs):
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", check],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        # lines look like "import time:  self [us] | cumulative | imported package"
+        timings = []
+        for line in process.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+            timings.append((name.strip(), int(cumulative_us) / 1e6, int(self_us) / 1e6))
+        total = next(seconds for name, seconds, _ in timings if name == module)
+        if best is None or total < best["total_seconds"]:
+            loaded = json.loads(process.stdout.splitlines()[-1])
+            best = {
+                "module": module,
+                "total_seconds": total,
+                "modules": sorted(timings, key=lambda t: t[1], reverse=True),
+                "eager_heavy_modules": [name for name in LAZY_MODULES if name in loaded],
+            }
+    return best
+
+
+def print_report(report: dict, top=20):
+    print(f"import {report['module']}: {report['total_seconds'] * 1000:.1f} ms")
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, cumulative, own in report["modules"][:top]:
+        print(f"{cumulative * 1000:>14.1f} {own * 1000:>9.1f}  {name}")
+    if report["eager_heavy_modules"]:
+        print(f"\nImported eagerly: {', '.join(report['eager_heavy_modules'])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=20, help="number of modules to list")
+    parser.add_argument("--budget", type=float, help="fail above this many seconds")
+    parser.add_argument("--output", help="write the report as JSON to this path")
+    args = parser.parse_args()
+
+    report = profile_imports(args.module, runs=args.runs)
+    print_report(report, top=args.top)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = bool(report["eager_heavy_modules"])
+    if args.budget is not None and report["total_seconds"] > args.budget:
+        print(f"\nOver the cold-start budget of {args.budget:.2f} s")
+        failed = True
+    if failed:
+        sys.exit(1)
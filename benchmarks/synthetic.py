@@ -0,0 +1,58 @@
+from utils.constants import Constants
+import numpy as np
+import pandas as pd
+
+
+DISPOSITIONS = np.array(["CONFIRMED", "CANDIDATE", "FALSE POSITIVE"])
+
+
+def make_koi_dataset(n_rows: int, seed: int = 42, with_target=True) -> pd.DataFrame:
+    """Synthetic KOI table with the columns of `Constants.FEATURES_REQUIRED_TO_PREDICT`.
+
+    Values follow rough Kepler ranges and the disposition depends on a few of
+    them, so forests trained on it have real structure to learn.
+    """
+    rng = np.random.default_rng(seed)
+    period = rng.lognormal(mean=2.5, sigma=1.2, size=n_rows)
+    duration = rng.lognormal(mean=1.2, sigma=0.5, size=n_rows)
+    depth = rng.lognormal(mean=6.0, sigma=1.5, size=n_rows)
+    snr = rng.lognormal(mean=3.0, sigma=1.0, size=n_rows)
+    prad = rng.lognormal(mean=1.0, sigma=0.9, size=n_rows)
+    srad = rng.lognormal(mean=0.0, sigma=0.3, size=n_rows)
+
+    def err(values, scale):
+        return np.abs(rng.normal(scale=scale, size=n_rows)) * values
+
+    columns = {
+        "koi_period": period,
+        "koi_period_err1": err(period, 1e-4),
+        "koi_period_err2": -err(period, 1e-4),
+        "koi_time0bk_err1": np.abs(rng.normal(scale=5e-3, size=n_rows)),
+        "koi_time0bk_err2": -np.abs(rng.normal(scale=5e-3, size=n_rows)),
+        "koi_time0_err1": np.abs(rng.normal(scale=5e-3, size=n_rows)),
+        "koi_time0_err2": -np.abs(rng.normal(scale=5e-3, size=n_rows)),
+        "koi_impact": rng.uniform(0, 1.2, size=n_rows),
+        "koi_duration": duration,
+        "koi_duration_err1": err(duration, 0.05),
+        "koi_duration_err2": -err(duration, 0.05),
+        "koi_depth": depth,
+        "koi_prad": prad,
+        "koi_prad_err1": err(prad, 0.2),
+        "koi_sma": (period / 365.25) ** (2 / 3),
+        "koi_insol_err1": rng.lognormal(mean=2.0, sigma=2.0, size=n_rows),
+        "koi_insol_err2": -rng.lognormal(mean=2.0, sigma=2.0, size=n_rows),
+        "koi_model_snr": snr,
+        "koi_num_transits": np.maximum(1, 1400 / period).round(),
+        "koi_bin_oedp_sig": rng.uniform(0, 1, size=n_rows),
+        "koi_srad": srad,
+    }
+    df = pd.DataFrame({name: columns[name] for name in Constants.FEATURES_REQUIRED_TO_PREDICT})
+
+    if with_target:
+        score = np.log(snr) - 0.8 * df["koi_impact"] - 0.3 * np.log(prad) + rng.normal(
+            scale=0.6, size=n_rows
+        )
+        # lowest 55% false positives, next 25% candidates, top 20% confirmed
+        bins = np.digitize(score, np.quantile(score, [0.55, 0.8]))
+        df["koi_disposition"] = DISPOSITIONS[2 - bins]
+    return df
@@ -1,31 +1,302 @@
-from utils.gemini import chat_with_gemini_as_astronomy_expert
+from utils.gemini import ChatService, ChatTimeoutError
 from fastapi.responses import (
     HTMLResponse,
     JSONResponse,
+    PlainTextResponse,
     Response,
     StreamingResponse,
 )
-from fastapi import FastAPI, Request, File, UploadFile, Form
+from fastapi import FastAPI, Request, File, UploadFile, Form, Query
 from schemas.schemas import ModelInputForm, ChatMessage
-from utils.utils import get_models, get_models_names
+from utils.utils import get_models_names, read_csv_bytes, display_confusion_matrix
+from utils.registry import ModelRegistry
+from utils.model_store import ModelStore
+from utils.memory import memory_report, process_memory
+from utils.executor import InferencePool, PoolSaturatedError
+from utils.batching import MicroBatchDispatcher
+from utils.cache import PredictionCache
+from utils.metrics import metrics, request_timings, server_timing_header
+from starlette.concurrency import run_in_threadpool
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from utils.constants import Constants
-from io import BytesIO
 import os
-from typing import List
-from utils.model_creator import ExoplanetRandomForestModelGenerator
-import pandas as pd
+import tempfile
+from typing import List, Optional
+from utils.jobs import TrainingJobManager, SEARCH_MODES
+from utils.datasets import DatasetStore
+from utils.warmup import Warmup
+from utils.results import ResultStore, ResultNotFound
+from utils.batch_api import decode_features, read_body, RequestTooLarge, UnsupportedMediaType
+from utils.validation import ValidationReport, validate_frame, validate_matrix
+from utils.lightcurve import CSV, StellarParams, TooManyPoints, TransitSearch, read_light_curves
+from utils.curves import CurveNotFound, CurveStore
+from utils.governor import ResourceGovernor, effective_threads
+from contextlib import asynccontextmanager
+import numpy as np
+import orjson
+import asyncio
 import time
 
-app = FastAPI()
 
-models = get_models()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # warm-up runs in the background: the server accepts connections right
+    # away and /ready answers 200 once models are loaded
+    warmup_task = asyncio.create_task(run_in_threadpool(warmup.run))
+    refresh_task = (
+        asyncio.create_task(refresh_models_periodically(MODEL_REFRESH_SECONDS))
+        if MODEL_REFRESH_SECONDS > 0
+        else None
+    )
+    yield
+    warmup_task.cancel()
+    if refresh_task is not None:
+        refresh_task.cancel()
+    interactive_pool.shutdown(wait=False)
+    batch_pool.shutdown(wait=False)
+    lightcurve_pool.shutdown(wait=False)
+
+
+app = FastAPI(lifespan=lifespan)
+
+# by default serving uses every core and training jobs run on the last half
+# at a lower priority, so only niceness separates them. EXOVISION_SERVING_CORES
+# / _TRAINING_CORES / _TRAINING_NICE / _MAX_TRAINING_JOBS split them: this
+# process caps its BLAS/OpenMP threads, pools and model n_jobs to the serving
+# share, training jobs are pinned to theirs (at most _MAX_TRAINING_JOBS across
+# all workers)
+governor = ResourceGovernor.from_env()
+governor.apply_serving()
+
+# models are loaded on first use and evicted past EXOVISION_MODEL_MEMORY_BUDGET_MB;
+# "name@version" pins a request to one saved version of a model
+models = ModelRegistry.from_env("models", n_jobs=governor.serving_cores)
+# versions saved or promoted by other workers are picked up this often
+# (only the models that changed are reloaded); 0 disables polling
+MODEL_REFRESH_SECONDS = float(os.getenv("EXOVISION_MODEL_REFRESH_SECONDS", "5"))
+
+# small manual predictions get their own pool so they never queue behind
+# batch work; both are configurable through EXOVISION_<NAME>_POOL_* env vars
+interactive_pool = InferencePool.from_env("interactive", max_workers=2, max_queue=64)
+batch_pool = InferencePool.from_env("batch", max_workers=governor.serving_cores, max_queue=8)
+# transit searches are CPU-bound NumPy with Python loops between the array
+# operations, so they run in worker processes; every request is split into
+# one slice of the period range per worker
+lightcurve_pool = InferencePool.from_env(
+    "lightcurve", kind="process", max_workers=governor.serving_cores
+)
+# period range and binning from EXOVISION_LIGHTCURVE_MIN_PERIOD / _MAX_PERIOD / _OVERSAMPLE
+light_curve_search = TransitSearch.from_env()
+# light curves stored for plotting with their min/max pyramids, so chart
+# zooms only fetch the points they draw (EXOVISION_CURVE_DIR / _MAX_CURVES / _CACHE_SIZE)
+curve_store = CurveStore.from_env()
+# predictions are served through an LRU+TTL cache keyed by artifact hash and
+# feature vector; metadata lookups keep using `models` directly
+prediction_cache = PredictionCache.from_env()
+served_models = prediction_cache.view(models)
+# concurrent manual predictions for the same model are coalesced into one
+# predict_batch call (EXOVISION_MICROBATCH_WINDOW_MS / _MAX_ROWS)
+manual_batcher = MicroBatchDispatcher.from_env(served_models, interactive_pool.run)
+# models named in EXOVISION_WARMUP_MODELS (default: all) are loaded and run
+# once at startup; EXOVISION_WARMUP=0 leaves them to load on first use
+warmup = Warmup.from_env(models)
+# LLM replies stream asynchronously, EXOVISION_CHAT_MAX_CONCURRENT at a time;
+# EXOVISION_CHAT_BACKEND=fake serves canned replies for offline load tests
+chat_service = ChatService.from_env()
+# CSV prediction runs are kept on disk column by column and served in pages
+# (EXOVISION_RESULT_TTL_SECONDS / _MAX_RUNS)
+results = ResultStore.from_env()
+
+
+async def resolve_model(name: str, view=served_models):
+    """`view[name]`, unpickling the model in the batch pool if it is not resident."""
+    classifier = view.peek(name)
+    if classifier is None:
+        classifier = await batch_pool.run(view.__getitem__, name)
+    return classifier
+
+
+def reload_models(job):
+    # called from the job watcher thread once the artifact is saved
+    models.refresh()
+
+
+async def refresh_models_periodically(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_in_threadpool(models.refresh)
+        except Exception as e:
+            print(f"Model refresh failed: {e}")
+
+
+# uploaded training CSVs are parsed once into memory-mappable matrices,
+# keyed by the sha256 of their contents
+dataset_store = DatasetStore(os.getenv("EXOVISION_DATASET_DIR", os.path.join("dataset", "store")))
+
+# job state and events are kept on disk, so every worker can report any job
+training_jobs = TrainingJobManager(
+    root=os.getenv("EXOVISION_JOB_DIR", os.path.join("dataset", "jobs")),
+    max_concurrent=governor.max_training_jobs,
+    on_success=reload_models,
+    dataset_root=dataset_store.root,
+    limits=governor.training_limits(),
+)
+
+# add a Server-Timing header to every response (clients can also ask for it
+# per request with an X-Server-Timing header)
+SERVER_TIMING = os.getenv("EXOVISION_SERVER_TIMING", "0") == "1"
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory=Constants.TEMPLATE_DIR)
 
 
+@app.exception_handler(PoolSaturatedError)
+async def pool_saturated_handler(request: Request, exc: PoolSaturatedError):
+    return JSONResponse(
+        status_code=503, content={"message": str(exc)}, headers={"Retry-After": "1"}
+    )
+
+
+@app.exception_handler(RequestTooLarge)
+async def request_too_large_handler(request: Request, exc: RequestTooLarge):
+    return JSONResponse(status_code=413, content={"message": str(exc)})
+
+
+async def render_template(request: Request, name: str, context: dict) -> HTMLResponse:
+    template = templates.get_template(name)
+    with metrics.timer("render"):
+        html = await run_in_threadpool(template.render, {**context, "request": request})
+    return HTMLResponse(html)
+
+
+class RequestMetricsMiddleware:
+    """Counts and times every request and adds its Server-Timing header.
+
+    Plain ASGI rather than `@app.middleware("http")`, which runs every
+    request through an extra task and re-streams the response body.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = []
+        request_timings.set(timings)
+        wants_timing = SERVER_TIMING or any(
+            name == b"x-server-timing" for name, _ in scope["headers"]
+        )
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if timings and wants_timing:
+                    header = (b"server-timing", server_timing_header(timings).encode())
+                    message = {**message, "headers": [*message.get("headers", []), header]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            metrics.inc("http_requests_total", path=path, method=scope["method"], status=status)
+            metrics.observe("http_request_seconds", time.perf_counter() - started, path=path)
+
+
+app.add_middleware(RequestMetricsMiddleware)
+
+
+def count_model_request(model: str, endpoint: str):
+    # made-up model names must not each become a new series
+    metrics.inc(
+        "model_requests_total", model=model if model in models else "unknown", endpoint=endpoint
+    )
+
+
+@app.get("/metrics")
+async def get_metrics():
+    for pool in (interactive_pool, batch_pool, lightcurve_pool):
+        metrics.set("pool_pending", pool.pending, pool=pool.name)
+    cache_stats = prediction_cache.stats()
+    metrics.set("prediction_cache_hits", cache_stats["hits"])
+    metrics.set("prediction_cache_misses", cache_stats["misses"])
+    metrics.set("prediction_cache_size", cache_stats["size"])
+    registry_stats = models.stats()
+    metrics.set("models_resident_bytes", registry_stats["resident_bytes"])
+    metrics.set("models_loaded", len(registry_stats["loaded"]))
+    try:
+        memory = process_memory()
+    except OSError:
+        memory = None
+    if memory is not None:
+        metrics.set("process_memory_bytes", memory["private"], pid=memory["pid"], kind="private")
+        metrics.set("process_memory_bytes", memory["shared"], pid=memory["pid"], kind="shared")
+    for pool in effective_threads()["threadpools"]:
+        metrics.set(
+            "effective_threads", pool["num_threads"], role="serving", api=pool["internal_api"]
+        )
+    # one series per running job; finished jobs drop out
+    metrics.clear("effective_threads", role="training")
+    for job in training_jobs.jobs():
+        if job.resources is not None and not job.done:
+            for pool in job.resources["threadpools"]:
+                metrics.set(
+                    "effective_threads",
+                    pool["num_threads"],
+                    role="training",
+                    api=pool["internal_api"],
+                    job=job.job_id,
+                )
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/memory")
+async def memory():
+    # this worker only; `python serve.py --memory-report <pid>` covers all of them
+    try:
+        report = await run_in_threadpool(memory_report, "self", models.models_dir)
+    except OSError:
+        return JSONResponse(
+            status_code=501, content={"message": "Memory report needs Linux /proc"}
+        )
+    return {**report, "models": models.stats()}
+
+
+@app.get("/resources")
+async def resources():
+    # the core split and the threads serving and running training jobs use
+    return {
+        **governor.report(),
+        "pools": [
+            {"name": pool.name, "kind": pool.kind, "max_workers": pool.max_workers}
+            for pool in (interactive_pool, batch_pool, lightcurve_pool)
+        ],
+        "training_jobs": [
+            {"job_id": job.job_id, "status": job.status, "resources": job.resources}
+            for job in training_jobs.jobs()
+            if not job.done
+        ],
+    }
+
+
+@app.get("/ready")
+async def ready():
+    return JSONResponse(status_code=200 if warmup.ready else 503, content=warmup.stats())
+
+
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     return templates.TemplateResponse(
@@ -46,99 +317,571 @@ async def transit(request: Request):
 
 @app.post("/predict/manual", response_class=JSONResponse)
 async def predict_manual(request: Request, form: ModelInputForm):
+    count_model_request(form.model, "manual")
     try:
         assert len(form.to_list()) == Constants.LENGTH_OF_FEATURES_REQUIRED_TO_PREDICT
         assert None not in form.to_list()
-        return {"prediction": models[form.model].predict(form.to_list())}
+        prediction = await manual_batcher.predict(form.model, form.to_list())
+        return {"prediction": prediction}
+    except PoolSaturatedError:
+        raise
     except Exception as e:
         return {"error": str(e)}
 
 
+@app.get("/predict/manual/stats", response_class=JSONResponse)
+async def predict_manual_stats():
+    return manual_batcher.stats()
+
+
+@app.get("/predict/cache/stats", response_class=JSONResponse)
+async def predict_cache_stats():
+    return prediction_cache.stats()
+
+
+def invalid_input_response(report: ValidationReport) -> JSONResponse:
+    return JSONResponse(
+        status_code=422, content={"message": report.message(), "validation": report.to_dict()}
+    )
+
+
+def with_skipped_rows(labels, valid: np.ndarray) -> list:
+    """Labels for every input row, None where the row was skipped as invalid."""
+    full = np.full(len(valid), None, dtype=object)
+    full[valid] = labels
+    return full.tolist()
+
+
 @app.post("/predict/csv")
 async def predict_csv(
-    request: Request, model: str = Form(...), file: UploadFile = File(...)
+    request: Request,
+    model: str = Form(...),
+    file: UploadFile = File(...),
+    skip_invalid: bool = Form(False),
+    allow_missing: bool = Form(True),
 ):
-    count_confirmed, count_candidate, count_false_positive = 0, 0, 0
     if not file.filename.endswith(".csv"):
         return {"message": "Invalid file type. Please upload a CSV file."}
+    if model not in models:
+        return JSONResponse(status_code=404, content={"message": f"Model {model} not found"})
+    count_model_request(model, "csv")
 
-    contents = await file.read()
+    with metrics.timer("upload_read"):
+        contents = await file.read()
 
-    data_buffer = BytesIO(contents)
-    df = pd.read_csv(data_buffer, comment="#")
-    if len(df) > 100:
+    df = await batch_pool.run(read_csv_bytes, contents)
+    if len(df) > Constants.MAX_CSV_ROWS:
         return Response(
             status_code=413,  # 413 Payload Too Large
         )
-    columns = df.columns.tolist()
-    missing_features = list(set(Constants.FEATURES_REQUIRED_TO_PREDICT) - set(columns))
-    if len(missing_features) > 0:
+    # as stored, so an uploaded `prediction` column does not hide the model's
+    columns = results.column_names(df.columns)
+    with metrics.timer("validate"):
+        X, report = await batch_pool.run(validate_frame, df, allow_missing)
+    if report.missing_columns or (not report.ok and not skip_invalid):
+        return invalid_input_response(report)
+    if not report.ok:
+        # only the valid rows are predicted and kept in the result
+        df, X = df[report.valid], X[report.valid]
+
+    try:
+        predictions, counts = await batch_pool.run((await resolve_model(model)).predict_batch, X)
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"message": str(e)})
+    await file.close()
+
+    # the page only gets the column names; rows are fetched page by page
+    with metrics.timer("store_results"):
+        result_id = await batch_pool.run(
+            results.save, df, predictions, counts, model=model, filename=file.filename
+        )
+    data = {
+        "result_id": result_id,
+        "columns": columns,
+        "page_size": Constants.RESULT_PAGE_SIZE,
+        "count_confirmed": counts["Confirmed"],
+        "count_candidate": counts["Candidate"],
+        "count_false_positive": counts["False Positive"],
+        "total_count": len(df),
+        "skipped_count": report.n_invalid,
+    }
+    return await render_template(
+        request, "components/dataset_result_table.html", data
+    )
+
+
+def select_results(result_id, sort, order, prediction):
+    if order not in ("asc", "desc"):
+        raise ValueError("order must be asc or desc")
+    return results.select(
+        result_id, sort=sort, descending=order == "desc", predictions=prediction
+    )
+
+
+@app.get("/predict/results/{result_id}")
+async def get_results_page(
+    result_id: str,
+    offset: int = 0,
+    limit: int = Constants.RESULT_PAGE_SIZE,
+    sort: Optional[str] = None,
+    order: str = "asc",
+    prediction: Optional[List[str]] = Query(None),
+):
+    if offset < 0 or not 0 < limit <= Constants.RESULT_MAX_PAGE_SIZE:
         return JSONResponse(
             status_code=422,
-            content={
-                "message": f"Missing required features: {', '.join(missing_features)}"
-            },
+            content={"message": f"limit must be 1-{Constants.RESULT_MAX_PAGE_SIZE}"},
         )
-    data_buffer.close()
 
-    def process_row(row):
-        prediction = models[model].predict(
-            ModelInputForm(**row.to_dict(), model=model).to_list()
+    def page():
+        meta, rows = select_results(result_id, sort, order, prediction)
+        return {
+            "result_id": result_id,
+            "columns": meta["columns"],
+            "counts": meta["counts"],
+            "total": int(len(rows)),
+            "offset": offset,
+            "limit": limit,
+            "rows": results.rows(result_id, meta, rows[offset : offset + limit]),
+        }
+
+    try:
+        payload = await batch_pool.run(page)
+    except ResultNotFound:
+        return JSONResponse(status_code=404, content={"message": "Result not found or expired"})
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"message": str(e)})
+    return Response(orjson.dumps(payload), media_type="application/json")
+
+
+@app.get("/predict/results/{result_id}/csv")
+async def download_results(
+    result_id: str,
+    sort: Optional[str] = None,
+    order: str = "asc",
+    prediction: Optional[List[str]] = Query(None),
+):
+    try:
+        meta, rows = await batch_pool.run(select_results, result_id, sort, order, prediction)
+    except ResultNotFound:
+        return JSONResponse(status_code=404, content={"message": "Result not found or expired"})
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"message": str(e)})
+    filename = os.path.splitext(meta.get("filename") or "results")[0]
+    return StreamingResponse(
+        results.iter_csv(result_id, meta, rows, chunk_rows=Constants.CSV_STREAM_CHUNK_ROWS),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}_predictions.csv"'},
+    )
+
+
+@app.post("/predict/csv/stream")
+async def predict_csv_stream(
+    model: str = Form(...),
+    file: UploadFile = File(...),
+    output: str = Form("ndjson"),
+    skip_invalid: bool = Form(False),
+    allow_missing: bool = Form(True),
+):
+    if not file.filename.endswith(".csv"):
+        return JSONResponse(
+            status_code=422,
+            content={"message": "Invalid file type. Please upload a CSV file."},
+        )
+    if model not in models:
+        return JSONResponse(status_code=404, content={"message": "Model not found"})
+    if output not in ("ndjson", "sse"):
+        return JSONResponse(
+            status_code=422, content={"message": "output must be 'ndjson' or 'sse'"}
         )
-        if prediction == "Confirmed":
-            nonlocal count_confirmed
-            count_confirmed += 1
-        elif prediction == "Candidate":
-            nonlocal count_candidate
-            count_candidate += 1
-        else:
-            nonlocal count_false_positive
-            count_false_positive += 1
-        return prediction
-
-    df["prediction"] = df.apply(lambda row: process_row(row), axis=1)
 
+    classifier = await resolve_model(model)
+    count_model_request(model, "csv_stream")
+
+    # the upload is closed once the handler returns, so copy it in chunks into
+    # a spooled file owned by the stream (rolls over to disk past 1 MB)
+    upload = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    while chunk := await file.read(1024 * 1024):
+        upload.write(chunk)
     await file.close()
-    data = {
-        "data": df,
-        "columns": columns,
-        "num_rows": len(df),
-        "count_confirmed": count_confirmed,
-        "count_candidate": count_candidate,
-        "count_false_positive": count_false_positive,
+    upload.seek(0)
+
+    def encode(payload):
+        line = orjson.dumps(payload).decode()
+        return f"data: {line}\n\n" if output == "sse" else f"{line}\n"
+
+    def predict_chunks():
+        import pandas as pd
+
+        counts = {"Confirmed": 0, "Candidate": 0, "False Positive": 0}
+        offset = skipped = 0
+        try:
+            # read_csv pulls from the spooled upload lazily, so only one
+            # chunk of rows is held in memory at a time
+            reader = pd.read_csv(
+                upload, comment="#", chunksize=Constants.CSV_STREAM_CHUNK_ROWS
+            )
+            for chunk in reader:
+                X, report = validate_frame(chunk, allow_missing)
+                if report.missing_columns or (not report.ok and not skip_invalid):
+                    yield encode(
+                        {
+                            "error": report.message(),
+                            "offset": offset,
+                            "validation": report.to_dict(row_offset=offset),
+                        }
+                    )
+                    return
+                predictions, chunk_counts = classifier.predict_batch(X[report.valid])
+                for label, count in chunk_counts.items():
+                    counts[label] += count
+                payload = {
+                    "offset": offset,
+                    # skipped rows are null so positions still match the file
+                    "predictions": with_skipped_rows(predictions, report.valid),
+                    "counts": counts,
+                }
+                if not report.ok:
+                    payload["validation"] = report.to_dict(row_offset=offset)
+                skipped += report.n_invalid
+                yield encode(payload)
+                offset += len(chunk)
+        except ValueError as e:
+            yield encode({"error": str(e), "offset": offset})
+            return
+        finally:
+            upload.close()
+        yield encode(
+            {"done": True, "total_count": offset, "skipped_count": skipped, "counts": counts}
+        )
+
+    media_type = "text/event-stream" if output == "sse" else "application/x-ndjson"
+    return StreamingResponse(predict_chunks(), media_type=media_type)
+
+
+@app.post("/predict/compare", response_class=JSONResponse)
+async def predict_compare(
+    file: UploadFile = File(...),
+    models_names: List[str] = Form(None),
+    label_column: str = Form("koi_disposition"),
+):
+    if not file.filename.endswith(".csv"):
+        return JSONResponse(
+            status_code=422,
+            content={"message": "Invalid file type. Please upload a CSV file."},
+        )
+    selected = models_names or get_models_names()
+    if not selected:
+        return JSONResponse(status_code=404, content={"message": "No models available"})
+    unknown = [name for name in selected if name not in models]
+    if unknown:
+        return JSONResponse(
+            status_code=404,
+            content={"message": f"Models not found: {', '.join(unknown)}"},
+        )
+
+    for name in selected:
+        count_model_request(name, "compare")
+
+    # parse and validate the upload once, then share the matrix between models
+    contents = await file.read()
+    await file.close()
+    df = await batch_pool.run(read_csv_bytes, contents)
+    if len(df) > Constants.MAX_CSV_ROWS:
+        return Response(status_code=413)
+    X, report = await batch_pool.run(validate_frame, df)
+    if not report.ok:
+        return invalid_input_response(report)
+
+    classifiers = [await resolve_model(name) for name in selected]
+    try:
+        results = await asyncio.gather(
+            *(batch_pool.run(classifier.predict_batch, X) for classifier in classifiers)
+        )
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"message": str(e)})
+
+    predictions = dict(zip(selected, (labels for labels, _ in results)))
+    stacked = np.stack(list(predictions.values()))
+    agree = (stacked == stacked[:1]).all(axis=0)
+    actual = df[label_column].to_numpy() if label_column in df.columns else None
+
+    response = {
+        "models": {},
         "total_count": len(df),
+        "agreement_count": int(agree.sum()),
+        "disagreements": [
+            {"row": int(row), **{name: labels[row] for name, labels in predictions.items()}}
+            for row in np.flatnonzero(~agree)
+        ],
     }
-    return templates.TemplateResponse(
-        request=request,
-        name="components/dataset_result_table.html",
-        context=data,
+    for (name, labels), (_, counts) in zip(predictions.items(), results):
+        response["models"][name] = {"predictions": labels.tolist(), "counts": counts}
+        if actual is not None:
+            try:
+                response["models"][name]["confusion_matrix"] = display_confusion_matrix(
+                    actual, labels
+                )
+            except ValueError as e:
+                return JSONResponse(status_code=422, content={"message": str(e)})
+    return response
+
+
+def batch_response(
+    model: str,
+    predictions,
+    counts,
+    probabilities=None,
+    classes=None,
+    report: ValidationReport | None = None,
+) -> Response:
+    payload = {"model": model, "n_rows": len(predictions), "counts": counts}
+    if report is not None and not report.ok:
+        # skipped rows get null predictions (and probabilities) in place
+        payload["n_rows"] = report.n_rows
+        payload["predictions"] = with_skipped_rows(predictions, report.valid)
+        payload["validation"] = report.to_dict()
+        if probabilities is not None:
+            full = np.full((report.n_rows, probabilities.shape[1]), np.nan)
+            full[report.valid] = probabilities
+            probabilities = full
+    else:
+        payload["predictions"] = predictions.tolist()
+    if probabilities is not None:
+        payload["classes"] = classes
+        payload["probabilities"] = probabilities
+    return Response(
+        orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY), media_type="application/json"
     )
 
 
-@app.post("api/predict/csv", response_class=JSONResponse)
-async def predict_csv_api(request: Request, model: str, file: UploadFile = File(...)):
+@app.post("/api/predict")
+async def predict_api(
+    request: Request,
+    model: str,
+    probabilities: bool = False,
+    dtype: str = "float64",
+    skip_invalid: bool = False,
+    allow_missing: bool = True,
+):
+    """Batch prediction for pipelines.
+
+    The body is columnar JSON (`{"koi_period": [...], ...}`), NDJSON (one
+    object or feature array per line), Arrow IPC, a `.npy` matrix or a raw
+    little-endian float buffer (`application/octet-stream`, see `dtype`),
+    chosen by Content-Type. Missing values (null/NaN) are passed to the
+    model unless `allow_missing` is false, which reports them like other
+    invalid cells.
+    """
+    if model not in models:
+        return JSONResponse(status_code=404, content={"message": f"Model {model} not found"})
+    count_model_request(model, "api")
+    with metrics.timer("upload_read"):
+        body = await read_body(request, Constants.MAX_BODY_BYTES)
+
+    content_type = request.headers.get("content-type", "application/json")
+    try:
+        with metrics.timer("decode_body"):
+            X, text_cells = await batch_pool.run(decode_features, body, content_type, dtype)
+    except UnsupportedMediaType as e:
+        return JSONResponse(status_code=415, content={"message": str(e)})
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"message": str(e)})
+    if len(X) > Constants.MAX_CSV_ROWS:
+        return JSONResponse(
+            status_code=413,
+            content={"message": f"At most {Constants.MAX_CSV_ROWS} rows per request"},
+        )
+    report = validate_matrix(X, allow_missing=allow_missing, text_cells=text_cells)
+    return await predict_validated(model, X, report, probabilities, skip_invalid)
+
+
+async def predict_validated(
+    model: str, X, report: ValidationReport, probabilities: bool, skip_invalid: bool
+) -> Response:
+    if report.missing_columns or (not report.ok and not skip_invalid):
+        return invalid_input_response(report)
+    if not report.ok:
+        X = X[report.valid]
+    try:
+        if probabilities:
+            classifier = await resolve_model(model, models)
+            labels, counts, proba = await batch_pool.run(classifier.predict_proba_batch, X)
+            return batch_response(model, labels, counts, proba, classifier.classes, report)
+        labels, counts = await batch_pool.run((await resolve_model(model)).predict_batch, X)
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"message": str(e)})
+    return batch_response(model, labels, counts, report=report)
+
+
+@app.post("/api/predict/csv")
+async def predict_csv_api(
+    request: Request,
+    model: str,
+    probabilities: bool = False,
+    skip_invalid: bool = False,
+    allow_missing: bool = True,
+    file: UploadFile = File(...),
+):
     if not file.filename.endswith(".csv"):
-        return {"message": "Invalid file type. Please upload a CSV file."}
+        return JSONResponse(
+            status_code=422, content={"message": "Invalid file type. Please upload a CSV file."}
+        )
+    if model not in models:
+        return JSONResponse(status_code=404, content={"message": f"Model {model} not found"})
 
+    count_model_request(model, "api_csv")
+    # the multipart parser has spooled the upload to disk; check it before reading it in
+    if file.size is not None and file.size > Constants.MAX_BODY_BYTES:
+        raise RequestTooLarge(Constants.MAX_BODY_BYTES)
     contents = await file.read()
+    await file.close()
 
-    data_buffer = BytesIO(contents)
-
-    df = pd.read_csv(data_buffer, comment="#")
-    if len(df) > 100:
-        return Response(
+    df = await batch_pool.run(read_csv_bytes, contents)
+    if len(df) > Constants.MAX_CSV_ROWS:
+        return JSONResponse(
             {
-                "message": "File too large. Please upload a CSV file with less than 100 rows."
+                "message": f"File too large. Please upload a CSV file with less than {Constants.MAX_CSV_ROWS} rows."
             },
             status_code=413,
         )
+    X, report = await batch_pool.run(validate_frame, df, allow_missing)
+    return await predict_validated(model, X, report, probabilities, skip_invalid)
+
+
+@app.post("/api/predict/lightcurve")
+async def predict_light_curves(
+    request: Request,
+    model: str,
+    koi_srad: float = Query(1.0, gt=0),
+    koi_smass: Optional[float] = Query(None, gt=0),
+    koi_steff: float = Query(StellarParams.teff, gt=0),
+    min_period: Optional[float] = Query(None, gt=0),
+    max_period: Optional[float] = Query(None, gt=0),
+):
+    """Find the strongest transit in each light curve and classify it.
 
-    data_buffer.close()
+    The body is a CSV (time and flux columns, optional flux_err and a star
+    column for many stars), an (n, 2|3) `.npy` array or an `.npz` archive,
+    chosen by Content-Type. The stellar parameters apply to every star
+    unless the CSV has koi_srad / koi_smass / koi_steff columns.
+    """
+    if model not in models:
+        return JSONResponse(status_code=404, content={"message": f"Model {model} not found"})
+    count_model_request(model, "lightcurve")
+    with metrics.timer("upload_read"):
+        body = await read_body(request, Constants.LIGHTCURVE_MAX_BODY_BYTES)
 
-    df["prediction"] = df.apply(lambda row: models[model].predict(row), axis=1)
+    content_type = request.headers.get("content-type", CSV)
+    stellar = StellarParams(radius=koi_srad, mass=koi_smass, teff=koi_steff)
+    search = light_curve_search.with_periods(min_period, max_period)
+    try:
+        with metrics.timer("decode_body"):
+            curves = await batch_pool.run(read_light_curves, body, content_type, stellar)
+        n_points = sum(len(curve) for curve in curves)
+        with metrics.timer("transit_search"):
+            transits = await search.search(
+                curves, lightcurve_pool.run, lightcurve_pool.max_workers
+            )
+    except TooManyPoints as e:
+        return JSONResponse(status_code=413, content={"message": str(e)})
+    except UnsupportedMediaType as e:
+        return JSONResponse(status_code=415, content={"message": str(e)})
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"message": str(e)})
 
-    await file.close()
-    return df["prediction"].tolist()
+    # stars without a detection have nothing to classify; their prediction is null
+    detected = np.array([transit.detected for transit in transits], dtype=bool)
+    X = np.array(
+        [transit.feature_vector() for transit in transits if transit.detected], dtype=np.float64
+    ).reshape(-1, Constants.LENGTH_OF_FEATURES_REQUIRED_TO_PREDICT)
+    report = validate_matrix(X)
+    if not report.ok:
+        return invalid_input_response(report)
+    labels, counts = await batch_pool.run((await resolve_model(model)).predict_batch, X)
+    payload = {
+        "model": model,
+        "n_stars": len(transits),
+        "n_detected": int(detected.sum()),
+        "n_points": n_points,
+        "counts": counts,
+        "stars": [
+            {**transit.to_dict(), "prediction": label}
+            for transit, label in zip(transits, with_skipped_rows(labels, detected))
+        ],
+    }
+    return Response(
+        orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY), media_type="application/json"
+    )
+
+
+@app.post("/api/lightcurves", response_class=JSONResponse)
+async def upload_light_curves(request: Request):
+    """Store light curves for plotting; one curve id per star.
+
+    Takes the same bodies as /api/predict/lightcurve. Views of a stored
+    curve are served by GET /api/lightcurves/{curve_id}.
+    """
+    body = await read_body(request, Constants.LIGHTCURVE_MAX_BODY_BYTES)
+    content_type = request.headers.get("content-type", CSV)
+    try:
+        curves = await batch_pool.run(read_light_curves, body, content_type)
+    except TooManyPoints as e:
+        return JSONResponse(status_code=413, content={"message": str(e)})
+    except UnsupportedMediaType as e:
+        return JSONResponse(status_code=415, content={"message": str(e)})
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"message": str(e)})
+    stored = []
+    for curve in curves:
+        if len(curve) == 0:
+            return JSONResponse(
+                status_code=422, content={"message": f"Star {curve.star} has no finite points"}
+            )
+        curve_id = await batch_pool.run(curve_store.add, curve)
+        stored.append(
+            {
+                "curve_id": curve_id,
+                "star": curve.star,
+                "n_points": len(curve),
+                "start": float(curve.time[0]),
+                "end": float(curve.time[-1]),
+            }
+        )
+    return {"curves": stored}
+
+
+@app.get("/api/lightcurves/{curve_id}")
+async def get_light_curve_view(
+    curve_id: str,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    width: int = Query(1000, ge=16, le=Constants.PLOT_MAX_WIDTH),
+    method: str = "lttb",
+):
+    """Plot-ready points of a stored curve between `start` and `end`.
+
+    About `width` points (twice that for `method=minmax`), taken from the
+    coarsest cached level that still resolves the range; "demo" is a
+    Kepler-length simulated curve for the learn page.
+    """
+    try:
+        view = await batch_pool.run(curve_store.view, curve_id, start, end, width, method)
+    except CurveNotFound:
+        return JSONResponse(status_code=404, content={"message": f"Curve {curve_id} not found"})
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"message": str(e)})
+    # curve ids name immutable content, so every view can be cached for good
+    cache_control = (
+        "public, max-age=3600"
+        if curve_id == CurveStore.DEMO
+        else "public, max-age=31536000, immutable"
+    )
+    return Response(
+        orjson.dumps(view, option=orjson.OPT_SERIALIZE_NUMPY),
+        media_type="application/json",
+        headers={"Cache-Control": cache_control},
+    )
 
 
 @app.get("/model-info", response_class=HTMLResponse)
@@ -151,32 +894,88 @@ async def get_model_info(model_name: str):
     if model_name not in models:
         return JSONResponse(status_code=404, content={"message": "Model not found"})
 
-    model = models[model_name]
+    model = await resolve_model(model_name, models)
     return {
         "model_name": model_name,
+        "version": model.version,
         "features": model.features,
-        "target": model.target,
-        "description": model.description,
+        "manifest": models.store.manifest(model.name, model.version),
+    }
+
+
+@app.get("/models/{model_name}/versions", response_class=JSONResponse)
+async def list_model_versions(model_name: str):
+    if model_name not in models:
+        return JSONResponse(status_code=404, content={"message": "Model not found"})
+    store = models.store
+    return {
+        "model_name": model_name,
+        "current": store.current(model_name),
+        "versions": [
+            store.manifest(model_name, version) for version in store.versions(model_name)
+        ],
     }
 
 
-@app.get("/train", response_class=JSONResponse)
-async def train_model(request: Request):
-    def train():
-        # 1. preprocessing
-        yield "Preprocessing data"
-        time.sleep(2)  # Simulate time-consuming task
-        # 2. training
-        yield "Training model"
-        time.sleep(3)  # Simulate time-consuming task
-        # 3. evaluation
-        yield "Evaluating model"
-        time.sleep(4)  # Simulate time-consuming task
-        yield "Model training complete"
+@app.post("/models/{model_name}/promote", response_class=JSONResponse)
+async def promote_model_version(model_name: str, version: str = Form(...)):
+    # only this model is reloaded here; other workers pick the promotion up
+    # on their next refresh
+    try:
+        await run_in_threadpool(models.promote, model_name, version)
+    except KeyError:
+        return JSONResponse(
+            status_code=404, content={"message": f"Model {model_name} has no version {version}"}
+        )
+    return {"model_name": model_name, "current": version}
+
+
+@app.get("/train")
+async def train_model(request: Request, job_id: str):
+    job = training_jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"message": "Job not found"})
+
+    async def train():
+        nonlocal job
+        sent = 0
+        while True:
+            # a job run by another worker is re-read from disk
+            job = training_jobs.get(job_id) or job
+            events = job.events
+            for event in events[sent:]:
+                yield f"event: {event['event']}\ndata: {orjson.dumps(event).decode()}\n\n"
+            sent = len(events)
+            if job.done and sent == len(job.events):
+                break
+            if await request.is_disconnected():
+                break
+            await asyncio.sleep(0.25)
 
     return StreamingResponse(train(), media_type="text/event-stream")
 
 
+@app.get("/custom-model/jobs", response_class=JSONResponse)
+async def list_training_jobs():
+    return {"jobs": [job.to_dict() for job in training_jobs.jobs()]}
+
+
+@app.get("/custom-model/jobs/{job_id}", response_class=JSONResponse)
+async def get_training_job(job_id: str):
+    job = training_jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"message": "Job not found"})
+    return job.to_dict()
+
+
+@app.post("/custom-model/jobs/{job_id}/cancel", response_class=JSONResponse)
+async def cancel_training_job(job_id: str):
+    job = training_jobs.cancel(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"message": "Job not found"})
+    return job.to_dict()
+
+
 @app.get("/tales-from-the-stars")
 async def tales_from_the_stars(request: Request):
     return templates.TemplateResponse(
@@ -189,23 +988,25 @@ async def tales_from_the_stars(request: Request):
 async def test_model(request: Request, model: str, file: UploadFile = File(...)):
     if not file.filename.endswith(".csv"):
         return {"message": "Invalid file type. Please upload a CSV file."}
+    if model not in models:
+        return JSONResponse(status_code=404, content={"message": f"Model {model} not found"})
 
+    count_model_request(model, "test_model")
     contents = await file.read()
 
-    data_buffer = BytesIO(contents)
-
-    df = pd.read_csv(data_buffer, comment="#")
-    if len(df) > 100:
-        return Response(
+    df = await batch_pool.run(read_csv_bytes, contents)
+    if len(df) > Constants.MAX_CSV_ROWS:
+        return JSONResponse(
             {
-                "message": "File too large. Please upload a CSV file with less than 100 rows."
+                "message": f"File too large. Please upload a CSV file with less than {Constants.MAX_CSV_ROWS} rows."
             },
             status_code=413,
         )
 
-    data_buffer.close()
-
-    df["prediction"] = df.apply(lambda row: models[model].predict(row), axis=1)
+    X, report = await batch_pool.run(validate_frame, df)
+    if not report.ok:
+        return invalid_input_response(report)
+    df["prediction"], _ = await batch_pool.run((await resolve_model(model)).predict_batch, X)
 
     await file.close()
     # check the predictions
@@ -221,8 +1022,42 @@ async def test_model(request: Request, model: str, file: UploadFile = File(...))
 
 @app.post("/chat")
 async def chat(msg: ChatMessage):
-    print(msg.message)
-    return {"reply": chat_with_gemini_as_astronomy_expert(msg.message)}
+    try:
+        reply = await chat_service.reply(msg.message, msg.standalone_question)
+    except ChatTimeoutError as e:
+        return JSONResponse(status_code=504, content={"message": str(e)})
+    return {"reply": reply}
+
+
+@app.post("/chat/stream")
+async def chat_stream(msg: ChatMessage):
+    if chat_service.saturated:
+        raise PoolSaturatedError("chat is saturated, try again later")
+
+    def event(name, payload):
+        return f"event: {name}\ndata: {orjson.dumps(payload).decode()}\n\n"
+
+    async def reply():
+        try:
+            async for text in chat_service.stream(msg.message, msg.standalone_question):
+                yield event("token", {"text": text})
+        except (ChatTimeoutError, PoolSaturatedError) as e:
+            yield event("error", {"message": str(e)})
+            return
+        except Exception as e:
+            # ChatService.stream has counted it as an error; end the stream
+            # with an event rather than cutting it off
+            print(f"Chat reply failed: {e!r}")
+            yield event("error", {"message": "The chat reply failed, try again later"})
+            return
+        yield event("done", {})
+
+    return StreamingResponse(reply(), media_type="text/event-stream")
+
+
+@app.get("/chat/stats")
+async def chat_stats():
+    return chat_service.stats()
 
 
 @app.get("/model/{model_name}/confusion-matrix", response_class=JSONResponse)
@@ -230,7 +1065,7 @@ async def get_confusion_matrix(model_name: str):
     if model_name not in models:
         return JSONResponse(status_code=404, content={"message": "Model not found"})
 
-    model = models[model_name]
+    model = await resolve_model(model_name, models)
     cm = getattr(model, "confusion_matrix", None)
     if cm is None:
         return {
@@ -253,35 +1088,82 @@ async def get_confusion_matrix(model_name: str):
 async def train_custom_model(
     request: Request,
     model_name: str = Form(...),
-    files: List[UploadFile] = File(...),
+    files: List[UploadFile] = File(None),
+    dataset_ids: List[str] = Form(None),
+    search: str = Form("full"),
+    time_budget: Optional[float] = Form(None),
+    promote: bool = Form(True),
 ):
-    # Save uploaded CSVs into dataset/content
-    dataset_dir = os.path.join("dataset", "content")
-    os.makedirs(dataset_dir, exist_ok=True)
-
-    saved_paths = []
-    for f in files:
-        if not f.filename.endswith(".csv"):
-            return JSONResponse(status_code=422, content={"message": "Only CSV files are allowed."})
-        contents = await f.read()
-        save_path = os.path.join(dataset_dir, f.filename)
-        with open(save_path, "wb") as out:
-            out.write(contents)
-        saved_paths.append(save_path)
-        await f.close()
+    try:
+        ModelStore.check_name(model_name)
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"message": str(e)})
+    if search not in SEARCH_MODES:
+        return JSONResponse(
+            status_code=422,
+            content={"message": f"search must be one of {', '.join(SEARCH_MODES)}"},
+        )
+    if time_budget is not None and time_budget < 0:
+        return JSONResponse(
+            status_code=422, content={"message": "time_budget must not be negative"}
+        )
 
+    # uploads are ingested into the dataset store; datasets uploaded earlier
+    # can be reused by id without sending the CSV again
+    dataset_ids = list(dataset_ids or [])
+    for dataset_id in dataset_ids:
+        if not dataset_id.isalnum() or dataset_id not in dataset_store:
+            return JSONResponse(
+                status_code=404, content={"message": f"Dataset {dataset_id} not found"}
+            )
+    for f in files or []:
+        try:
+            dataset_ids.append(await ingest_upload(f))
+        except ValueError as e:
+            return JSONResponse(status_code=422, content={"message": str(e)})
+    if not dataset_ids:
+        return JSONResponse(
+            status_code=422, content={"message": "Upload at least one CSV or pass dataset_ids."}
+        )
+
+    job = training_jobs.submit(
+        model_name,
+        [],
+        output_dir="models",
+        search=search,
+        time_budget=time_budget,
+        dataset_ids=list(dict.fromkeys(dataset_ids)),
+        promote=promote,
+    )
+    return JSONResponse(
+        status_code=202,
+        content={
+            "status": job.status,
+            "model": model_name,
+            "job_id": job.job_id,
+            "dataset_ids": job.dataset_ids,
+            "promote": job.promote,
+        },
+    )
+
+
+async def ingest_upload(file: UploadFile) -> str:
+    if not file.filename.endswith(".csv"):
+        raise ValueError("Only CSV files are allowed.")
+    contents = await file.read()
+    await file.close()
+    return await batch_pool.run(dataset_store.ingest, contents, file.filename)
+
+
+@app.post("/datasets", response_class=JSONResponse)
+async def upload_dataset(file: UploadFile = File(...)):
     try:
-        generator = ExoplanetRandomForestModelGenerator(csv_paths=saved_paths, target_col="koi_disposition")
-        generator.load_and_validate()
-        X_train_res, X_test, y_train_res, y_test = generator.preprocess()
-        generator.train(X_train_res, y_train_res)
-        generator.evaluate(X_test, y_test)
-        generator.save(output_name=model_name, output_dir="models")
-    except Exception as e:
-        return JSONResponse(status_code=400, content={"message": str(e)})
+        dataset_id = await ingest_upload(file)
+    except ValueError as e:
+        return JSONResponse(status_code=422, content={"message": str(e)})
+    return JSONResponse(status_code=201, content=dataset_store.meta(dataset_id))
 
-    # refresh models cache
-    global models
-    models = get_models()
 
-    return {"status": "ok", "model": model_name}
+@app.get("/datasets", response_class=JSONResponse)
+async def list_datasets():
+    return JSONResponse(content={"datasets": dataset_store.entries()})
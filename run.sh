@@ -1,2 +1,3 @@
 #!/bin/bash
+# development server; use `python serve.py --workers N` in production
 uvicorn main:app --host 0.0.0.0 --port 8000 --reload --reload-dir templates --reload-dir static
\ No newline at end of file
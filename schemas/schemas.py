@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic import BaseModel, Field
 
 
@@ -53,3 +54,16 @@ class ModelInputForm(BaseModel):
 
 class ChatMessage(BaseModel):
     message: str
+    # the latest question on its own; the chat widget sends it with the first
+    # question of a conversation, whose answer does not depend on context.
+    # When set, the reply is generated from it alone.
+    question: Optional[str] = None
+
+    @property
+    def standalone_question(self) -> Optional[str]:
+        """Question the reply is generated from on its own, so its answer may
+        be served from and stored in the answer cache."""
+        if self.question is not None:
+            return self.question
+        # a single-line message carries no earlier conversation
+        return self.message if "\n" not in self.message.strip() else None
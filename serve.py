@@ -0,0 +1,78 @@
+"""Production launcher: several uvicorn workers sharing one copy of each model.
+
+Before the workers start, every current model gets its memory-mappable
+serving copy (see `ModelStore.ensure_shared`), and EXOVISION_SHARED_MODELS=1
+makes the workers map it instead of unpickling a private forest each. The
+uvicorn supervisor restarts workers that die and handles SIGTERM/SIGHUP.
+Training jobs are kept in dataset/jobs, so any worker can report or cancel
+a job another one runs.
+Use run.sh for development with --reload.
+
+    python serve.py --workers 4
+    python serve.py --memory-report <supervisor pid>
+"""
+
+from utils.memory import child_pids, memory_report
+import multiprocessing as mp
+import argparse
+import os
+
+
+def prepare_shared_models(models_dir="models"):
+    from utils.model_store import ModelStore
+
+    store = ModelStore(models_dir)
+    for name in store.names():
+        version = store.current(name)
+        if store.ensure_shared(name, version) is None:
+            print(f"{name}@{version} has no flattened forest, each worker loads its own copy")
+
+
+def print_memory_report(pid: int, models_dir="models"):
+    mib = 1024 * 1024
+    rows = [("supervisor", memory_report(pid, models_dir))]
+    for child in child_pids(pid):
+        with open(f"/proc/{child}/cmdline", "rb") as f:
+            helper = b"resource_tracker" in f.read()
+        rows.append(("helper" if helper else "worker", memory_report(child, models_dir)))
+    print(
+        f"{'role':<11}{'pid':>8}{'rss MiB':>10}{'pss MiB':>10}"
+        f"{'private MiB':>13}{'shared MiB':>12}{'models MiB':>12}"
+    )
+    for role, report in rows:
+        print(
+            f"{role:<11}{report['pid']:>8}{report['rss'] / mib:>10.1f}{report['pss'] / mib:>10.1f}"
+            f"{report['private'] / mib:>13.1f}{report['shared'] / mib:>12.1f}"
+            f"{report['models_mapped']['rss'] / mib:>12.1f}"
+        )
+    # pss splits shared pages between the processes mapping them
+    print(f"total pss: {sum(report['pss'] for _, report in rows) / mib:.1f} MiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("EXOVISION_WORKERS", os.cpu_count() or 1))
+    )
+    parser.add_argument(
+        "--memory-report",
+        type=int,
+        metavar="PID",
+        help="print private and shared memory of a running supervisor and its workers",
+    )
+    args = parser.parse_args()
+
+    if args.memory_report is not None:
+        print_memory_report(args.memory_report)
+    else:
+        import uvicorn
+
+        os.environ.setdefault("EXOVISION_SHARED_MODELS", "1")
+        if os.environ["EXOVISION_SHARED_MODELS"] == "1":
+            # in a child process, so the supervisor never holds an unpickled model
+            prepare = mp.get_context("spawn").Process(target=prepare_shared_models)
+            prepare.start()
+            prepare.join()
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
@@ -143,6 +143,8 @@ function processUploadedData() {
     formData.append('file', file);
     const model_name = document.getElementById('model-name').value;
     formData.append('model', model_name);
+    const skipInvalid = document.getElementById('skip-invalid-rows');
+    formData.append('skip_invalid', skipInvalid && skipInvalid.checked ? 'true' : 'false');
     console.log('form data:', formData);
 
     fetch('/predict/csv', {
@@ -255,7 +257,33 @@ function trainModel() {
             }
             return res.json();
         })
-        .then((data) => {
+        .then((data) => new Promise((resolve, reject) => {
+            // follow the background training job until it finishes
+            const source = new EventSource(`/train?job_id=${encodeURIComponent(data.job_id)}`);
+            source.addEventListener('stage_started', (e) => {
+                trainButton.textContent = `Training: ${JSON.parse(e.data).stage}...`;
+            });
+            source.addEventListener('cv_fold', (e) => {
+                const fold = JSON.parse(e.data);
+                trainButton.textContent = `Training: fold ${fold.completed}/${fold.total}`;
+            });
+            source.addEventListener('succeeded', () => {
+                source.close();
+                resolve();
+            });
+            ['failed', 'cancelled'].forEach((name) => source.addEventListener(name, (e) => {
+                source.close();
+                reject(new Error(JSON.parse(e.data).error || `Training ${name}`));
+            }));
+            // the browser retries dropped streams by itself; once it gives up
+            // (e.g. the job is unknown) there is nothing left to wait for
+            source.addEventListener('error', () => {
+                if (source.readyState === EventSource.CLOSED) {
+                    reject(new Error('Lost track of the training job, please try again'));
+                }
+            });
+        }))
+        .then(() => {
             trainButton.textContent = 'Model Trained! Refreshing...';
             // refresh the page to fetch updated models list
             setTimeout(() => {
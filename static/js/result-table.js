@@ -1,12 +1,99 @@
 let currentSort = { column: -1, direction: 'asc' };
 let currentPage = 1;
 let entriesPerPage = 10;
+let predictionFilter = '';
+let totalRows = 0;
 
-function sortTable(columnIndex) {
-    const table = document.getElementById('exoplanet-data-table');
-    const tbody = table.querySelector('tbody');
-    const rows = Array.from(tbody.querySelectorAll('tr'));
+const PREDICTION_BADGES = {
+    'Confirmed': { className: 'confirmed', text: 'Confirmed', style: 'background: rgba(76, 175, 80, 0.3); color: #4caf50; border: 1px solid rgba(76, 175, 80, 0.5);' },
+    'Candidate': { className: 'candidate', text: 'Candidate', style: 'background: rgba(255, 193, 7, 0.3); color: #ffc107; border: 1px solid rgba(255, 193, 7, 0.5);' },
+    'False Positive': { className: 'false-positive', text: 'False', style: 'background: rgba(244, 67, 54, 0.3); color: #f44336; border: 1px solid rgba(244, 67, 54, 0.5);' },
+};
+
+function resultSection() {
+    return document.getElementById('data-table-section');
+}
 
+function columnNames() {
+    return Array.from(document.querySelectorAll('#exoplanet-data-table thead th'))
+        .map(th => th.dataset.column);
+}
+
+// query string shared by page requests and the CSV export
+function resultQuery() {
+    const params = new URLSearchParams();
+    if (currentSort.column >= 0) {
+        params.set('sort', columnNames()[currentSort.column]);
+        params.set('order', currentSort.direction);
+    }
+    if (predictionFilter) {
+        params.append('prediction', predictionFilter);
+    }
+    return params;
+}
+
+function renderRows(rows) {
+    const tbody = document.getElementById('table-body');
+    const fragment = document.createDocumentFragment();
+    rows.forEach(row => {
+        const tr = document.createElement('tr');
+        tr.style.cssText = 'border-bottom: 1px solid rgba(255, 255, 255, 0.1); transition: background 0.3s ease;';
+        tr.onmouseover = () => { tr.style.background = 'rgba(100, 181, 246, 0.1)'; };
+        tr.onmouseout = () => { tr.style.background = 'transparent'; };
+
+        row.forEach((value, index) => {
+            const td = document.createElement('td');
+            if (index === 0) {
+                const badge = PREDICTION_BADGES[value] || PREDICTION_BADGES['False Positive'];
+                const span = document.createElement('span');
+                span.className = `prediction-badge ${badge.className}`;
+                span.style.cssText = badge.style + ' padding: 4px 12px; border-radius: 15px; font-size: 0.8rem; font-weight: 600;';
+                span.textContent = badge.text;
+                td.style.cssText = 'padding: 12px; text-align: center;';
+                td.appendChild(span);
+            } else {
+                td.style.cssText = 'padding: 12px; color: #e0e0e0; font-size: 0.9rem;';
+                td.textContent = value === null ? '' : value;
+            }
+            tr.appendChild(td);
+        });
+        fragment.appendChild(tr);
+    });
+    tbody.replaceChildren(fragment);
+}
+
+function updatePager() {
+    const pages = Math.max(1, Math.ceil(totalRows / entriesPerPage));
+    const info = document.getElementById('page-info');
+    if (info) info.textContent = `Page ${currentPage} of ${pages} (${totalRows} rows)`;
+    const prev = document.getElementById('prev-page-btn');
+    const next = document.getElementById('next-page-btn');
+    if (prev) prev.disabled = currentPage <= 1;
+    if (next) next.disabled = currentPage >= pages;
+}
+
+async function loadPage() {
+    const section = resultSection();
+    if (!section) return;
+    const params = resultQuery();
+    params.set('offset', (currentPage - 1) * entriesPerPage);
+    params.set('limit', entriesPerPage);
+
+    const response = await fetch(`/predict/results/${section.dataset.resultId}?${params}`);
+    if (!response.ok) {
+        const info = document.getElementById('page-info');
+        if (info) info.textContent = response.status === 404
+            ? 'These results have expired, please upload the file again.'
+            : 'Could not load results.';
+        return;
+    }
+    const data = await response.json();
+    totalRows = data.total;
+    renderRows(data.rows);
+    updatePager();
+}
+
+function sortTable(columnIndex) {
     // Determine sort direction
     if (currentSort.column === columnIndex) {
         currentSort.direction = currentSort.direction === 'asc' ? 'desc' : 'asc';
@@ -14,32 +101,9 @@ function sortTable(columnIndex) {
         currentSort.direction = 'asc';
         currentSort.column = columnIndex;
     }
-
-    // Sort rows
-    rows.sort((a, b) => {
-        const aValue = a.cells[columnIndex].textContent.trim();
-        const bValue = b.cells[columnIndex].textContent.trim();
-
-        // Handle numeric values
-        const aNum = parseFloat(aValue);
-        const bNum = parseFloat(bValue);
-
-        if (!isNaN(aNum) && !isNaN(bNum)) {
-            return currentSort.direction === 'asc' ? aNum - bNum : bNum - aNum;
-        }
-
-        // Handle text values
-        return currentSort.direction === 'asc'
-            ? aValue.localeCompare(bValue)
-            : bValue.localeCompare(aValue);
-    });
-
-    // Clear and repopulate tbody
-    tbody.innerHTML = '';
-    rows.forEach(row => tbody.appendChild(row));
-
-    // Update sort arrows
+    currentPage = 1;
     updateSortArrows(columnIndex);
+    loadPage();
 }
 
 function updateSortArrows(activeColumn) {
@@ -56,80 +120,62 @@ function updateSortArrows(activeColumn) {
 }
 
 function changePage(direction) {
-    // Pagination logic would go here
-    console.log('Change page:', direction);
+    const pages = Math.max(1, Math.ceil(totalRows / entriesPerPage));
+    const page = Math.min(pages, Math.max(1, currentPage + direction));
+    if (page !== currentPage) {
+        currentPage = page;
+        loadPage();
+    }
 }
 
 function exportResults() {
-    const table = document.getElementById('exoplanet-data-table');
-    if (!table) {
+    // the server streams every row of the run, in the current sort and filter
+    const section = resultSection();
+    if (!section) {
         console.warn('No results table found to export');
         return;
     }
-
-    const rows = [];
-
-    // Extract header
-    const headerCells = Array.from(table.querySelectorAll('thead th'));
-    const header = headerCells.map(th => th.childNodes[0]?.textContent?.trim() || th.textContent.trim());
-    rows.push(header);
-
-    // Extract body
-    const bodyRows = Array.from(table.querySelectorAll('tbody tr'));
-    bodyRows.forEach(tr => {
-        const cells = Array.from(tr.children).map(td => td.textContent.trim());
-        rows.push(cells);
-    });
-
-    // CSV escaping
-    const escapeCsv = (value) => {
-        if (value == null) return '';
-        const str = String(value).replace(/\r?\n|\r/g, ' ');
-        if (/[",\n,]/.test(str)) {
-            return '"' + str.replace(/"/g, '""') + '"';
-        }
-        return str;
-    };
-
-    const csv = rows.map(r => r.map(escapeCsv).join(',')).join('\n');
-    const blob = new Blob([csv], { type: 'text/csv;charset=utf-8;' });
-    const url = URL.createObjectURL(blob);
     const a = document.createElement('a');
-    a.href = url;
+    a.href = `/predict/results/${section.dataset.resultId}/csv?${resultQuery()}`;
     a.download = 'exoplanet_predictions.csv';
     document.body.appendChild(a);
     a.click();
     document.body.removeChild(a);
-    URL.revokeObjectURL(url);
 }
 
-// Search functionality
 function initResultTable() {
-    const searchInput = document.getElementById('search-input');
-    if (searchInput) {
-        searchInput.addEventListener('input', function () {
-            const searchTerm = this.value.toLowerCase();
-            const rows = document.querySelectorAll('#table-body tr');
-            rows.forEach(row => {
-                const text = row.textContent.toLowerCase();
-                row.style.display = text.includes(searchTerm) ? '' : 'none';
-            });
-        });
-    }
+    const section = resultSection();
+    if (!section) return;
+    currentSort = { column: -1, direction: 'asc' };
+    currentPage = 1;
+    predictionFilter = '';
+    entriesPerPage = parseInt(section.dataset.pageSize) || entriesPerPage;
 
     const exportBtn = document.getElementById('export-btn');
     if (exportBtn) {
         exportBtn.addEventListener('click', exportResults);
     }
 
+    const filterSelect = document.getElementById('prediction-filter');
+    if (filterSelect) {
+        filterSelect.addEventListener('change', function () {
+            predictionFilter = this.value;
+            currentPage = 1;
+            loadPage();
+        });
+    }
+
     const entriesSelect = document.getElementById('entries-per-page');
     if (entriesSelect) {
+        entriesPerPage = parseInt(entriesSelect.value) || entriesPerPage;
         entriesSelect.addEventListener('change', function () {
             entriesPerPage = parseInt(this.value);
-            // Repaginate table logic would go here
-            console.log('Entries per page changed to:', entriesPerPage);
+            currentPage = 1;
+            loadPage();
         });
     }
+
+    loadPage();
 }
 
 // Expose initializer for dynamic loads
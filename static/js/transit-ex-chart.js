@@ -1,85 +1,112 @@
-// create synthetic exoplanet light curve data: baseline + gaussian noise + transit dip(s)
-function generateLightCurve({ n = 800, period = 75, transitDepth = 0.015, transitWidth = 3, noise = 0.0015 }) {
-  const data = [];
-  // time in days (arbitrary units)
-  const start = 0;
-  const end = 200;
-  for (let i = 0; i < n; i++) {
-    const t = start + (end - start) * (i / (n - 1));
-    // baseline normalized flux near 1.0
-    let flux = 1.0;
-    // add periodic transits every `period` days
-    const phase = (t % period);
-    // model transit as a Gaussian-shaped dip centered at phase = period/2
-    const center = period / 2;
-    const d = Math.exp(-0.5 * Math.pow((phase - center) / transitWidth, 2));
-    // subtract scaled dip
-    flux -= transitDepth * d;
-    // add low-frequency stellar variability (slow sine)
-    flux += 0.0025 * Math.sin(2 * Math.PI * t / 120);
-    // add gaussian noise
-    flux += randn_bm() * noise;
-    data.push({ x: t, y: flux });
-  }
-  return data;
-}
-
-// gaussian random helper
-function randn_bm() {
-  let u = 0, v = 0;
-  while (u === 0) u = Math.random();
-  while (v === 0) v = Math.random();
-  return Math.sqrt(-2.0 * Math.log(u)) * Math.cos(2.0 * Math.PI * v);
-}
-
-const ctx = document.getElementById('fluxChart').getContext('2d');
+// light curve chart: the server decimates the curve to the visible range and
+// chart width (/api/lightcurves/<id>), so zooming only fetches what is drawn
+const fluxCanvas = document.getElementById('fluxChart');
 
-const initialData = generateLightCurve({});
+if (fluxCanvas) {
+  // curves uploaded through POST /api/lightcurves can be shown with data-curve
+  const curveId = fluxCanvas.dataset.curve || 'demo';
+  const info = document.getElementById('fluxChartInfo');
+  let pending = null;
+  let timer = null;
 
-const fluxChart = new Chart(ctx, {
-  type: 'line',
+  const fluxChart = new Chart(fluxCanvas.getContext('2d'), {
+    type: 'line',
 
-  data: {
-    datasets: [{
-      label: 'Normalized flux',
-      data: initialData,
-      showLine: true,
-      pointRadius: 0,
-      borderWidth: 1,
-      tension: 0.05,
-    }]
-  },
-  options: {
-    responsive: true,
-    maintainAspectRatio: false,
-    plugins: {
-      legend: { display: false },
-      tooltip: {
-        mode: 'nearest',
-        intersect: false,
-        callbacks: {
-          label: function (context) {
-            const x = context.parsed.x.toFixed(3);
-            const y = context.parsed.y.toFixed(6);
-            return `Time: ${x}  —  Flux: ${y}`;
+    data: {
+      datasets: [{
+        label: 'Normalized flux',
+        data: [],
+        showLine: true,
+        pointRadius: 0,
+        borderWidth: 1,
+        tension: 0,
+      }]
+    },
+    options: {
+      responsive: true,
+      maintainAspectRatio: false,
+      // points are already sorted {x, y} objects
+      parsing: false,
+      animation: false,
+      plugins: {
+        legend: { display: false },
+        tooltip: {
+          mode: 'nearest',
+          intersect: false,
+          callbacks: {
+            label: function (context) {
+              const x = context.parsed.x.toFixed(3);
+              const y = context.parsed.y.toFixed(6);
+              return `Time: ${x}  —  Flux: ${y}`;
+            }
+          }
+        },
+        zoom: {
+          limits: { x: { min: 'original', max: 'original', minRange: 0.05 } },
+          pan: { enabled: true, mode: 'x', modifierKey: 'ctrl', onPanComplete: scheduleLoad },
+          zoom: {
+            wheel: { enabled: true },
+            pinch: { enabled: true },
+            drag: { enabled: true, modifierKey: 'shift' },
+            mode: 'x',
+            onZoomComplete: scheduleLoad
           }
         }
       },
-      zoom: {
-        pan: { enabled: false, mode: 'x', modifierKey: 'ctrl' },
-        zoom: { wheel: { enabled: false }, pinch: { enabled: false }, mode: 'x' }
-      }
-    },
-    scales: {
-      x: {
-        type: 'linear',
-        title: { display: true, text: 'Time (days)' }
+      scales: {
+        x: {
+          type: 'linear',
+          title: { display: true, text: 'Time (days)' }
+        },
+        y: {
+          title: { display: true, text: 'Normalized flux' }
+        }
       },
-      y: {
-        title: { display: true, text: 'Normalized flux' },
-        suggestedMin: 1,
-        suggestedMax: 1.002
+    }
+  });
+
+  function scheduleLoad() {
+    clearTimeout(timer);
+    timer = setTimeout(loadView, 120);
+  }
+
+  async function loadView() {
+    const scale = fluxChart.scales.x;
+    const params = new URLSearchParams({
+      width: Math.max(16, Math.min(4096, Math.round(fluxChart.chartArea.width || fluxCanvas.clientWidth)))
+    });
+    if (Number.isFinite(fluxChart.options.scales.x.min)) {
+      params.set('start', scale.min);
+      params.set('end', scale.max);
+    }
+    // a newer view replaces one still in flight
+    if (pending) pending.abort();
+    pending = new AbortController();
+    try {
+      const response = await fetch(`/api/lightcurves/${curveId}?${params}`, { signal: pending.signal });
+      if (!response.ok) return;
+      const view = await response.json();
+      fluxChart.data.datasets[0].data = view.x.map((x, i) => ({ x, y: view.y[i] }));
+      if (!Number.isFinite(fluxChart.options.scales.x.min)) {
+        // pin the full range so zoom limits and reset use the whole curve
+        fluxChart.options.scales.x.min = view.curve_start;
+        fluxChart.options.scales.x.max = view.curve_end;
       }
-    },
+      fluxChart.update('none');
+      if (info) {
+        info.textContent = `Showing ${view.x.length.toLocaleString()} of ` +
+          `${view.n_points.toLocaleString()} points (level ${view.level}). ` +
+          'Scroll to zoom, shift-drag to select a range, ctrl-drag to pan, double-click to reset.';
+      }
+    } catch (e) {
+      if (e.name !== 'AbortError') console.error(e);
+    }
   }
-});
+
+  fluxCanvas.addEventListener('dblclick', () => {
+    fluxChart.resetZoom('none');
+    scheduleLoad();
+  });
+  window.addEventListener('resize', scheduleLoad);
+  loadView();
+}
@@ -0,0 +1,153 @@
+import asyncio
+from io import BytesIO
+
+import numpy as np
+import orjson
+import pytest
+
+from utils.batch_api import (
+    ARROW_STREAM,
+    JSON,
+    NDJSON,
+    NPY,
+    OCTET_STREAM,
+    RequestTooLarge,
+    UnsupportedMediaType,
+    decode_features,
+    read_body,
+)
+from utils.constants import Constants
+
+FEATURES = Constants.FEATURES_REQUIRED_TO_PREDICT
+
+
+def feature_matrix(n_rows=3) -> np.ndarray:
+    return np.arange(n_rows * len(FEATURES), dtype=np.float64).reshape(n_rows, len(FEATURES))
+
+
+def columnar(X: np.ndarray) -> dict:
+    # deliberately not in feature order
+    return {name: X[:, j].tolist() for j, name in reversed(list(enumerate(FEATURES)))}
+
+
+def columnar_rows(X: np.ndarray) -> list[dict]:
+    return [dict(zip(FEATURES, row.tolist())) for row in X]
+
+
+def npy_body(X: np.ndarray) -> bytes:
+    buffer = BytesIO()
+    np.save(buffer, X)
+    return buffer.getvalue()
+
+
+def arrow_body(X: np.ndarray) -> bytes:
+    pa = pytest.importorskip("pyarrow")
+    table = pa.table(columnar(X))
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+@pytest.mark.parametrize(
+    "encode, content_type",
+    [
+        (lambda X: orjson.dumps(columnar(X)), JSON),
+        (lambda X: b"\n".join(orjson.dumps(row) for row in columnar_rows(X)), NDJSON),
+        (lambda X: b"\n".join(orjson.dumps(row.tolist()) for row in X) + b"\n", NDJSON),
+        (npy_body, NPY),
+        (lambda X: X.astype("<f8").tobytes(), OCTET_STREAM),
+        (arrow_body, ARROW_STREAM),
+    ],
+    ids=["json", "ndjson-objects", "ndjson-arrays", "npy", "octet-stream", "arrow"],
+)
+def test_every_format_decodes_to_feature_order(encode, content_type):
+    X = feature_matrix()
+    decoded, text_cells = decode_features(encode(X), content_type + "; charset=utf-8")
+    np.testing.assert_array_equal(decoded, X)
+    assert text_cells == {}
+
+
+def test_float32_buffers():
+    X = feature_matrix().astype(np.float32)
+    decoded, _ = decode_features(X.tobytes(), OCTET_STREAM, dtype="float32")
+    np.testing.assert_array_equal(decoded, X)
+    with pytest.raises(ValueError, match="whole number"):
+        decode_features(X.tobytes()[:-4], OCTET_STREAM, dtype="float32")
+    with pytest.raises(ValueError, match="dtype"):
+        decode_features(X.tobytes(), OCTET_STREAM, dtype="int8")
+
+
+def test_json_text_cells_are_nan_and_reported():
+    columns = columnar(feature_matrix())
+    columns["koi_depth"][1] = "deep"
+    columns["koi_period"][0] = "3.5"
+    columns["koi_impact"][2] = None
+    X, text_cells = decode_features(orjson.dumps(columns), JSON)
+    depth, period, impact = map(FEATURES.index, ["koi_depth", "koi_period", "koi_impact"])
+    assert text_cells == {(1, depth): "deep"}
+    assert np.isnan(X[1, depth]) and np.isnan(X[2, impact])
+    # numeric strings parse, as in CSV uploads
+    assert X[0, period] == 3.5
+
+
+def test_ndjson_rows_with_text_and_missing_keys():
+    rows = columnar_rows(feature_matrix(2))
+    rows[0]["koi_srad"] = "big"
+    del rows[1]["koi_prad"]
+    X, text_cells = decode_features(b"\n".join(map(orjson.dumps, rows)), NDJSON)
+    assert text_cells == {(0, FEATURES.index("koi_srad")): "big"}
+    assert np.isnan(X[1, FEATURES.index("koi_prad")])
+
+
+@pytest.mark.parametrize(
+    "body, content_type, match",
+    [
+        (orjson.dumps({"koi_period": [1.0]}), JSON, "Missing required features"),
+        (orjson.dumps([1.0]), JSON, "JSON object"),
+        (b'{"koi_period": 1}\n[1, 2]', NDJSON, "all be objects"),
+        (b"[1, 2]\n[1, 2]", NDJSON, "array of 21"),
+        (npy_body(np.ones((2, 3))), NPY, "shape"),
+        (npy_body(np.array([["a"] * len(FEATURES)])), NPY, "numeric"),
+    ],
+    ids=["json-missing", "json-array", "ndjson-mixed", "ndjson-short", "npy-shape", "npy-text"],
+)
+def test_malformed_bodies(body, content_type, match):
+    with pytest.raises(ValueError, match=match):
+        decode_features(body, content_type)
+
+
+def test_empty_ndjson_is_zero_rows():
+    X, _ = decode_features(b"\n\n", NDJSON)
+    assert X.shape == (0, len(FEATURES))
+
+
+def test_unknown_media_type():
+    with pytest.raises(UnsupportedMediaType):
+        decode_features(b"a,b", "text/csv")
+
+
+class FakeRequest:
+    def __init__(self, chunks, content_length=None):
+        self.chunks = chunks
+        self.headers = {} if content_length is None else {"content-length": str(content_length)}
+        self.read = 0
+
+    async def stream(self):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+
+def test_body_limit():
+    assert asyncio.run(read_body(FakeRequest([b"ab", b"cd"]), limit=4)) == b"abcd"
+    # a declared length over the limit is rejected before reading
+    request = FakeRequest([b"abcde"], content_length=5)
+    with pytest.raises(RequestTooLarge):
+        asyncio.run(read_body(request, limit=4))
+    assert request.read == 0
+    # an undeclared stream is cut off once it goes over
+    request = FakeRequest([b"abc", b"de", b"f"])
+    with pytest.raises(RequestTooLarge):
+        asyncio.run(read_body(request, limit=4))
+    assert request.read == 2
@@ -0,0 +1,124 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import utils.cache
+from utils.batching import MicroBatcher
+from utils.cache import CachedClassifier, PredictionCache, canonical_rows
+
+
+class FakeClassifier:
+    """Labels a row by the sign of its first feature and records every call."""
+
+    def __init__(self, artifact_hash="a"):
+        self.artifact_hash = artifact_hash
+        self.calls = []
+
+    def predict_batch(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        self.calls.append(len(X))
+        if np.isnan(X).any():
+            raise ValueError("NaN in input")
+        labels = np.where(X[:, 0] > 0, "Confirmed", "False Positive").astype(object)
+        return labels, {}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(utils.cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_canonical_rows_treat_signed_zero_and_nan_payloads_alike():
+    nan_payload = np.frombuffer(np.uint64(0x7FF8000000000001).tobytes(), dtype=np.float64)[0]
+    assert canonical_rows([[0.0, np.nan]]) == canonical_rows([[-0.0, nan_payload]])
+    assert canonical_rows([[1.0], [2.0]]) != canonical_rows([[2.0], [1.0]])
+
+
+def test_only_misses_reach_the_model():
+    cache = PredictionCache()
+    classifier = FakeClassifier()
+    cached = CachedClassifier(classifier, cache)
+    labels, counts = cached.predict_batch([[1.0], [-1.0]])
+    assert list(labels) == ["Confirmed", "False Positive"]
+    assert counts["Confirmed"] == 1 and counts["False Positive"] == 1
+    labels, _ = cached.predict_batch([[-1.0], [2.0], [1.0]])
+    assert list(labels) == ["False Positive", "Confirmed", "Confirmed"]
+    assert classifier.calls == [2, 1]
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 3
+    # a different artifact never sees another's entries
+    other = FakeClassifier(artifact_hash="b")
+    CachedClassifier(other, cache).predict([1.0])
+    assert other.calls == [1]
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = PredictionCache(maxsize=2)
+    keys = canonical_rows([[1.0], [2.0], [3.0]])
+    cache.put_many("a", keys[:2], ["x", "y"])
+    assert cache.get_many("a", keys[:1]) == ["x"]
+    cache.put_many("a", keys[2:], ["z"])
+    assert cache.get_many("a", keys) == ["x", None, "z"]
+    assert cache.stats()["size"] == 2
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = PredictionCache(ttl=10)
+    keys = canonical_rows([[1.0]])
+    cache.put_many("a", keys, ["x"])
+    clock[0] = 10
+    assert cache.get_many("a", keys) == ["x"]
+    clock[0] = 10.5
+    assert cache.get_many("a", keys) == [None]
+
+
+def test_large_batches_bypass_the_cache():
+    cache = PredictionCache(max_rows=2)
+    classifier = FakeClassifier()
+    cached = CachedClassifier(classifier, cache)
+    labels, _ = cached.predict_batch([[1.0], [-1.0], [1.0]])
+    assert list(labels) == ["Confirmed", "False Positive", "Confirmed"]
+    stats = cache.stats()
+    assert stats["size"] == stats["hits"] == stats["misses"] == 0
+    cached.predict_batch([[1.0], [-1.0], [1.0]])
+    assert classifier.calls == [3, 3]
+
+
+async def run_here(fn, *args):
+    return fn(*args)
+
+
+def predict_rows(batcher, rows):
+    async def go():
+        return await asyncio.gather(*(batcher.predict(row) for row in rows), return_exceptions=True)
+
+    return asyncio.run(go())
+
+
+def test_batcher_coalesces_rows_into_one_call():
+    classifier = FakeClassifier()
+    batcher = MicroBatcher(lambda: classifier, run_here, max_batch_size=4, max_wait=0.01)
+    results = predict_rows(batcher, [[1.0], [-1.0], [2.0]])
+    assert results == ["Confirmed", "False Positive", "Confirmed"]
+    assert classifier.calls == [3]
+    assert batcher.stats.to_dict()["max_batch_size"] == 3
+
+
+def test_batcher_retries_rows_one_by_one_on_value_error():
+    classifier = FakeClassifier()
+    batcher = MicroBatcher(lambda: classifier, run_here, max_batch_size=3, max_wait=0.01)
+    results = predict_rows(batcher, [[1.0], [np.nan], [-1.0]])
+    assert results[0] == "Confirmed" and results[2] == "False Positive"
+    assert isinstance(results[1], ValueError)
+    assert classifier.calls == [3, 1, 1, 1]
+
+
+def test_batcher_fails_the_whole_batch_on_other_errors():
+    def broken():
+        raise RuntimeError("model unavailable")
+
+    batcher = MicroBatcher(broken, run_here, max_batch_size=2, max_wait=0.01)
+    results = predict_rows(batcher, [[1.0], [2.0]])
+    assert all(isinstance(result, RuntimeError) for result in results)
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from utils.gemini import ChatService, ChatTimeoutError, MarkdownStripper
+from utils.metrics import metrics
+
+
+class ScriptedBackend:
+    """Streams `tokens`, then raises `error` if one is given."""
+
+    def __init__(self, tokens=("Hello ", "world"), error=None):
+        self.tokens = tokens
+        self.error = error
+
+    async def stream(self, prompt):
+        for token in self.tokens:
+            await asyncio.sleep(0)
+            yield token
+        if self.error is not None:
+            raise self.error
+
+
+class BrokenCache:
+    def get(self, question):
+        raise OSError("cache unavailable")
+
+    def put(self, question, answer):
+        raise OSError("cache unavailable")
+
+    def stats(self):
+        return {}
+
+
+def outcomes() -> dict[str, float]:
+    return {
+        dict(labels)["outcome"]: value
+        for (name, labels), value in metrics._counters.items()
+        if name == "chat_requests_total"
+    }
+
+
+def count_outcomes(service, *args) -> tuple[list[str], dict[str, float], Exception | None]:
+    async def go():
+        texts = []
+        try:
+            async for text in service.stream(*args):
+                texts.append(text)
+        except Exception as e:
+            return texts, e
+        return texts, None
+
+    before = outcomes()
+    texts, error = asyncio.run(go())
+    after = outcomes()
+    counted = {key: value - before.get(key, 0) for key, value in after.items()}
+    return texts, {key: value for key, value in counted.items() if value}, error
+
+
+def test_markdown_is_stripped_across_chunks():
+    stripper = MarkdownStripper()
+    chunks = ["  ## Title\n", "\n\n**bold** ", "text  "]
+    assert "".join(stripper.feed(chunk) for chunk in chunks) == "Title\nbold text"
+
+
+def test_reply_is_counted_once_as_ok():
+    texts, counted, error = count_outcomes(ChatService(ScriptedBackend()), "hi")
+    assert "".join(texts) == "Hello world" and error is None
+    assert counted == {"ok": 1}
+
+
+def test_backend_failure_mid_reply_is_counted_as_error():
+    backend = ScriptedBackend(error=RuntimeError("connection reset"))
+    service = ChatService(backend)
+    texts, counted, error = count_outcomes(service, "hi")
+    assert texts and isinstance(error, RuntimeError)
+    assert counted == {"error": 1}
+    assert service.stats()["pending"] == 0
+
+
+@pytest.mark.parametrize("tokens", [(), ("Hello",)], ids=["lookup", "store"])
+def test_answer_cache_failure_is_counted_as_error(tokens):
+    service = ChatService(ScriptedBackend(tokens=tokens), cache=BrokenCache())
+    _, counted, error = count_outcomes(service, "hi", "What is a transit?")
+    assert isinstance(error, OSError)
+    assert counted == {"error": 1}
+
+
+def test_slow_reply_times_out():
+    class SlowBackend:
+        async def stream(self, prompt):
+            await asyncio.sleep(1)
+            yield "late"
+
+    _, counted, error = count_outcomes(ChatService(SlowBackend(), timeout=0.05), "hi")
+    assert isinstance(error, ChatTimeoutError)
+    assert counted == {"timeout": 1}
+
+
+def test_stream_route_ends_with_an_error_event(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    backend = ScriptedBackend(error=RuntimeError("connection reset"))
+    monkeypatch.setattr(main, "chat_service", ChatService(backend))
+    response = TestClient(main.app).post("/chat/stream", json={"message": "hi"})
+    events = [block.split("\n")[0] for block in response.text.strip().split("\n\n")]
+    assert events[0] == "event: token" and events[-1] == "event: error"
+    assert "connection reset" not in response.text
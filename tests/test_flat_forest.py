@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from utils.flat_forest import FlatForest, export_artifact
+
+
+@pytest.fixture(
+    scope="module",
+    # fully grown trees end in pure leaves; depth and leaf-size limits (and
+    # class weights) leave impure ones, whose fractions must not be rescaled
+    params=[{}, {"max_depth": 6, "min_samples_leaf": 4, "class_weight": "balanced"}],
+    ids=["pure_leaves", "impure_leaves"],
+)
+def forest_and_data(request):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(600, 8))
+    y = (X[:, 0] + X[:, 1] ** 2 + rng.normal(scale=0.5, size=len(X)) > 1).astype(int)
+    y[X[:, 2] > 1.2] = 2
+    # NaN in training makes sklearn learn where missing values go at each split
+    X[rng.random(X.shape) < 0.05] = np.nan
+    # the last feature is constant, so no tree ever splits on it
+    X[:, -1] = 1.0
+    forest = RandomForestClassifier(
+        n_estimators=40, random_state=0, n_jobs=1, **request.param
+    ).fit(X, y)
+    X_test = rng.normal(size=(500, 8)) * 2
+    X_test[rng.random(X_test.shape) < 0.1] = np.nan
+    return forest, X_test
+
+
+def test_predict_proba_is_bit_identical(forest_and_data):
+    forest, X = forest_and_data
+    flat = FlatForest.from_sklearn(forest)
+    np.testing.assert_array_equal(flat.predict_proba(X), forest.predict_proba(X))
+    np.testing.assert_array_equal(flat.predict(X), forest.predict(X))
+    assert flat.verify(forest, X)
+
+
+def test_impure_leaf_values_are_kept_as_sklearn_stores_them(forest_and_data):
+    forest, _ = forest_and_data
+    flat = FlatForest.from_sklearn(forest)
+    leaves = np.concatenate(
+        [e.tree_.value[e.tree_.children_left == -1, 0] for e in forest.estimators_]
+    )
+    if forest.max_depth is not None:
+        # the fixture really exercises impure leaves
+        assert (leaves.max(axis=1) < 1).any()
+    np.testing.assert_array_equal(flat.leaf_values, leaves)
+
+
+def test_predict_proba_single_rows(forest_and_data):
+    forest, X = forest_and_data
+    flat = FlatForest.from_sklearn(forest)
+    for row in X[:20]:
+        np.testing.assert_array_equal(flat.predict_proba(row), forest.predict_proba([row]))
+
+
+def test_n_features_in_comes_from_the_forest(forest_and_data):
+    forest, _ = forest_and_data
+    flat = FlatForest.from_sklearn(forest)
+    assert flat.feature.max() + 1 < forest.n_features_in_
+    assert flat.n_features_in_ == forest.n_features_in_
+
+
+def test_float32_export_needs_verification(forest_and_data, tmp_path):
+    import joblib
+
+    forest, X = forest_and_data
+    path = tmp_path / "model.joblib"
+    joblib.dump({"model": forest}, path)
+    with pytest.raises(ValueError):
+        export_artifact(path, dtype=np.float32)
+    flat = FlatForest.from_sklearn(forest, dtype=np.float32)
+    # rounded leaf values are only accepted when they change nothing on X
+    assert flat.verify(forest, X) == np.array_equal(flat.predict_proba(X), forest.predict_proba(X))
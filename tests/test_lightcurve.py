@@ -0,0 +1,134 @@
+import asyncio
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.batch_api import NPY, UnsupportedMediaType
+from utils.constants import Constants
+from utils.lightcurve import (
+    CSV,
+    NPZ,
+    LightCurve,
+    TooManyPoints,
+    TransitSearch,
+    read_light_curves,
+)
+
+
+def synthetic_curve(period=3.7, depth=800e-6, n=10_000, seed=0, star="0"):
+    """30-minute cadence photometry with white noise and, if `depth`, box transits."""
+    rng = np.random.default_rng(seed)
+    time = 1000 + np.arange(n) * 30 / 1440
+    flux = 1 + rng.normal(0, 300e-6, n)
+    duration = 4 / 24
+    phase = np.abs((time - 1001.3 + period / 2) % period - period / 2)
+    flux[phase < duration / 2] -= depth
+    return LightCurve(star, time, flux)
+
+
+async def run_here(fn, *args):
+    return fn(*args)
+
+
+def search(curves, **kwargs):
+    return asyncio.run(TransitSearch(**kwargs).search(curves, run_here))
+
+
+def test_recovers_injected_transit():
+    (transit,) = search([synthetic_curve()])
+    assert transit.detected
+    assert transit.period == pytest.approx(3.7, rel=0.01)
+    assert transit.depth == pytest.approx(800e-6, rel=0.25)
+    # 800 ppm in 300 ppm noise over ~55 transits of 8 points each
+    assert transit.snr > 3 * Constants.LIGHTCURVE_MIN_SNR
+    assert len(transit.feature_vector()) == Constants.LENGTH_OF_FEATURES_REQUIRED_TO_PREDICT
+
+
+def test_flat_noise_is_not_a_detection():
+    transits = search([synthetic_curve(depth=0, seed=seed, star=str(seed)) for seed in range(3)])
+    assert not any(transit.detected for transit in transits)
+
+
+def test_curves_too_short_to_search_are_rejected():
+    with pytest.raises(ValueError, match="at least"):
+        search([synthetic_curve(n=50)])
+    # enough points, but a baseline too short for two transits
+    with pytest.raises(ValueError, match="baseline"):
+        search([synthetic_curve(n=200)], min_period=10)
+
+
+def csv_body(frame: pd.DataFrame) -> bytes:
+    return frame.to_csv(index=False).encode()
+
+
+def npy_body(array: np.ndarray) -> bytes:
+    buffer = BytesIO()
+    np.save(buffer, array)
+    return buffer.getvalue()
+
+
+def npz_body(**arrays) -> bytes:
+    buffer = BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def test_csv_is_split_by_star_and_sorted():
+    frame = pd.DataFrame(
+        {
+            "kepid": ["b", "a", "b", "a", "a"],
+            "TIME": [2.0, 3.0, 1.0, 1.0, np.nan],
+            "PDCSAP_FLUX": [1.0, 1.1, 0.9, 1.2, 1.0],
+        }
+    )
+    curves = read_light_curves(csv_body(frame), CSV)
+    assert [curve.star for curve in curves] == ["a", "b"]
+    # the NaN time is dropped, the rest sorted by time
+    np.testing.assert_array_equal(curves[0].time, [1.0, 3.0])
+    np.testing.assert_array_equal(curves[1].flux, [0.9, 1.0])
+
+
+def test_csv_without_a_flux_column_is_rejected():
+    with pytest.raises(ValueError, match="flux column"):
+        read_light_curves(csv_body(pd.DataFrame({"time": [1.0], "mag": [1.0]})), CSV)
+
+
+def test_curve_with_no_finite_points_is_empty_and_not_searched():
+    frame = pd.DataFrame({"time": np.arange(200.0), "flux": np.nan})
+    (curve,) = read_light_curves(csv_body(frame), CSV)
+    assert len(curve) == 0
+    with pytest.raises(ValueError, match="at least"):
+        search([curve])
+
+
+def test_array_shapes_are_checked():
+    (curve,) = read_light_curves(npy_body(np.ones((10, 3))), NPY)
+    assert len(curve) == 10 and curve.flux_err is not None
+    with pytest.raises(ValueError, match="shape"):
+        read_light_curves(npy_body(np.ones((10, 4))), NPY)
+    with pytest.raises(ValueError, match="Missing arrays: flux"):
+        read_light_curves(npz_body(time=np.ones(10)), NPZ)
+    with pytest.raises(ValueError, match="one entry per point"):
+        read_light_curves(npz_body(time=np.ones(10), flux=np.ones(9)), NPZ)
+
+
+@pytest.mark.parametrize(
+    "body, content_type",
+    [
+        (csv_body(pd.DataFrame({"time": np.arange(21.0), "flux": 1.0})), CSV),
+        (npy_body(np.ones((21, 2))), NPY),
+        (npz_body(time=np.ones(21), flux=np.ones(21)), NPZ),
+    ],
+    ids=["csv", "npy", "npz"],
+)
+def test_point_limit_is_checked_per_format(body, content_type):
+    assert len(read_light_curves(body, content_type, max_points=21)[0]) == 21
+    with pytest.raises(TooManyPoints):
+        read_light_curves(body, content_type, max_points=20)
+
+
+def test_unknown_content_type():
+    with pytest.raises(UnsupportedMediaType):
+        read_light_curves(b"", "application/json")
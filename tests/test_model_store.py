@@ -0,0 +1,141 @@
+import os
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import LabelEncoder
+
+from utils.constants import Constants
+from utils.flat_forest import FlatForest
+from utils.model_store import LEGACY_VERSION, ModelStore
+from utils.registry import ModelRegistry, estimate_nbytes
+
+
+def make_artifact(n_estimators=3, seed=0, flat=False) -> dict:
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(200, Constants.LENGTH_OF_FEATURES_REQUIRED_TO_PREDICT))
+    labels = np.array(["CANDIDATE", "CONFIRMED", "FALSE POSITIVE"])[rng.integers(0, 3, len(X))]
+    encoder = LabelEncoder().fit(labels)
+    forest = RandomForestClassifier(n_estimators=n_estimators, random_state=seed).fit(
+        X, encoder.transform(labels)
+    )
+    return {
+        "model": forest,
+        "flat_model": FlatForest.from_sklearn(forest) if flat else None,
+        "label_encoder": encoder,
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ModelStore(str(tmp_path / "models"))
+
+
+def test_saves_are_new_versions_and_the_newest_is_current(store):
+    assert store.save("m", make_artifact(), manifest={"note": "first"}) == "1"
+    assert store.save("m", make_artifact(seed=1)) == "2"
+    assert store.names() == ["m"]
+    assert store.versions("m") == ["1", "2"]
+    assert store.current("m") == "2"
+    manifest = store.manifest("m", "1")
+    assert manifest["note"] == "first" and manifest["version"] == "1"
+    assert len(manifest["artifact_sha256"]) == 64
+    # no temporary directories are left behind
+    assert sorted(os.listdir(os.path.join(store.root, "m", "versions"))) == ["1", "2"]
+
+
+def test_promote_and_unpromoted_saves(store):
+    store.save("m", make_artifact())
+    assert store.save("m", make_artifact(seed=1), promote=False) == "2"
+    assert store.current("m") == "1"
+    store.promote("m", "2")
+    assert store.current("m") == "2"
+    with pytest.raises(KeyError):
+        store.promote("m", "9")
+
+
+def test_current_falls_back_to_newest_when_its_version_is_gone(store):
+    store.save("m", make_artifact())
+    store.save("m", make_artifact(seed=1), promote=False)
+    store.promote("m", "1")
+    os.remove(store.artifact_path("m", "1"))
+    assert store.current("m") == "2"
+
+
+def test_legacy_artifacts_are_version_zero(store):
+    os.makedirs(store.root)
+    joblib.dump(make_artifact(), os.path.join(store.root, "old.joblib"))
+    assert store.names() == ["old"]
+    assert store.current("old") == LEGACY_VERSION
+    assert store.manifest("old", LEGACY_VERSION)["legacy"]
+
+
+@pytest.mark.parametrize("name", ["", ".hidden", "a/b", "a@1"])
+def test_invalid_names(store, name):
+    with pytest.raises(ValueError):
+        store.save(name, make_artifact())
+
+
+def test_shared_copy_only_for_flat_models(store):
+    store.save("plain", make_artifact())
+    store.save("flat", make_artifact(flat=True))
+    assert store.ensure_shared("plain", "1") is None
+    path = store.ensure_shared("flat", "1")
+    assert joblib.load(path)["model"] is None
+
+
+def test_registry_serves_current_and_pinned_versions(store):
+    store.save("m", make_artifact())
+    store.save("m", make_artifact(seed=1))
+    registry = ModelRegistry(store.root)
+    assert list(registry) == ["m"] and "m@1" in registry and "m@9" not in registry
+    assert registry.peek("m") is None
+    current = registry["m"]
+    assert current.version == "2"
+    assert registry.peek("m") is current
+    # pinning the current version shares the loaded model
+    assert registry["m@2"] is current
+    assert registry["m@1"].version == "1"
+    with pytest.raises(KeyError):
+        registry["m@9"]
+    with pytest.raises(KeyError):
+        registry["other"]
+
+
+def test_refresh_reloads_only_changed_models(store):
+    store.save("a", make_artifact())
+    store.save("b", make_artifact(seed=1))
+    registry = ModelRegistry(store.root)
+    a, b = registry["a"], registry["b"]
+    assert registry.refresh() == []
+
+    store.save("a", make_artifact(seed=2))
+    assert registry.refresh() == ["a"]
+    assert registry.peek("a") is not a and registry.peek("a").version == "2"
+    assert registry["b"] is b
+
+    assert registry.promote("a", "1") == ["a"]
+    assert registry["a"].version == "1"
+
+    store.save("c", make_artifact(seed=3))
+    assert "c" in registry.refresh()
+    assert "c" in registry
+
+
+def test_least_recently_used_models_are_evicted_over_budget(store):
+    for i, name in enumerate("abc"):
+        store.save(name, make_artifact(seed=i))
+    registry = ModelRegistry(store.root)
+    sizes = [estimate_nbytes(registry[name]) for name in "abc"]
+    # room for two of them
+    registry = ModelRegistry(store.root, memory_budget=sum(sorted(sizes)[1:]))
+    registry["a"], registry["b"]
+    registry["a"]
+    registry["c"]
+    assert list(registry.stats()["loaded"]) == ["a", "c"]
+    assert registry.resident_bytes <= registry.memory_budget
+    # a model larger than the budget is still served
+    registry.memory_budget = 1
+    assert registry["b"] is not None
+    assert list(registry.stats()["loaded"]) == ["b"]
@@ -0,0 +1,94 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.results import ResultNotFound, ResultStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ResultStore(str(tmp_path / "results"))
+
+
+def save_run(store, **extra):
+    frame = pd.DataFrame(
+        {
+            "kepoi_name": ["K1", "K2", None, "K4"],
+            "koi_period": [3.0, np.nan, 1.0, 2.0],
+        }
+    )
+    predictions = ["Confirmed", "False Positive", "Candidate", "Confirmed"]
+    return store.save(frame, predictions, {"Confirmed": 2}, **extra)
+
+
+def test_pages_come_back_with_decoded_predictions(store):
+    result_id = save_run(store, filename="koi.csv")
+    meta, rows = store.select(result_id)
+    assert meta["columns"] == ["prediction", "kepoi_name", "koi_period"]
+    assert meta["n_rows"] == 4 and meta["filename"] == "koi.csv"
+    assert store.rows(result_id, meta, rows[1:3]) == [
+        ["False Positive", "K2", pytest.approx(np.nan, nan_ok=True)],
+        ["Candidate", "", 1.0],
+    ]
+
+
+def test_sorting_keeps_missing_values_last(store):
+    result_id = save_run(store)
+    _, rows = store.select(result_id, sort="koi_period")
+    assert list(rows) == [2, 3, 0, 1]
+    _, rows = store.select(result_id, sort="koi_period", descending=True)
+    assert list(rows) == [0, 3, 2, 1]
+    with pytest.raises(ValueError, match="Unknown column"):
+        store.select(result_id, sort="koi_prad")
+
+
+def test_filtering_by_prediction(store):
+    result_id = save_run(store)
+    _, rows = store.select(result_id, sort="koi_period", predictions=["Confirmed"])
+    assert list(rows) == [3, 0]
+    with pytest.raises(ValueError, match="Unknown prediction"):
+        store.select(result_id, predictions=["Planet"])
+
+
+def test_csv_export_is_chunked_with_one_header(store):
+    result_id = save_run(store)
+    meta, rows = store.select(result_id)
+    chunks = list(store.iter_csv(result_id, meta, rows, chunk_rows=3))
+    assert len(chunks) == 2
+    assert "".join(chunks).splitlines()[0] == "prediction,kepoi_name,koi_period"
+    assert len("".join(chunks).splitlines()) == 5
+
+
+def test_clashing_input_columns_are_renamed(store):
+    names = store.column_names(["prediction", "a", "prediction_input", "a"])
+    assert names == ["prediction_input", "a", "prediction_input_input", "a_input"]
+
+
+def test_runs_expire_after_ttl(store):
+    result_id = save_run(store)
+    store.ttl = 0
+    with pytest.raises(ResultNotFound):
+        store.select(result_id)
+    store.expire()
+    assert not os.path.exists(store.path(result_id))
+
+
+def test_oldest_runs_beyond_the_limit_are_deleted(store):
+    store.max_runs = 2
+    first = save_run(store)
+    # make the first run clearly the oldest
+    os.utime(store.path(first), (time.time() - 60, time.time() - 60))
+    second = save_run(store)
+    third = save_run(store)
+    assert sorted(os.listdir(store.root)) == sorted([second, third])
+    with pytest.raises(ResultNotFound):
+        store.meta(first)
+
+
+@pytest.mark.parametrize("result_id", ["../etc", "a.b", ""])
+def test_ids_must_be_alphanumeric(store, result_id):
+    with pytest.raises(ResultNotFound):
+        store.meta(result_id)
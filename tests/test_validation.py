@@ -0,0 +1,92 @@
+import numpy as np
+import orjson
+import pandas as pd
+import pytest
+
+from utils.batch_api import JSON, decode_features
+from utils.constants import Constants
+from utils.validation import validate_frame, validate_matrix
+
+FEATURES = Constants.FEATURES_REQUIRED_TO_PREDICT
+
+
+def feature_frame(n_rows=4) -> pd.DataFrame:
+    values = np.arange(n_rows * len(FEATURES), dtype=np.float64).reshape(n_rows, len(FEATURES))
+    return pd.DataFrame(values, columns=FEATURES)
+
+
+def test_clean_frame_is_ok():
+    X, report = validate_frame(feature_frame())
+    assert report.ok and report.n_invalid == 0
+    assert X.shape == (4, len(FEATURES))
+    assert report.to_dict()["errors"] == []
+
+
+def test_text_and_infinite_cells_are_reported_per_row():
+    df = feature_frame().astype({"koi_depth": object, "koi_prad": object})
+    df.loc[1, "koi_depth"] = "deep"
+    df.loc[2, "koi_prad"] = "7.5"
+    df.loc[3, "koi_period"] = np.inf
+    X, report = validate_frame(df)
+    assert list(report.valid) == [True, False, True, False]
+    # numeric text parses like any number
+    assert X[2, FEATURES.index("koi_prad")] == 7.5
+    summary = report.to_dict(row_offset=10)
+    assert summary["n_invalid"] == 2
+    assert summary["errors_by_column"] == {
+        "koi_period": {"infinite": 1},
+        "koi_depth": {"non_numeric": 1},
+    }
+    assert summary["errors"] == [
+        {"row": 11, "column": "koi_depth", "error": "non_numeric", "value": "deep"},
+        {"row": 13, "column": "koi_period", "error": "infinite", "value": "inf"},
+    ]
+
+
+def test_missing_columns_fail_every_row():
+    X, report = validate_frame(feature_frame().drop(columns=["koi_srad", "koi_sma"]))
+    assert not report.ok and report.n_invalid == 4
+    assert report.missing_columns == ["koi_sma", "koi_srad"]
+    assert report.message() == "Missing required features: koi_sma, koi_srad"
+    assert len(X) == 0
+
+
+@pytest.mark.parametrize("allow_missing", [True, False], ids=["allowed", "rejected"])
+def test_missing_values_are_only_rejected_when_asked(allow_missing):
+    df = feature_frame()
+    df.loc[0, "koi_impact"] = np.nan
+    _, report = validate_frame(df, allow_missing=allow_missing)
+    assert report.valid[0] == allow_missing
+    if not allow_missing:
+        assert report.to_dict()["errors"] == [
+            {"row": 0, "column": "koi_impact", "error": "missing", "value": None}
+        ]
+
+
+def test_json_text_cells_are_errors_on_their_own_rows():
+    columns = {name: [1.0, 2.0, 3.0] for name in FEATURES}
+    columns["koi_depth"][0] = "n/a"
+    columns["koi_srad"][2] = {"value": 1}
+    columns["koi_impact"][1] = None
+    X, text_cells = decode_features(orjson.dumps(columns), JSON)
+    report = validate_matrix(X, text_cells=text_cells)
+    assert list(report.valid) == [False, True, False]
+    errors = report.to_dict()["errors"]
+    assert [(e["row"], e["column"], e["error"]) for e in errors] == [
+        (0, "koi_depth", "non_numeric"),
+        (2, "koi_srad", "non_numeric"),
+    ]
+    assert errors[0]["value"] == "n/a"
+    # the null is an error too once missing values are rejected, but not as text
+    report = validate_matrix(X, text_cells=text_cells, allow_missing=False)
+    assert list(report.valid) == [False, False, False]
+    assert report.to_dict()["errors_by_column"]["koi_impact"] == {"missing": 1}
+    assert report.to_dict()["errors_by_column"]["koi_depth"] == {"non_numeric": 1}
+
+
+def test_samples_are_capped():
+    X = np.full((5, len(FEATURES)), np.inf)
+    report = validate_matrix(X, max_samples=3)
+    assert len(report.samples) == 3
+    assert report.n_invalid == 5
+    assert len(report.to_dict(max_errors=2)["errors"]) == 2
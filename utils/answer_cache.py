@@ -0,0 +1,191 @@
+from collections import OrderedDict
+import numpy as np
+import threading
+import json
+import time
+import zlib
+import re
+import os
+
+
+class HashingEmbedder:
+    """Offline text embedding: signed feature hashing of words, word pairs
+    and character trigrams, L2-normalised so inner product is cosine.
+
+    crc32 is used instead of `hash()` so vectors are stable across processes
+    and a persisted cache can be re-indexed after a restart.
+    """
+
+    def __init__(self, dim=1024):
+        self.dim = dim
+
+    @staticmethod
+    def features(text: str) -> list[str]:
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        padded = f" {' '.join(words)} "
+        return [
+            *words,
+            *(f"{a} {b}" for a, b in zip(words, words[1:])),
+            *(padded[i : i + 3] for i in range(len(padded) - 2)),
+        ]
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        X = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self.features(text):
+                h = zlib.crc32(feature.encode())
+                X[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(X, axis=1, keepdims=True)
+        return X / np.maximum(norms, 1e-12)
+
+
+class SemanticAnswerCache:
+    """Chat answers keyed by question, matched by embedding similarity.
+
+    A question whose cosine similarity to a cached one is at least
+    `threshold` gets the cached answer. Entries are kept in LRU order up to
+    `maxsize` and expire after `ttl` seconds. With a `path`, every insert
+    is appended to a JSON-lines log that is re-indexed on first use, so the
+    cache survives restarts; the log is rewritten with only the live
+    entries once it holds twice `maxsize` lines. faiss is imported on first
+    use as well.
+    """
+
+    def __init__(self, path=None, maxsize=1000, threshold=0.9, ttl=7 * 24 * 3600.0, dim=1024):
+        self.path = path
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        self.embedder = HashingEmbedder(dim)
+        self.hits = 0
+        self.misses = 0
+        # id -> (question, answer, created_at), least recently used first
+        self._entries: OrderedDict[int, tuple[str, str, float]] = OrderedDict()
+        self._next_id = 0
+        # lines in the log at `path`, live or not
+        self._logged = 0
+        self._index = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        if os.getenv("EXOVISION_CHAT_CACHE", "1") != "1":
+            return None
+        return cls(
+            path=os.getenv("EXOVISION_CHAT_CACHE_PATH", os.path.join("dataset", "chat_cache.jsonl")),
+            maxsize=int(os.getenv("EXOVISION_CHAT_CACHE_SIZE", "1000")),
+            threshold=float(os.getenv("EXOVISION_CHAT_CACHE_THRESHOLD", "0.9")),
+            ttl=float(os.getenv("EXOVISION_CHAT_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+        )
+
+    def _ensure_index(self):
+        if self._index is not None:
+            return
+        import faiss
+
+        self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.embedder.dim))
+        if self.path and os.path.exists(self.path):
+            saved = []
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        saved.append(json.loads(line))
+                    except ValueError:
+                        # a line cut short by a crash mid-append
+                        continue
+            self._logged = len(saved)
+            now = time.time()
+            entries = [
+                (entry["question"], entry["answer"], entry["created_at"])
+                for entry in saved
+                if entry["created_at"] + self.ttl > now
+            ][-self.maxsize :]
+            self._add(entries)
+
+    def _add(self, entries: list[tuple[str, str, float]]):
+        if not entries:
+            return
+        ids = np.arange(self._next_id, self._next_id + len(entries), dtype=np.int64)
+        self._next_id += len(entries)
+        self._index.add_with_ids(self.embedder.embed([entry[0] for entry in entries]), ids)
+        self._entries.update(zip(ids.tolist(), entries))
+
+    def _remove(self, ids: list[int]):
+        if ids:
+            self._index.remove_ids(np.array(ids, dtype=np.int64))
+            for entry_id in ids:
+                del self._entries[entry_id]
+
+    def get(self, question: str) -> str | None:
+        query = self.embedder.embed([question])
+        with self._lock:
+            self._ensure_index()
+            if self._index.ntotal == 0:
+                self.misses += 1
+                return None
+            scores, ids = self._index.search(query, 1)
+            entry_id = int(ids[0, 0])
+            entry = self._entries.get(entry_id)
+            if entry is None or scores[0, 0] < self.threshold:
+                self.misses += 1
+                return None
+            if entry[2] + self.ttl <= time.time():
+                self._remove([entry_id])
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, question: str, answer: str):
+        with self._lock:
+            self._ensure_index()
+            entry = (question, answer, time.time())
+            self._add([entry])
+            overflow = len(self._entries) - self.maxsize
+            if overflow > 0:
+                self._remove(list(self._entries)[:overflow])
+            if self.path:
+                if self._logged >= 2 * self.maxsize:
+                    self._save()
+                else:
+                    self._append(entry)
+
+    @staticmethod
+    def _line(entry: tuple[str, str, float]) -> str:
+        question, answer, created_at = entry
+        return json.dumps({"question": question, "answer": answer, "created_at": created_at}) + "\n"
+
+    def _append(self, entry: tuple[str, str, float]):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(self._line(entry))
+        self._logged += 1
+
+    def _save(self):
+        """Rewrite the log with only the live entries."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(self._line(entry) for entry in self._entries.values())
+        os.replace(tmp_path, self.path)
+        self._logged = len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._ensure_index()
+            self._remove(list(self._entries))
+            if self.path:
+                self._save()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
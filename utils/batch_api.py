@@ -0,0 +1,174 @@
+from utils.constants import Constants
+from io import BytesIO
+import numpy as np
+import orjson
+
+
+JSON = "application/json"
+NDJSON = "application/x-ndjson"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+ARROW_FILE = "application/vnd.apache.arrow.file"
+NPY = "application/x-npy"
+OCTET_STREAM = "application/octet-stream"
+MEDIA_TYPES = (JSON, NDJSON, ARROW_STREAM, ARROW_FILE, NPY, OCTET_STREAM)
+
+
+class UnsupportedMediaType(ValueError):
+    pass
+
+
+class RequestTooLarge(ValueError):
+    def __init__(self, limit: int):
+        super().__init__(f"Request body is larger than {limit} bytes")
+        self.limit = limit
+
+
+async def read_body(request, limit: int) -> bytes:
+    """The body of a Starlette `request`, raising `RequestTooLarge` once it
+    exceeds `limit` bytes: a declared Content-Length is rejected before
+    anything is read, and the stream is cut off as soon as it goes over."""
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > limit:
+        raise RequestTooLarge(limit)
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise RequestTooLarge(limit)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def decode_features(
+    body: bytes, content_type: str, dtype="float64"
+) -> tuple[np.ndarray, dict[tuple[int, int], str]]:
+    """Decode a request body into an (n_rows, n_features) float64 matrix.
+
+    Columns follow `Constants.FEATURES_REQUIRED_TO_PREDICT`. Named formats
+    (columnar JSON, NDJSON objects, Arrow) are matched by feature name;
+    positional ones (NDJSON arrays, .npy, raw buffers) must already be in
+    that order. Missing values may be null/NaN. JSON bodies are parsed with
+    one orjson call; binary bodies are wrapped without copying.
+
+    Also returns the JSON and Arrow cells that are not numbers as
+    `{(row, column): text}`; they are NaN in the matrix, so validation can
+    report them per row like unparseable CSV cells.
+    """
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type == JSON:
+        return _decode_columnar_json(body)
+    if media_type == NDJSON:
+        return _decode_ndjson(body)
+    if media_type in (ARROW_STREAM, ARROW_FILE):
+        return _decode_arrow(body, stream=media_type == ARROW_STREAM)
+    if media_type == NPY:
+        return _check_shape(np.load(BytesIO(body), allow_pickle=False)), {}
+    if media_type == OCTET_STREAM:
+        if dtype not in ("float32", "float64"):
+            raise ValueError("dtype must be float32 or float64")
+        n_features = Constants.LENGTH_OF_FEATURES_REQUIRED_TO_PREDICT
+        itemsize = np.dtype(dtype).itemsize
+        if len(body) % (itemsize * n_features):
+            raise ValueError(f"Body is not a whole number of {n_features}-feature {dtype} rows")
+        return np.frombuffer(body, dtype=f"<{dtype[0]}{itemsize}").reshape(-1, n_features), {}
+    raise UnsupportedMediaType(
+        f"Unsupported content type {media_type!r}; use one of {', '.join(MEDIA_TYPES)}"
+    )
+
+
+def _check_shape(X: np.ndarray) -> np.ndarray:
+    n_features = Constants.LENGTH_OF_FEATURES_REQUIRED_TO_PREDICT
+    if X.ndim != 2 or X.shape[1] != n_features:
+        raise ValueError(f"Expected an (n_rows, {n_features}) matrix, got shape {X.shape}")
+    if X.dtype.kind not in "fiu":
+        raise ValueError(f"Expected numeric values, got dtype {X.dtype}")
+    return X
+
+
+def _to_floats(values, j: int, text_cells: dict) -> np.ndarray:
+    # one numpy conversion unless a cell is not a number; then cell by cell,
+    # with the bad cells recorded and left as NaN
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        if not isinstance(values, (list, np.ndarray)):
+            raise ValueError("Feature arrays must hold numbers or null") from None
+    column = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        if value is None:
+            continue
+        try:
+            # numeric strings parse, as they do in CSV uploads
+            column[i] = float(value)
+        except (TypeError, ValueError):
+            text_cells[(i, j)] = str(value)
+    return column
+
+
+def _from_columns(columns: dict) -> tuple[np.ndarray, dict]:
+    missing = set(Constants.FEATURES_REQUIRED_TO_PREDICT) - set(columns)
+    if missing:
+        raise ValueError(f"Missing required features: {', '.join(sorted(missing))}")
+    text_cells = {}
+    X = np.column_stack(
+        [
+            _to_floats(columns[name], j, text_cells)
+            for j, name in enumerate(Constants.FEATURES_REQUIRED_TO_PREDICT)
+        ]
+    )
+    return _check_shape(X), text_cells
+
+
+def _decode_columnar_json(body: bytes) -> tuple[np.ndarray, dict]:
+    # {"koi_period": [...], "koi_impact": [...], ...}; null becomes NaN
+    payload = orjson.loads(body)
+    if not isinstance(payload, dict):
+        raise ValueError("Expected a JSON object mapping feature names to arrays")
+    return _from_columns(payload)
+
+
+def _decode_ndjson(body: bytes) -> tuple[np.ndarray, dict]:
+    n_features = Constants.LENGTH_OF_FEATURES_REQUIRED_TO_PREDICT
+    lines = [line for line in body.splitlines() if line.strip()]
+    if not lines:
+        return np.empty((0, n_features)), {}
+    # joined into one JSON array so the whole body is a single orjson call
+    rows = orjson.loads(b"[" + b",".join(lines) + b"]")
+    if isinstance(rows[0], dict):
+        # one object per row, matched by name
+        if not all(isinstance(row, dict) for row in rows):
+            raise ValueError("NDJSON lines must all be objects or all be arrays")
+        return _from_columns(
+            {
+                name: [row.get(name) for row in rows]
+                for name in Constants.FEATURES_REQUIRED_TO_PREDICT
+            }
+        )
+    # one feature array per row
+    try:
+        return _check_shape(np.array(rows, dtype=np.float64)), {}
+    except (TypeError, ValueError):
+        if not all(isinstance(row, list) and len(row) == n_features for row in rows):
+            raise ValueError(f"Every NDJSON line must be an array of {n_features} numbers") from None
+    return _from_columns(
+        {
+            name: [row[j] for row in rows]
+            for j, name in enumerate(Constants.FEATURES_REQUIRED_TO_PREDICT)
+        }
+    )
+
+
+def _decode_arrow(body: bytes, stream: bool) -> tuple[np.ndarray, dict]:
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise UnsupportedMediaType("Arrow bodies need pyarrow installed on the server") from None
+    reader = pa.ipc.open_stream(body) if stream else pa.ipc.open_file(body)
+    table = reader.read_all()
+    return _from_columns(
+        {
+            name: table.column(name).to_numpy(zero_copy_only=False)
+            for name in table.column_names
+            if name in Constants.FEATURES_REQUIRED_TO_PREDICT
+        }
+    )
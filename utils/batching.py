@@ -0,0 +1,157 @@
+from collections.abc import Callable, Mapping
+from utils.metrics import request_timings
+import numpy as np
+import asyncio
+import time
+import os
+
+
+class BatchStats:
+    BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+    def __init__(self):
+        self.batches = 0
+        self.rows = 0
+        self.max_batch_size = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.size_buckets = {bucket: 0 for bucket in self.BUCKETS}
+        self.size_buckets["+Inf"] = 0
+
+    def record(self, size: int, waits: list[float]):
+        self.batches += 1
+        self.rows += size
+        self.max_batch_size = max(self.max_batch_size, size)
+        self.wait_seconds_total += sum(waits)
+        self.wait_seconds_max = max(self.wait_seconds_max, max(waits))
+        bucket = next((bucket for bucket in self.BUCKETS if size <= bucket), "+Inf")
+        self.size_buckets[bucket] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "mean_wait_ms": 1000 * self.wait_seconds_total / self.rows if self.rows else 0.0,
+            "max_wait_ms": 1000 * self.wait_seconds_max,
+            "batch_size_buckets": {str(k): v for k, v in self.size_buckets.items()},
+        }
+
+
+class MicroBatcher:
+    """Coalesces single-row predictions for one model into batched calls.
+
+    The first row to arrive opens a window of `max_wait` seconds; the batch
+    is flushed when the window closes or `max_batch_size` rows are waiting,
+    whichever comes first. `run(fn, *args)` executes the batch, typically
+    the `run` of a thread `InferencePool`; the model is resolved there too,
+    since resolving it may load it. Every request in a batch gets the
+    batch's Server-Timing stages and its own wait.
+    """
+
+    def __init__(self, get_classifier: Callable, run: Callable, max_batch_size=32, max_wait=0.002):
+        self.get_classifier = get_classifier
+        self.run = run
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.stats = BatchStats()
+        self._rows: list[list[float]] = []
+        # future, enqueue time and Server-Timing list of each waiting request
+        self._waiters: list[tuple[asyncio.Future, float, list | None]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def predict(self, row: list[float]) -> str:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._rows.append(row)
+        self._waiters.append((future, time.perf_counter(), request_timings.get()))
+        if len(self._rows) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._rows:
+            return
+        rows, waiters = self._rows, self._waiters
+        self._rows, self._waiters = [], []
+        task = asyncio.ensure_future(self._run_batch(rows, waiters))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, rows, waiters):
+        started = time.perf_counter()
+        self.stats.record(len(rows), [started - enqueued for _, enqueued, _ in waiters])
+        try:
+            labels, timings = await self.run(self._predict, rows)
+        except Exception as e:
+            if len(rows) > 1 and isinstance(e, ValueError):
+                # one bad row must not fail its neighbours, retry them one by one
+                await asyncio.gather(
+                    *(self._run_batch([row], [waiter]) for row, waiter in zip(rows, waiters))
+                )
+                return
+            for future, _, _ in waiters:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (future, enqueued, request_stages), label in zip(waiters, labels):
+            if request_stages is not None:
+                request_stages.append(("microbatch_wait", started - enqueued))
+                request_stages.extend(timings)
+            if not future.done():
+                future.set_result(label)
+
+    def _predict(self, rows) -> tuple[np.ndarray, list]:
+        # runs in the pool with its own timings list, copied to every request
+        timings = []
+        request_timings.set(timings)
+        labels, _ = self.get_classifier().predict_batch(np.asarray(rows))
+        return labels, timings
+
+
+class MicroBatchDispatcher:
+    """One `MicroBatcher` per model name, created on first use."""
+
+    def __init__(self, models: Mapping, run: Callable, max_batch_size=32, max_wait=0.002):
+        self.models = models
+        self.run = run
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._batchers: dict[str, MicroBatcher] = {}
+
+    @classmethod
+    def from_env(cls, models: Mapping, run: Callable):
+        return cls(
+            models,
+            run,
+            max_batch_size=int(os.getenv("EXOVISION_MICROBATCH_MAX_ROWS", "32")),
+            max_wait=float(os.getenv("EXOVISION_MICROBATCH_WINDOW_MS", "2")) / 1000,
+        )
+
+    async def predict(self, model_name: str, row: list[float]) -> str:
+        if model_name not in self.models:
+            raise KeyError(model_name)
+        batcher = self._batchers.get(model_name)
+        if batcher is None:
+            batcher = self._batchers[model_name] = MicroBatcher(
+                # resolved per batch so a retrained model is picked up
+                lambda: self.models[model_name],
+                self.run,
+                max_batch_size=self.max_batch_size,
+                max_wait=self.max_wait,
+            )
+        return await batcher.predict(row)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": 1000 * self.max_wait,
+            "models": {name: b.stats.to_dict() for name, b in self._batchers.items()},
+        }
@@ -0,0 +1,140 @@
+from collections import OrderedDict
+from collections.abc import Mapping
+from utils.main import ExoPlanetsClassifier
+import numpy as np
+import threading
+import time
+import os
+
+
+def canonical_rows(X) -> list[bytes]:
+    """One hashable key per row; -0.0 and every NaN payload compare equal."""
+    X = np.array(X, dtype=np.float64, ndmin=2)
+    X = np.where(np.isnan(X), np.nan, X) + 0.0
+    return [row.tobytes() for row in X]
+
+
+class PredictionCache:
+    """Bounded LRU cache of predicted labels with a time-to-live.
+
+    Keys are (artifact hash, feature vector), so retraining a model under the
+    same name changes the hash and old entries are simply never hit again
+    until they age out. Batches of more than `max_rows` rows bypass the
+    cache: a big upload is rarely repeated, costs a Python key per row and
+    would evict everything the single-row callers have cached.
+    """
+
+    def __init__(self, maxsize=100_000, ttl=3600.0, max_rows=1_000):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple[str, bytes], tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            maxsize=int(os.getenv("EXOVISION_PREDICTION_CACHE_SIZE", "100000")),
+            ttl=float(os.getenv("EXOVISION_PREDICTION_CACHE_TTL_SECONDS", "3600")),
+            max_rows=int(os.getenv("EXOVISION_PREDICTION_CACHE_MAX_ROWS", "1000")),
+        )
+
+    def get_many(self, artifact_hash: str, keys: list[bytes]) -> list[str | None]:
+        now = time.monotonic()
+        results = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get((artifact_hash, key))
+                if entry is None or entry[0] < now:
+                    results.append(None)
+                    continue
+                self._entries.move_to_end((artifact_hash, key))
+                results.append(entry[1])
+            found = sum(result is not None for result in results)
+            self.hits += found
+            self.misses += len(results) - found
+        return results
+
+    def put_many(self, artifact_hash: str, keys: list[bytes], labels):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, label in zip(keys, labels):
+                self._entries[(artifact_hash, key)] = (expires_at, label)
+                self._entries.move_to_end((artifact_hash, key))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "max_rows": self.max_rows,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    def view(self, models: Mapping) -> "CachedModels":
+        return CachedModels(models, self)
+
+
+class CachedClassifier:
+    """ExoPlanetsClassifier whose predictions go through a PredictionCache."""
+
+    def __init__(self, classifier: ExoPlanetsClassifier, cache: PredictionCache):
+        self.classifier = classifier
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.classifier, name)
+
+    def predict(self, data: list[float]):
+        labels, _ = self.predict_batch([data])
+        return labels[0]
+
+    def predict_batch(self, X) -> tuple[np.ndarray, dict[str, int]]:
+        X = np.array(X, dtype=np.float64, ndmin=2)
+        if len(X) > self.cache.max_rows:
+            return self.classifier.predict_batch(X)
+        keys = canonical_rows(X)
+        artifact_hash = self.classifier.artifact_hash
+        labels = np.array(self.cache.get_many(artifact_hash, keys), dtype=object)
+        # only the cache misses reach the model
+        missing = np.flatnonzero([label is None for label in labels])
+        if len(missing):
+            predicted, _ = self.classifier.predict_batch(X[missing])
+            labels[missing] = predicted
+            self.cache.put_many(artifact_hash, [keys[i] for i in missing], predicted)
+        return labels, ExoPlanetsClassifier._count(labels)
+
+
+class CachedModels(Mapping):
+    """Read-through view of a model mapping that wraps each model in the cache."""
+
+    def __init__(self, models: Mapping, cache: PredictionCache):
+        self.models = models
+        self.cache = cache
+
+    def __getitem__(self, name: str) -> CachedClassifier:
+        return CachedClassifier(self.models[name], self.cache)
+
+    def peek(self, name: str) -> CachedClassifier | None:
+        classifier = self.models.peek(name)
+        return None if classifier is None else CachedClassifier(classifier, self.cache)
+
+    def __contains__(self, name) -> bool:
+        return name in self.models
+
+    def __iter__(self):
+        return iter(self.models)
+
+    def __len__(self) -> int:
+        return len(self.models)
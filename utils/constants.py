@@ -26,3 +26,16 @@ class Constants:
     ]
     LENGTH_OF_FEATURES_REQUIRED_TO_PREDICT = len(FEATURES_REQUIRED_TO_PREDICT)
     FEATURES_REQUIRED_TO_PREDICT_STRING = ", ".join(FEATURES_REQUIRED_TO_PREDICT)
+    MAX_CSV_ROWS = 100_000
+    # raw request bodies, checked before they are read into memory
+    MAX_BODY_BYTES = 64 * 1024 * 1024
+    LIGHTCURVE_MAX_BODY_BYTES = 256 * 1024 * 1024
+    CSV_STREAM_CHUNK_ROWS = 10_000
+    FLAT_FOREST_MAX_ROWS = 32
+    RESULT_PAGE_SIZE = 50
+    RESULT_MAX_PAGE_SIZE = 1000
+    LIGHTCURVE_MAX_STARS = 1000
+    LIGHTCURVE_MAX_POINTS = 10_000_000
+    # Kepler's detection threshold for a transit signal
+    LIGHTCURVE_MIN_SNR = 7.1
+    PLOT_MAX_WIDTH = 4096
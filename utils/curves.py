@@ -0,0 +1,300 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from utils.lightcurve import LightCurve
+import numpy as np
+import threading
+import hashlib
+import shutil
+import json
+import time
+import uuid
+import os
+
+DECIMATION_METHODS = ("lttb", "minmax")
+
+
+class CurveNotFound(KeyError):
+    pass
+
+
+def minmax_buckets(x: np.ndarray, y: np.ndarray, size: int) -> tuple[np.ndarray, np.ndarray]:
+    """The lowest and highest point of every `size` consecutive points, in
+    time order, so dips and spikes survive however far a curve is reduced."""
+    n = len(x)
+    if n <= 2:
+        return x, y
+    buckets = -(-n // size)
+    pad = buckets * size - n
+    offsets = np.arange(buckets) * size
+    low = np.concatenate([y, np.full(pad, np.inf)]).reshape(buckets, size).argmin(axis=1)
+    high = np.concatenate([y, np.full(pad, -np.inf)]).reshape(buckets, size).argmax(axis=1)
+    index = np.sort(np.stack([low + offsets, high + offsets], axis=1), axis=1).ravel()
+    # flat buckets pick the same point twice
+    index = index[np.r_[True, np.diff(index) != 0]]
+    return x[index], y[index]
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> tuple[np.ndarray, np.ndarray]:
+    """Largest-Triangle-Three-Buckets (Steinarsson, 2013).
+
+    Keeps the first and last points and, from each of `n_out - 2` buckets,
+    the point forming the largest triangle with the point kept before it
+    and the mean of the next bucket. One pass over the buckets, each step
+    vectorized over its bucket.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # means of every bucket from cumulative sums, the last point standing in
+    # for the bucket after the last one
+    cx = np.r_[0.0, np.cumsum(x, dtype=np.float64)]
+    cy = np.r_[0.0, np.cumsum(y, dtype=np.float64)]
+    counts = np.maximum(edges[1:] - edges[:-1], 1)
+    mean_x = np.r_[(cx[edges[1:]] - cx[edges[:-1]]) / counts, x[-1]]
+    mean_y = np.r_[(cy[edges[1:]] - cy[edges[:-1]]) / counts, y[-1]]
+
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - mean_x[i + 1]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (mean_y[i + 1] - ay))
+        a = lo + int(area.argmax())
+        kept[i + 1] = a
+    return x[kept], y[kept]
+
+
+@dataclass
+class CurveLevels:
+    """A light curve and its decimation pyramid.
+
+    `levels[0]` is the raw (2, n) array of time and flux; every next level
+    keeps the min and max of each `factor` points of the one before, so
+    each is `factor / 2` times shorter. A view reads the coarsest level
+    that still has enough points in the requested range and reduces that
+    slice to the requested resolution.
+    """
+
+    levels: list[np.ndarray]
+
+    @property
+    def n_points(self) -> int:
+        return self.levels[0].shape[1]
+
+    def view(self, start=None, end=None, width=1000, method="lttb", oversample=4) -> dict:
+        """Points to draw `start`..`end` about `width` pixels wide."""
+        if method not in DECIMATION_METHODS:
+            raise ValueError(f"Unknown method {method!r}, expected one of {DECIMATION_METHODS}")
+        # lttb keeps one point per pixel, min/max two
+        target = width if method == "lttb" else 2 * width
+        raw = self.levels[0][0]
+        start = raw[0] if start is None else start
+        end = raw[-1] if end is None else end
+        if end < start:
+            raise ValueError("end must not be before start")
+
+        for level, array in reversed(list(enumerate(self.levels))):
+            time = array[0]
+            # one point past each edge so lines run to the chart border
+            lo = max(int(np.searchsorted(time, start)) - 1, 0)
+            hi = min(int(np.searchsorted(time, end, side="right")) + 1, len(time))
+            if hi - lo >= oversample * target or level == 0:
+                break
+        x, y = np.asarray(array[0, lo:hi]), np.asarray(array[1, lo:hi])
+        n_in_range = hi - lo
+        if len(x) > target:
+            if method == "lttb":
+                x, y = lttb(x, y, target)
+            else:
+                x, y = minmax_buckets(x, y, -(-len(x) // width))
+        return {
+            "level": level,
+            "n_points": self.n_points,
+            "n_in_range": n_in_range,
+            "start": float(start),
+            "end": float(end),
+            "x": x,
+            "y": y,
+        }
+
+
+def build_levels(time: np.ndarray, flux: np.ndarray, factor=8, min_points=2048) -> list[np.ndarray]:
+    levels = [np.stack([time, flux])]
+    while levels[-1].shape[1] > min_points:
+        x, y = minmax_buckets(levels[-1][0], levels[-1][1], factor)
+        levels.append(np.stack([x, y]))
+    return levels
+
+
+def demo_light_curve(seed=7) -> LightCurve:
+    """Four years of Kepler-like long-cadence photometry of a star with a
+    transiting planet: quarterly gaps, slow variability and white noise."""
+    rng = np.random.default_rng(seed)
+    cadence = 29.4 / 1440
+    time = 131.5 + np.arange(int(1460 / cadence)) * cadence
+    # a few days lost between the 93-day quarters while data were downlinked
+    time = time[((time - time[0]) % 93.0) > 3.0]
+    flux = 1.0 + 0.0025 * np.sin(2 * np.pi * time / 41.0) + 0.0008 * np.sin(2 * np.pi * time / 9.3)
+    flux += rng.normal(0.0, 0.0015, len(time))
+    period, t0, duration, depth = 37.8, 150.2, 0.42, 0.012
+    phase = np.abs((time - t0 + period / 2) % period - period / 2)
+    # trapezoid with 15% of the duration for ingress and egress
+    ingress = 0.15 * duration
+    flux -= depth * np.clip((duration / 2 - phase) / ingress, 0.0, 1.0)
+    return LightCurve("demo", time, flux)
+
+
+class CurveStore:
+    """Light curves kept for plotting, with their decimation pyramids.
+
+    A curve id is the sha256 of its time and flux, so posting the same
+    curve again reuses it. Levels are plain `.npy` files loaded with
+    `mmap_mode="r"`, and the pyramids of the last `max_cached` curves stay
+    open, so zooming and panning only read the slices they draw. At most
+    `max_curves` curves are kept; the least recently used go first (adding
+    or viewing a curve touches its meta file).
+    """
+
+    META_FILE = "meta.json"
+    DEMO = "demo"
+
+    def __init__(self, root=os.path.join("dataset", "curves"), max_curves=200, max_cached=32):
+        self.root = root
+        self.max_curves = max_curves
+        self.max_cached = max_cached
+        self._cache: OrderedDict[str, CurveLevels] = OrderedDict()
+        self._lock = threading.Lock()
+        self._demo_id = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            root=os.getenv("EXOVISION_CURVE_DIR", os.path.join("dataset", "curves")),
+            max_curves=int(os.getenv("EXOVISION_CURVE_MAX_CURVES", "200")),
+            max_cached=int(os.getenv("EXOVISION_CURVE_CACHE_SIZE", "32")),
+        )
+
+    def path(self, curve_id: str) -> str:
+        if not curve_id.isalnum():
+            raise CurveNotFound(curve_id)
+        return os.path.join(self.root, curve_id)
+
+    def __contains__(self, curve_id) -> bool:
+        try:
+            return os.path.exists(os.path.join(self.path(curve_id), self.META_FILE))
+        except CurveNotFound:
+            return False
+
+    def add(self, curve: LightCurve) -> str:
+        digest = hashlib.sha256()
+        digest.update(np.ascontiguousarray(curve.time).tobytes())
+        digest.update(np.ascontiguousarray(curve.flux).tobytes())
+        curve_id = digest.hexdigest()
+        if self.touch(curve_id):
+            return curve_id
+        os.makedirs(self.root, exist_ok=True)
+        tmp_dir = os.path.join(self.root, f".{uuid.uuid4().hex}.tmp")
+        os.makedirs(tmp_dir)
+        try:
+            levels = build_levels(curve.time, curve.flux)
+            for i, level in enumerate(levels):
+                np.save(os.path.join(tmp_dir, f"level{i}.npy"), level)
+            with open(os.path.join(tmp_dir, self.META_FILE), "w") as f:
+                json.dump(
+                    {
+                        "curve_id": curve_id,
+                        "star": curve.star,
+                        "n_points": len(curve),
+                        "n_levels": len(levels),
+                        "start": float(curve.time[0]),
+                        "end": float(curve.time[-1]),
+                        "created_at": time.time(),
+                    },
+                    f,
+                )
+            try:
+                os.rename(tmp_dir, self.path(curve_id))
+            except OSError:
+                # the same curve was stored concurrently
+                if curve_id not in self:
+                    raise
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        self.expire(keep=curve_id)
+        return curve_id
+
+    def touch(self, curve_id: str) -> bool:
+        """Mark a stored curve as just used; False if it is not stored."""
+        try:
+            os.utime(os.path.join(self.path(curve_id), self.META_FILE))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def resolve(self, curve_id: str) -> str:
+        """`curve_id`, with "demo" standing for the bundled demo curve."""
+        if curve_id != self.DEMO:
+            return curve_id
+        if self._demo_id is None or self._demo_id not in self:
+            self._demo_id = self.add(demo_light_curve())
+        return self._demo_id
+
+    def meta(self, curve_id: str) -> dict:
+        try:
+            with open(os.path.join(self.path(curve_id), self.META_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise CurveNotFound(curve_id) from None
+
+    def levels(self, curve_id: str) -> CurveLevels:
+        self.touch(curve_id)
+        with self._lock:
+            if curve_id in self._cache:
+                self._cache.move_to_end(curve_id)
+                return self._cache[curve_id]
+        meta = self.meta(curve_id)
+        levels = CurveLevels(
+            [
+                np.load(os.path.join(self.path(curve_id), f"level{i}.npy"), mmap_mode="r")
+                for i in range(meta["n_levels"])
+            ]
+        )
+        with self._lock:
+            self._cache[curve_id] = levels
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return levels
+
+    def view(self, curve_id: str, start=None, end=None, width=1000, method="lttb") -> dict:
+        curve_id = self.resolve(curve_id)
+        view = self.levels(curve_id).view(start, end, width, method)
+        meta = self.meta(curve_id)
+        return {
+            "curve_id": curve_id,
+            "star": meta["star"],
+            "curve_start": meta["start"],
+            "curve_end": meta["end"],
+            **view,
+        }
+
+    def expire(self, keep: str | None = None):
+        """Delete the least recently used curves beyond `max_curves`."""
+        if not os.path.isdir(self.root):
+            return
+        stored = []
+        for entry in os.scandir(self.root):
+            if entry.name.startswith(".") or entry.name == keep:
+                continue
+            try:
+                stored.append((os.path.getmtime(os.path.join(entry.path, self.META_FILE)), entry.name))
+            except FileNotFoundError:
+                continue
+        stored.sort()
+        for _, curve_id in stored[: max(0, len(stored) + 1 - self.max_curves)]:
+            shutil.rmtree(os.path.join(self.root, curve_id), ignore_errors=True)
+            with self._lock:
+                self._cache.pop(curve_id, None)
@@ -0,0 +1,140 @@
+from utils.constants import Constants
+from typing import TYPE_CHECKING
+from io import BytesIO
+import numpy as np
+import hashlib
+import shutil
+import json
+import time
+import os
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class DatasetStore:
+    """Content-addressed store of uploaded training CSVs.
+
+    Each upload is parsed once, keeping only the required features (float32,
+    one row-major matrix) and the target (int8 codes plus category names).
+    The dataset id is the sha256 of the uploaded bytes, so identical files
+    are stored once. Matrices are plain `.npy` files loaded with
+    `mmap_mode="r"`, so training reads them without parsing or copying.
+    """
+
+    FEATURES_FILE = "features.npy"
+    TARGET_FILE = "target.npy"
+    META_FILE = "meta.json"
+
+    def __init__(self, root=os.path.join("dataset", "store"), target_col="koi_disposition"):
+        self.root = root
+        self.target_col = target_col
+
+    def path(self, dataset_id: str) -> str:
+        if not dataset_id.isalnum():
+            raise ValueError(f"Invalid dataset id {dataset_id!r}")
+        return os.path.join(self.root, dataset_id)
+
+    def __contains__(self, dataset_id) -> bool:
+        return os.path.exists(os.path.join(self.path(dataset_id), self.META_FILE))
+
+    def ingest(self, contents: bytes, filename: str | None = None) -> str:
+        dataset_id = hashlib.sha256(contents).hexdigest()
+        if dataset_id in self:
+            return dataset_id
+        # pandas is imported on first use to keep app startup fast
+        import pandas as pd
+
+        features = Constants.FEATURES_REQUIRED_TO_PREDICT
+        with BytesIO(contents) as buffer:
+            header = pd.read_csv(buffer, comment="#", nrows=0).columns
+            missing = set(features + [self.target_col]) - set(header)
+            if missing:
+                raise ValueError(f"File {filename} is missing features: {missing}")
+            buffer.seek(0)
+            df = pd.read_csv(
+                buffer,
+                comment="#",
+                usecols=features + [self.target_col],
+                dtype={**{name: np.float32 for name in features}, self.target_col: "category"},
+            )
+        target = df[self.target_col].cat
+        if len(target.categories) > np.iinfo(np.int8).max:
+            raise ValueError(f"Too many distinct values in {self.target_col}")
+
+        # write into a temporary directory and rename it into place, so readers
+        # never see a half-written dataset
+        os.makedirs(self.root, exist_ok=True)
+        tmp_dir = os.path.join(self.root, f".{dataset_id}.{os.getpid()}.tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        np.save(
+            os.path.join(tmp_dir, self.FEATURES_FILE),
+            np.ascontiguousarray(df[features].to_numpy(dtype=np.float32)),
+        )
+        np.save(os.path.join(tmp_dir, self.TARGET_FILE), target.codes.to_numpy(dtype=np.int8))
+        with open(os.path.join(tmp_dir, self.META_FILE), "w") as f:
+            json.dump(
+                {
+                    "dataset_id": dataset_id,
+                    "filename": filename,
+                    "features": features,
+                    "target": self.target_col,
+                    "categories": [str(c) for c in target.categories],
+                    "n_rows": len(df),
+                    "created_at": time.time(),
+                },
+                f,
+            )
+        try:
+            os.rename(tmp_dir, self.path(dataset_id))
+        except OSError:
+            # another worker stored the same content first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return dataset_id
+
+    def meta(self, dataset_id: str) -> dict:
+        with open(os.path.join(self.path(dataset_id), self.META_FILE)) as f:
+            return json.load(f)
+
+    def entries(self) -> list[dict]:
+        if not os.path.isdir(self.root):
+            return []
+        return [
+            self.meta(entry.name)
+            for entry in os.scandir(self.root)
+            if entry.is_dir() and not entry.name.startswith(".") and entry.name in self
+        ]
+
+    def load(self, dataset_id: str) -> tuple[np.ndarray, np.ndarray, list[str]]:
+        """Memory-mapped features, target codes (-1 = missing) and target names."""
+        path = self.path(dataset_id)
+        meta = self.meta(dataset_id)
+        if meta["features"] != Constants.FEATURES_REQUIRED_TO_PREDICT:
+            raise ValueError(f"Dataset {dataset_id} was stored with a different feature set")
+        X = np.load(os.path.join(path, self.FEATURES_FILE), mmap_mode="r")
+        codes = np.load(os.path.join(path, self.TARGET_FILE), mmap_mode="r")
+        return X, codes, meta["categories"]
+
+    def load_frame(self, dataset_ids: list[str]) -> "pd.DataFrame":
+        """Features and target of one or more datasets as a DataFrame.
+
+        A single dataset is wrapped without copying the feature matrix.
+        """
+        import pandas as pd
+
+        parts = [self.load(dataset_id) for dataset_id in dataset_ids]
+        categories = sorted({name for _, _, names in parts for name in names})
+        X = parts[0][0] if len(parts) == 1 else np.concatenate([p[0] for p in parts])
+        # remap each dataset's codes onto the shared category list; the
+        # appended -1 keeps missing targets (code -1) missing
+        codes = np.concatenate(
+            [
+                np.append(
+                    np.array([categories.index(name) for name in names], dtype=np.int8), -1
+                )[codes]
+                for _, codes, names in parts
+            ]
+        )
+        df = pd.DataFrame(X, columns=Constants.FEATURES_REQUIRED_TO_PREDICT, copy=False)
+        df[self.target_col] = pd.Categorical.from_codes(codes, categories=categories)
+        return df
@@ -0,0 +1,92 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+import contextvars
+import asyncio
+import os
+
+
+class PoolSaturatedError(RuntimeError):
+    pass
+
+
+class InferencePool:
+    """Runs blocking work (sklearn predict, CSV parsing) off the event loop.
+
+    At most `max_workers` jobs run at once and at most `max_queue` more may
+    wait; anything beyond that is rejected with `PoolSaturatedError` so the
+    caller can answer 503 instead of piling up requests.
+
+    With `kind="process"` the callable and its arguments are pickled for every
+    call, which suits parsing raw bytes but is costly for passing whole models.
+    """
+
+    KINDS = ("thread", "process")
+
+    def __init__(self, name: str, kind="thread", max_workers=None, max_queue=None):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown pool kind {kind!r}, expected one of {self.KINDS}")
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = self.max_workers * 4 if max_queue is None else max_queue
+        self._pending = 0
+        self._executor: Executor | None = None
+
+    @classmethod
+    def from_env(cls, name: str, kind="thread", max_workers=None, max_queue=None):
+        prefix = f"EXOVISION_{name.upper()}_POOL"
+        workers = os.getenv(f"{prefix}_WORKERS")
+        queue = os.getenv(f"{prefix}_QUEUE")
+        return cls(
+            name=name,
+            kind=os.getenv(f"{prefix}_KIND", kind),
+            max_workers=int(workers) if workers else max_workers,
+            max_queue=int(queue) if queue else max_queue,
+        )
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=self.name
+                )
+        return self._executor
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def saturated(self) -> bool:
+        return self._pending >= self.max_workers + self.max_queue
+
+    async def run(self, fn, *args, **kwargs):
+        # only touched from the event loop thread, so a plain counter is enough
+        if self.saturated:
+            raise PoolSaturatedError(f"{self.name} pool is saturated, try again later")
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            call = partial(fn, *args, **kwargs)
+            if self.kind == "thread":
+                # carry the request context (e.g. Server-Timing stages) into the worker
+                call = partial(contextvars.copy_context().run, call)
+            return await loop.run_in_executor(self.executor, call)
+        finally:
+            self._pending -= 1
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+        }
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
@@ -0,0 +1,251 @@
+from typing import TYPE_CHECKING
+import numpy as np
+import argparse
+import joblib
+
+if TYPE_CHECKING:
+    from sklearn.ensemble import RandomForestClassifier
+
+
+def _floor_float32(values: np.ndarray) -> np.ndarray:
+    """Largest float32 <= each float64 value.
+
+    sklearn compares float32 inputs against float64 thresholds, so
+    `x <= t` and `x <= _floor_float32(t)` agree for every float32 `x`.
+    """
+    rounded = values.astype(np.float32)
+    too_high = rounded.astype(np.float64) > values
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
+
+
+class FlatForest:
+    """A fitted RandomForestClassifier flattened into contiguous node arrays.
+
+    All trees share one set of arrays; `roots[t]` is the first node of tree
+    `t`. Every (sample, tree) pair descends one level per vectorized step
+    until it reaches a leaf. `leaf_of` maps a node to its row in
+    `leaf_values` (class fractions), or -1 for splits.
+
+    Traversal skips sklearn's per-call validation and joblib dispatch, which
+    dominate for a handful of rows; sklearn's compiled trees are faster for
+    large batches.
+    """
+
+    def __init__(
+        self,
+        feature,
+        threshold,
+        left,
+        right,
+        missing_left,
+        leaf_of,
+        leaf_values,
+        roots,
+        max_depth,
+        classes,
+        n_features=None,
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.leaf_of = leaf_of
+        self.leaf_values = leaf_values
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes_ = classes
+        self.n_features = n_features
+
+    @classmethod
+    def from_sklearn(cls, forest: "RandomForestClassifier", dtype=np.float64) -> "FlatForest":
+        if forest.n_outputs_ != 1:
+            raise ValueError("Only single-output forests can be flattened")
+        dtype = np.dtype(dtype)
+        features, thresholds, lefts, rights, missing_lefts = [], [], [], [], []
+        leaf_ofs, values, roots = [], [], []
+        node_offset, leaf_offset, max_depth = 0, 0, 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            # leaves point to themselves so the arrays hold no -1 children
+            node_ids = np.arange(tree.node_count, dtype=np.int32)
+            is_leaf = tree.children_left == -1
+            leaf_count = int(is_leaf.sum())
+
+            left = np.where(is_leaf, node_ids, tree.children_left).astype(np.int32)
+            right = np.where(is_leaf, node_ids, tree.children_right).astype(np.int32)
+            leaf_of = np.full(tree.node_count, -1, dtype=np.int32)
+            leaf_of[is_leaf] = np.arange(leaf_count, dtype=np.int32) + leaf_offset
+
+            # tree_.value already holds class fractions, and
+            # DecisionTreeClassifier.predict_proba returns them as they are;
+            # renormalising would move impure leaves by an ulp
+            proba = tree.value[is_leaf, 0, :].astype(np.float64)
+
+            threshold = np.where(is_leaf, 0.0, tree.threshold)
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(threshold)
+            lefts.append(left + node_offset)
+            rights.append(right + node_offset)
+            # where sklearn sends NaN features at this split
+            missing_lefts.append(tree.__getstate__()["nodes"]["missing_go_to_left"].astype(bool))
+            leaf_ofs.append(leaf_of)
+            values.append(proba)
+            roots.append(node_offset)
+            node_offset += tree.node_count
+            leaf_offset += leaf_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        threshold = np.concatenate(thresholds)
+        if dtype == np.float32:
+            threshold = _floor_float32(threshold)
+        return cls(
+            feature=np.concatenate(features),
+            threshold=threshold,
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            missing_left=np.concatenate(missing_lefts),
+            leaf_of=np.concatenate(leaf_ofs),
+            leaf_values=np.concatenate(values).astype(dtype),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            classes=forest.classes_,
+            n_features=forest.n_features_in_,
+        )
+
+    @property
+    def n_features_in_(self) -> int:
+        n_features = getattr(self, "n_features", None)
+        if n_features is None:
+            # flattened before the forest's own count was kept; only a lower
+            # bound when the last features are never split on
+            return int(self.feature.max()) + 1
+        return n_features
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            array.nbytes
+            for array in (
+                self.feature,
+                self.threshold,
+                self.left,
+                self.right,
+                self.missing_left,
+                self.leaf_of,
+                self.leaf_values,
+                self.roots,
+            )
+        )
+
+    def _apply(self, X: np.ndarray) -> np.ndarray:
+        """Leaf node reached in every tree, shape (n_samples, n_trees)."""
+        n_samples, n_trees = len(X), len(self.roots)
+        nodes = np.tile(self.roots, n_samples)
+        # offset of each (sample, tree) pair's row in the flattened X
+        row_offsets = np.repeat(np.arange(n_samples, dtype=np.intp) * X.shape[1], n_trees)
+        flat_X = X.ravel()
+        active = np.flatnonzero(self.leaf_of[nodes] < 0)
+        while active.size:
+            current = nodes[active]
+            values = flat_X[row_offsets[active] + self.feature[current]]
+            goes_left = (values <= self.threshold[current]) | (
+                np.isnan(values) & self.missing_left[current]
+            )
+            nodes[active] = np.where(goes_left, self.left[current], self.right[current])
+            active = active[self.leaf_of[nodes[active]] < 0]
+        return nodes.reshape(n_samples, n_trees)
+
+    def predict_proba(self, X, chunk_size=256) -> np.ndarray:
+        # sklearn runs trees on float32 inputs, do the same for identical splits
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if np.isinf(X).any():
+            raise ValueError("Input X contains infinity.")
+        proba = np.empty((len(X), len(self.classes_)), dtype=np.float64)
+        for start in range(0, len(X), chunk_size):
+            leaves = self.leaf_of[self._apply(X[start : start + chunk_size])]
+            # reducing over the tree axis adds trees one after another, in the
+            # same order sklearn accumulates them
+            total = self.leaf_values[leaves].sum(axis=1, dtype=np.float64)
+            proba[start : start + chunk_size] = total / len(self.roots)
+        return proba
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+    def verify(self, forest: "RandomForestClassifier", X) -> bool:
+        """True if class probabilities are bit-identical to `forest.predict_proba`
+        on every row of X (so predicted labels, ties included, are too)."""
+        # with n_jobs > 1 sklearn adds trees up in whatever order threads finish
+        n_jobs = forest.n_jobs
+        forest.n_jobs = 1
+        try:
+            expected = forest.predict_proba(X)
+        finally:
+            forest.n_jobs = n_jobs
+        return bool(np.array_equal(self.predict_proba(X), expected))
+
+
+def export_artifact(artifact_path, output_path=None, dtype=np.float64, strip=False, X=None):
+    """Add a flat forest to a saved artifact, optionally dropping the sklearn model."""
+    artifact = joblib.load(artifact_path)
+    forest = artifact["model"]
+    flat = FlatForest.from_sklearn(forest, dtype=dtype)
+    if np.dtype(dtype) != np.float64 and X is None:
+        # float32 leaf values round the probabilities, which can flip ties
+        raise ValueError("A float32 export must be verified against data (pass X)")
+    if X is not None and not flat.verify(forest, X):
+        raise ValueError(f"Flattened forest disagrees with {artifact_path}")
+    artifact["flat_model"] = flat
+    if strip:
+        artifact["model"] = None
+    joblib.dump(artifact, output_path or artifact_path)
+    return flat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Flatten the random forest of a saved model artifact."
+    )
+    parser.add_argument("artifact")
+    parser.add_argument("--output")
+    parser.add_argument(
+        "--float32",
+        action="store_true",
+        help="halve the leaf values; needs --verify-csv and fails if any probability differs",
+    )
+    parser.add_argument(
+        "--strip", action="store_true", help="drop the sklearn forest from the artifact"
+    )
+    parser.add_argument(
+        "--verify-csv",
+        help="CSV with the required features; export fails if any prediction differs",
+    )
+    args = parser.parse_args()
+
+    X = None
+    if args.verify_csv:
+        import pandas as pd
+        from utils.constants import Constants
+
+        artifact = joblib.load(args.artifact)
+        X = pd.read_csv(args.verify_csv, comment="#")[
+            Constants.FEATURES_REQUIRED_TO_PREDICT
+        ].to_numpy(dtype=float)
+        if artifact.get("scaler") is not None:
+            X = artifact["scaler"].transform(X)
+
+    # import through the package so the pickled class is utils.flat_forest.FlatForest
+    from utils.flat_forest import export_artifact
+
+    flat = export_artifact(
+        args.artifact,
+        output_path=args.output,
+        dtype=np.float32 if args.float32 else np.float64,
+        strip=args.strip,
+        X=X,
+    )
+    print(f"Flattened {len(flat.roots)} trees into {flat.nbytes} bytes")
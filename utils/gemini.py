@@ -1,19 +1,226 @@
-import google.generativeai as genai
+from collections.abc import AsyncIterator
+from functools import lru_cache
+from typing import Protocol
+from utils.answer_cache import SemanticAnswerCache
+from utils.executor import PoolSaturatedError
+from utils.metrics import metrics
 from dotenv import load_dotenv
+import asyncio
+import time
 import os
 import re
 
 load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
-model = genai.GenerativeModel("gemini-2.5-flash-lite")
+PROMPT = "You are an expert on exoplanets. Answer clearly and concisely in plain text without markdown: {message}"
 
 
-def chat_with_gemini_as_astronomy_expert(message: str) -> str:
-    prompt = f"You are an expert on exoplanets. Answer clearly and concisely in plain text without markdown: {message}"
-    response = model.generate_content(prompt)
-    text = response.text or ""
-    text = re.sub(r"[*_`#>-]", "", text)
-    text = re.sub(r"\n{2,}", "\n", text).strip()
+class ChatTimeoutError(RuntimeError):
+    pass
+
+
+@lru_cache(maxsize=1)
+def get_model():
+    # google.generativeai takes about a second to import, so the client is
+    # only imported and configured when the first chat message arrives
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return genai.GenerativeModel("gemini-2.5-flash-lite")
+
+
+class MarkdownStripper:
+    """Incremental version of the reply clean-up.
+
+    Feeding the chunks of a reply one by one yields the same text as
+    stripping markdown characters, collapsing blank lines and trimming the
+    whole reply at once. Trailing whitespace of a chunk is held back until
+    more text arrives, since it may belong to a blank-line run or the end.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._whitespace = ""
+
+    def feed(self, chunk: str) -> str:
+        text = self._whitespace + re.sub(r"[*_`#>-]", "", chunk)
+        if not self._started:
+            text = text.lstrip()
+        body = text.rstrip()
+        self._whitespace = text[len(body):]
+        if not body:
+            return ""
+        self._started = True
+        return re.sub(r"\n{2,}", "\n", body)
+
+
+class ChatBackend(Protocol):
+    def stream(self, prompt: str) -> AsyncIterator[str]: ...
+
+
+class GeminiBackend:
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        model = await asyncio.to_thread(get_model)
+        response = await model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            try:
+                yield chunk.text
+            except ValueError:
+                # chunks without text parts (e.g. only a finish reason)
+                continue
+
+
+class FakeBackend:
+    """Offline stand-in for Gemini that streams a canned reply at a fixed pace."""
+
+    REPLY = (
+        "## Exoplanets\n\nAn **exoplanet** is a planet orbiting a star other than the Sun. "
+        "Kepler found thousands of them with the transit method:\n\n"
+        "- the star dims slightly each time the planet crosses it\n"
+        "- the depth of the dip gives the planet's size\n"
+    )
+
+    def __init__(self, reply=REPLY, first_token_seconds=0.3, tokens_per_second=40.0):
+        self.reply = reply
+        self.first_token_seconds = first_token_seconds
+        self.tokens_per_second = tokens_per_second
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            first_token_seconds=float(os.getenv("EXOVISION_CHAT_FAKE_FIRST_TOKEN_MS", "300")) / 1000,
+            tokens_per_second=float(os.getenv("EXOVISION_CHAT_FAKE_TOKENS_PER_SECOND", "40")),
+        )
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        await asyncio.sleep(self.first_token_seconds)
+        for token in re.findall(r"\S+\s*", self.reply):
+            yield token
+            await asyncio.sleep(1 / self.tokens_per_second)
+
+
+class ChatService:
+    """Streams cleaned replies from a chat backend without blocking the loop.
+
+    At most `max_concurrent` replies are generated at once per worker and at
+    most `max_queue` more may wait for a slot; anything beyond that raises
+    `PoolSaturatedError`. `timeout` bounds a whole reply, including the wait.
+
+    With a `cache`, a reply to a standalone `question` is looked up there
+    first and stored once it completes.
+    """
+
+    BACKENDS = {"gemini": GeminiBackend, "fake": FakeBackend.from_env}
+
+    def __init__(
+        self,
+        backend: ChatBackend,
+        max_concurrent=4,
+        max_queue=16,
+        timeout=30.0,
+        cache: SemanticAnswerCache | None = None,
+    ):
+        self.backend = backend
+        self.cache = cache
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._pending = 0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    @classmethod
+    def from_env(cls):
+        backend = os.getenv("EXOVISION_CHAT_BACKEND", "gemini")
+        if backend not in cls.BACKENDS:
+            raise ValueError(f"EXOVISION_CHAT_BACKEND must be one of {', '.join(cls.BACKENDS)}")
+        return cls(
+            cls.BACKENDS[backend](),
+            max_concurrent=int(os.getenv("EXOVISION_CHAT_MAX_CONCURRENT", "4")),
+            max_queue=int(os.getenv("EXOVISION_CHAT_QUEUE", "16")),
+            timeout=float(os.getenv("EXOVISION_CHAT_TIMEOUT_SECONDS", "30")),
+            cache=SemanticAnswerCache.from_env(),
+        )
+
+    @property
+    def saturated(self) -> bool:
+        return self._pending >= self.max_concurrent + self.max_queue
+
+    async def stream(self, message: str, question: str | None = None) -> AsyncIterator[str]:
+        """Stream a reply to `message`, or to `question` alone when it is given.
+
+        A `question` is answered without the rest of the conversation, so
+        the answer cache is only ever keyed by the exact text the model was
+        asked.
+        """
+        if question is not None:
+            message = question
+        if question is not None and self.cache is not None:
+            try:
+                answer = await asyncio.to_thread(self.cache.get, question)
+            except Exception:
+                metrics.inc("chat_requests_total", outcome="error")
+                raise
+            if answer is not None:
+                metrics.inc("chat_requests_total", outcome="cached")
+                yield answer
+                return
+        if self.saturated:
+            metrics.inc("chat_requests_total", outcome="rejected")
+            raise PoolSaturatedError("chat is saturated, try again later")
+        self._pending += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        outcome = "error"
+        try:
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                raise ChatTimeoutError("Timed out waiting for a chat slot") from None
+            tokens = self.backend.stream(PROMPT.format(message=message))
+            try:
+                started = time.perf_counter()
+                stripper = MarkdownStripper()
+                parts = []
+                async for text in self._until(tokens, deadline):
+                    if started is not None:
+                        metrics.observe("chat_first_token_seconds", time.perf_counter() - started)
+                        started = None
+                    text = stripper.feed(text)
+                    if text:
+                        parts.append(text)
+                        yield text
+                if question is not None and self.cache is not None and parts:
+                    await asyncio.to_thread(self.cache.put, question, "".join(parts))
+                outcome = "ok"
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                raise ChatTimeoutError(f"Chat reply took longer than {self.timeout:g}s") from None
+            finally:
+                self._semaphore.release()
+                await tokens.aclose()
+        finally:
+            self._pending -= 1
+            metrics.inc("chat_requests_total", outcome=outcome)
+
+    @staticmethod
+    async def _until(tokens: AsyncIterator[str], deadline: float) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                yield await asyncio.wait_for(tokens.__anext__(), deadline - loop.time())
+            except StopAsyncIteration:
+                return
+
+    async def reply(self, message: str, question: str | None = None) -> str:
+        return "".join([text async for text in self.stream(message, question)])
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._pending,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "timeout_seconds": self.timeout,
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
 
-    return text
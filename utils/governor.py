@@ -0,0 +1,155 @@
+from dataclasses import dataclass, asdict
+import threading
+import os
+
+# read by OpenMP/BLAS when a process loads them, so pool and training
+# processes started later begin with the right thread counts
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "BLIS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+
+def available_cpus() -> list[int]:
+    """Cores this process may run on (its affinity mask where Linux has one)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def effective_threads() -> dict:
+    """Threads this process actually runs with: every native thread pool
+    threadpoolctl finds, and the OS thread count where /proc has it."""
+    from threadpoolctl import threadpool_info
+
+    report = {
+        "threadpools": [
+            {
+                "user_api": pool["user_api"],
+                "internal_api": pool["internal_api"],
+                "num_threads": pool["num_threads"],
+            }
+            for pool in threadpool_info()
+        ],
+        "cpus": available_cpus(),
+        "nice": os.nice(0) if hasattr(os, "nice") else 0,
+    }
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    report["os_threads"] = int(line.split()[1])
+    except OSError:
+        pass
+    return report
+
+
+def limit_n_jobs(estimator, n_jobs: int):
+    """Set `n_jobs` on an estimator and everything nested in it (pipeline
+    steps, search estimators); models trained with n_jobs=-1 would otherwise
+    predict on every core."""
+    params = estimator.get_params()
+    updates = {key: n_jobs for key in params if key == "n_jobs" or key.endswith("__n_jobs")}
+    if updates:
+        estimator.set_params(**updates)
+
+
+@dataclass
+class TrainingLimits:
+    """What one training process may use; applied in the child itself."""
+
+    cpus: list[int]
+    threads: int
+    nice: int
+
+    def apply(self) -> dict:
+        """Pin to `cpus`, lower the priority and cap native thread pools;
+        returns the effective settings."""
+        from threadpoolctl import threadpool_limits
+
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, self.cpus)
+        if hasattr(os, "nice") and self.nice:
+            os.nice(self.nice)
+        for var in THREAD_ENV_VARS:
+            os.environ[var] = str(self.threads)
+        # joblib's loky workers get a share of these threads each
+        os.environ["LOKY_MAX_CPU_COUNT"] = str(self.threads)
+        threadpool_limits(limits=self.threads)
+        return {"limits": asdict(self), **effective_threads()}
+
+
+class ResourceGovernor:
+    """Splits the cores of the machine between serving and training.
+
+    Serving gets `serving_cores`: native thread pools (BLAS, OpenMP) and the
+    `n_jobs` of loaded models are capped to it, and so are the blocking
+    pools. Training jobs run in their own processes pinned to the last
+    `training_cores` cores, shared by at most `max_training_jobs` jobs
+    across all workers, with `training_nice` added to their niceness so
+    inference wins any core both end up on.
+
+    The defaults do not isolate serving from training. These caps are fixed
+    at startup, so serving keeps every core (idle serving would otherwise
+    run on half the machine) and training runs on the last half of them:
+    while a job trains, inference is protected by priority only. Set
+    `serving_cores` (EXOVISION_SERVING_CORES) to reserve cores for each side;
+    training then defaults to the ones serving does not use.
+    """
+
+    def __init__(self, serving_cores=None, training_cores=None, max_training_jobs=1, training_nice=10):
+        self.cpus = available_cpus()
+        n = len(self.cpus)
+        self.serving_cores = min(serving_cores or n, n)
+        default_training = n - self.serving_cores if serving_cores else n // 2
+        self.training_cores = min(training_cores or max(1, default_training), n)
+        self.max_training_jobs = max(1, max_training_jobs)
+        self.training_nice = training_nice
+        self._applied = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        serving = os.getenv("EXOVISION_SERVING_CORES")
+        training = os.getenv("EXOVISION_TRAINING_CORES")
+        return cls(
+            serving_cores=int(serving) if serving else None,
+            training_cores=int(training) if training else None,
+            max_training_jobs=int(os.getenv("EXOVISION_MAX_TRAINING_JOBS", "1")),
+            training_nice=int(os.getenv("EXOVISION_TRAINING_NICE", "10")),
+        )
+
+    def apply_serving(self):
+        """Cap the native thread pools of this (serving) process."""
+        from threadpoolctl import threadpool_limits
+
+        with self._lock:
+            if self._applied is not None:
+                return
+            for var in THREAD_ENV_VARS:
+                os.environ.setdefault(var, str(self.serving_cores))
+            self._applied = threadpool_limits(limits=self.serving_cores)
+
+    def training_limits(self) -> TrainingLimits:
+        # the last cores, so they overlap serving's only when the budgets do
+        return TrainingLimits(
+            cpus=self.cpus[-self.training_cores :],
+            threads=max(1, self.training_cores // self.max_training_jobs),
+            nice=self.training_nice,
+        )
+
+    def report(self) -> dict:
+        return {
+            "cpu_count": len(self.cpus),
+            "serving": {"cores": self.serving_cores, **effective_threads()},
+            "training": {
+                "cores": self.training_cores,
+                # with the defaults, only niceness keeps training off inference
+                "overlaps_serving": self.serving_cores + self.training_cores > len(self.cpus),
+                "max_concurrent_jobs": self.max_training_jobs,
+                "limits_per_job": asdict(self.training_limits()),
+            },
+        }
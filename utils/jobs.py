@@ -0,0 +1,435 @@
+from collections import deque
+from dataclasses import dataclass, field
+from utils.metrics import metrics
+import multiprocessing as mp
+import threading
+import shutil
+import json
+import os
+
+try:
+    import fcntl
+except ImportError:  # no flock: the concurrency cap only holds per worker
+    fcntl = None
+import time
+import uuid
+
+
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+SEARCH_MODES = ("full", "halving")
+PREPROCESS_CACHE_DIR = os.path.join("dataset", "cache")
+
+
+@dataclass
+class TrainingJob:
+    job_id: str
+    model_name: str
+    csv_paths: list[str]
+    dataset_ids: list[str] = field(default_factory=list)
+    output_dir: str = "models"
+    search: str = "full"
+    time_budget: float | None = None
+    promote: bool = True
+    version: str | None = None
+    status: str = "queued"
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    events: list[dict] = field(default_factory=list)
+    # cores, threads and priority the training process ended up with
+    resources: dict | None = None
+    process: mp.process.BaseProcess | None = field(default=None, repr=False)
+    # the lock file held while the job runs
+    slot: object = field(default=None, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "model_name": self.model_name,
+            "dataset_ids": self.dataset_ids,
+            "search": self.search,
+            "time_budget": self.time_budget,
+            "promote": self.promote,
+            "version": self.version,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "resources": self.resources,
+            "events": self.events,
+        }
+
+
+def _pid_alive(pid) -> bool:
+    if pid is None or os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def run_training(
+    model_name,
+    csv_paths,
+    output_dir,
+    events,
+    search="full",
+    time_budget=None,
+    dataset_ids=None,
+    dataset_root=None,
+    promote=True,
+    limits=None,
+):
+    """Child process entry point: runs every training stage and reports it.
+
+    `limits` (a `TrainingLimits`) is applied before anything is imported
+    that starts native thread pools.
+    """
+    def emit(event, **data):
+        events.put({"event": event, "time": time.time(), **data})
+
+    if limits is not None:
+        emit("resources", **limits.apply())
+
+    from utils.model_creator import ExoplanetRandomForestModelGenerator
+    from utils.datasets import DatasetStore
+
+    def stage(name, fn, *args):
+        emit("stage_started", stage=name)
+        started = time.perf_counter()
+        result = fn(*args)
+        emit("stage_finished", stage=name, seconds=time.perf_counter() - started)
+        return result
+
+    def on_fold(completed, total):
+        emit("cv_fold", completed=completed, total=total)
+
+    try:
+        generator = ExoplanetRandomForestModelGenerator(
+            csv_paths=csv_paths,
+            target_col="koi_disposition",
+            cache_dir=PREPROCESS_CACHE_DIR,
+            dataset_ids=dataset_ids,
+            dataset_store=DatasetStore(dataset_root) if dataset_root else DatasetStore(),
+            n_jobs=limits.threads if limits is not None else -1,
+        )
+        stage("load", generator.load_and_validate)
+        X_train_res, X_test, y_train_res, y_test = stage("preprocess", generator.preprocess)
+        if search == "halving":
+            stage(
+                "train",
+                lambda: generator.train_halving(
+                    X_train_res,
+                    y_train_res,
+                    time_budget=time_budget,
+                    n_jobs=generator.n_jobs,
+                    on_fold=on_fold,
+                ),
+            )
+        else:
+            stage("train", generator.train, X_train_res, y_train_res, on_fold)
+        stage("evaluate", generator.evaluate, X_test, y_test)
+        version = stage("save", generator.save, model_name, output_dir, promote)
+        emit("saved", version=version)
+    except Exception as e:
+        emit("failed", error=str(e))
+        return
+    emit("succeeded")
+
+
+class TrainingJobManager:
+    """Runs training jobs in child processes, at most `max_concurrent` at once.
+
+    Extra jobs wait in a FIFO queue. Events reported by the child are
+    collected on a watcher thread per job and kept on `TrainingJob.events`.
+    `on_success(job)` is called from that thread once the model is saved.
+    `limits` (a `TrainingLimits`) is applied in every child process.
+
+    Every job is also kept under `root/<job_id>/`: its state in `job.json`,
+    rewritten on every change, and its events appended to `events.jsonl`.
+    Workers sharing `root` can therefore report each other's jobs, and
+    cancelling another worker's job leaves a `cancel` file that its owner
+    acts on within `poll_interval` seconds.
+
+    A running job holds one of `max_concurrent` lock files in `root/.slots`,
+    so the cap holds across all those workers; queued jobs retry for a free
+    slot every `poll_interval` seconds. Only the last `max_finished` finished
+    jobs are kept, in memory and on disk.
+    """
+
+    STATE_FILE = "job.json"
+    EVENTS_FILE = "events.jsonl"
+    CANCEL_FILE = "cancel"
+
+    def __init__(
+        self,
+        max_concurrent=1,
+        on_success=None,
+        start_method="spawn",
+        dataset_root=None,
+        limits=None,
+        root=os.path.join("dataset", "jobs"),
+        poll_interval=0.5,
+        max_finished=100,
+    ):
+        self.max_concurrent = max_concurrent
+        self.limits = limits
+        self.dataset_root = dataset_root
+        self.on_success = on_success
+        self.root = root
+        self.poll_interval = poll_interval
+        self.max_finished = max_finished
+        self._ctx = mp.get_context(start_method)
+        self._jobs: dict[str, TrainingJob] = {}
+        self._waiting: deque[TrainingJob] = deque()
+        self._running = 0
+        self._lock = threading.Lock()
+        self._monitor = None
+
+    def submit(
+        self,
+        model_name: str,
+        csv_paths: list[str],
+        output_dir="models",
+        search="full",
+        time_budget=None,
+        dataset_ids=None,
+        promote=True,
+    ) -> TrainingJob:
+        if search not in SEARCH_MODES:
+            raise ValueError(f"search must be one of {', '.join(SEARCH_MODES)}")
+        job = TrainingJob(
+            job_id=uuid.uuid4().hex,
+            model_name=model_name,
+            csv_paths=csv_paths,
+            dataset_ids=dataset_ids or [],
+            output_dir=output_dir,
+            search=search,
+            time_budget=time_budget,
+            promote=promote,
+        )
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._save(job)
+            self._waiting.append(job)
+            self._start_waiting()
+            if self._monitor is None:
+                self._monitor = threading.Thread(target=self._monitor_jobs, daemon=True)
+                self._monitor.start()
+        return job
+
+    def get(self, job_id: str) -> TrainingJob | None:
+        """The job, from this worker's memory or from `root` if another runs it."""
+        job = self._jobs.get(job_id)
+        if job is None and job_id.isalnum():
+            job = self._load(job_id)
+        return job
+
+    def jobs(self) -> list[TrainingJob]:
+        found = dict(self._jobs)
+        if os.path.isdir(self.root):
+            for entry in os.scandir(self.root):
+                if entry.name.isalnum() and entry.name not in found:
+                    job = self._load(entry.name)
+                    if job is not None:
+                        found[job.job_id] = job
+        return sorted(found.values(), key=lambda job: job.created_at)
+
+    def cancel(self, job_id: str) -> TrainingJob | None:
+        job = self._jobs.get(job_id)
+        if job is None:
+            # another worker's job; it picks the request up from the file
+            job = self.get(job_id)
+            if job is not None and not job.done:
+                open(os.path.join(self.root, job_id, self.CANCEL_FILE), "w").close()
+            return job
+        with self._lock:
+            # checked under the lock, so a job that just finished keeps its status
+            if job.done:
+                return job
+            if job in self._waiting:
+                self._waiting.remove(job)
+                self._finish(job, "cancelled")
+                return job
+            job.status = "cancelling"
+            self._save(job)
+            process = job.process
+        if process is not None:
+            process.terminate()
+        return job
+
+    def _monitor_jobs(self):
+        # cancel requests left by other workers, and slots they released
+        while True:
+            time.sleep(self.poll_interval)
+            for job in list(self._jobs.values()):
+                if not job.done and job.status != "cancelling" and os.path.exists(
+                    os.path.join(self.root, job.job_id, self.CANCEL_FILE)
+                ):
+                    self.cancel(job.job_id)
+            with self._lock:
+                self._start_waiting()
+
+    def _acquire_slot(self):
+        """An open, exclusively locked slot file, or None if all are taken."""
+        if fcntl is None:
+            return object() if self._running < self.max_concurrent else None
+        slots = os.path.join(self.root, ".slots")
+        os.makedirs(slots, exist_ok=True)
+        for i in range(self.max_concurrent):
+            f = open(os.path.join(slots, f"{i}.lock"), "a")
+            try:
+                # released by the OS too if this worker dies
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                continue
+            return f
+        return None
+
+    @staticmethod
+    def _release_slot(job: TrainingJob):
+        if hasattr(job.slot, "close"):
+            job.slot.close()
+        job.slot = None
+
+    def _save(self, job: TrainingJob):
+        path = os.path.join(self.root, job.job_id)
+        os.makedirs(path, exist_ok=True)
+        state = {
+            **job.to_dict(),
+            "csv_paths": job.csv_paths,
+            "output_dir": job.output_dir,
+            "worker_pid": os.getpid(),
+        }
+        del state["events"]
+        tmp_path = os.path.join(path, f".{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, os.path.join(path, self.STATE_FILE))
+
+    def _record(self, job: TrainingJob, event: dict):
+        job.events.append(event)
+        with open(os.path.join(self.root, job.job_id, self.EVENTS_FILE), "a") as f:
+            f.write(json.dumps(event) + "\n")
+
+    def _load(self, job_id: str) -> TrainingJob | None:
+        path = os.path.join(self.root, job_id)
+        try:
+            with open(os.path.join(path, self.STATE_FILE)) as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        worker_pid = state.pop("worker_pid", None)
+        events = []
+        try:
+            with open(os.path.join(path, self.EVENTS_FILE)) as f:
+                # a line still being written has no newline yet
+                events = [json.loads(line) for line in f if line.endswith("\n")]
+        except FileNotFoundError:
+            pass
+        job = TrainingJob(**state, events=events)
+        if not job.done and not _pid_alive(worker_pid):
+            job.status, job.error = "failed", "the worker running the job exited"
+            job.events.append({"event": "failed", "time": time.time(), "error": job.error})
+        return job
+
+    def _start_waiting(self):
+        # caller holds self._lock
+        while self._waiting:
+            slot = self._acquire_slot()
+            if slot is None:
+                break
+            job = self._waiting.popleft()
+            job.slot = slot
+            events = self._ctx.Queue()
+            job.process = self._ctx.Process(
+                target=run_training,
+                args=(job.model_name, job.csv_paths, job.output_dir, events),
+                kwargs={
+                    "search": job.search,
+                    "time_budget": job.time_budget,
+                    "dataset_ids": job.dataset_ids,
+                    "dataset_root": self.dataset_root,
+                    "promote": job.promote,
+                    "limits": self.limits,
+                },
+                daemon=True,
+            )
+            job.status = "running"
+            job.started_at = time.time()
+            self._save(job)
+            job.process.start()
+            self._running += 1
+            threading.Thread(
+                target=self._watch, args=(job, events), daemon=True
+            ).start()
+
+    def _watch(self, job: TrainingJob, events):
+        status, error = None, None
+        while status is None:
+            alive = job.process.is_alive()
+            try:
+                event = events.get(timeout=0.5)
+            except Exception:
+                # only give up once the queue was empty after the child exited
+                if not alive:
+                    if job.status == "cancelling":
+                        status = "cancelled"
+                    else:
+                        status, error = "failed", "training process exited unexpectedly"
+                continue
+            if event["event"] in ("succeeded", "failed"):
+                status, error = event["event"], event.get("error")
+            else:
+                self._record(job, event)
+            if event["event"] == "resources":
+                job.resources = {k: v for k, v in event.items() if k not in ("event", "time")}
+                self._save(job)
+            if event["event"] == "saved":
+                job.version = event["version"]
+                self._save(job)
+            if event["event"] == "stage_finished":
+                metrics.observe("training_stage_seconds", event["seconds"], stage=event["stage"])
+        job.process.join()
+        job.process = None
+        if status == "succeeded" and self.on_success is not None:
+            try:
+                self.on_success(job)
+            except Exception as e:
+                status, error = "failed", f"model saved but reload failed: {e}"
+        with self._lock:
+            self._running -= 1
+            self._release_slot(job)
+            self._finish(job, status, error)
+            self._start_waiting()
+
+    def _finish(self, job: TrainingJob, status: str, error=None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        # the event first, so a worker that reads the job as done also has it
+        self._record(job, {"event": status, "time": job.finished_at, "error": error})
+        self._save(job)
+        self._expire()
+
+    def _expire(self):
+        # caller holds self._lock; drops the oldest finished jobs of every worker
+        finished = sorted(
+            (job for job in self.jobs() if job.done),
+            key=lambda job: job.finished_at or job.created_at,
+            reverse=True,
+        )
+        for job in finished[self.max_finished :]:
+            self._jobs.pop(job.job_id, None)
+            shutil.rmtree(os.path.join(self.root, job.job_id), ignore_errors=True)
@@ -0,0 +1,854 @@
+from dataclasses import dataclass, field, replace
+from utils.batch_api import NPY, UnsupportedMediaType
+from utils.constants import Constants
+from math import erfc, sqrt, pi
+from io import BytesIO
+import numpy as np
+import asyncio
+import copy
+import os
+
+CSV = "text/csv"
+NPZ = "application/x-npz"
+LIGHT_CURVE_MEDIA_TYPES = (CSV, NPY, NPZ)
+
+
+class TooManyPoints(ValueError):
+    def __init__(self, limit: int):
+        super().__init__(f"At most {limit} points per request")
+        self.limit = limit
+
+# accepted column names, first match wins (case-insensitive)
+TIME_COLUMNS = ("time", "t", "bjd", "btjd", "bkjd")
+FLUX_COLUMNS = ("flux", "pdcsap_flux", "sap_flux")
+FLUX_ERR_COLUMNS = ("flux_err", "pdcsap_flux_err", "sap_flux_err")
+STAR_COLUMNS = ("star", "star_id", "kepid", "kepoi_name", "tic_id")
+# per-star stellar parameters in CSVs, named like the KOI table
+STELLAR_COLUMNS = {"radius": "koi_srad", "mass": "koi_smass", "teff": "koi_steff"}
+
+SOLAR_TEFF = 5772.0
+EARTH_RADII_PER_SOLAR_RADIUS = 109.076
+SOLAR_RADII_PER_AU = 215.032
+DAYS_PER_YEAR = 365.25
+
+
+@dataclass
+class StellarParams:
+    """Host star properties in solar units.
+
+    A light curve cannot measure them, yet planet radius, semi-major axis,
+    impact parameter and insolation all scale with them. Missing errors
+    default to 10% of the value.
+    """
+
+    radius: float = 1.0
+    mass: float | None = None
+    teff: float = SOLAR_TEFF
+    radius_err: float | None = None
+    mass_err: float | None = None
+    teff_err: float = 100.0
+
+    def __post_init__(self):
+        if self.mass is None:
+            # main-sequence mass-radius relation, R ~ M^0.8
+            self.mass = self.radius**1.25
+        if self.radius_err is None:
+            self.radius_err = 0.1 * self.radius
+        if self.mass_err is None:
+            self.mass_err = 0.1 * self.mass
+
+
+@dataclass
+class LightCurve:
+    star: str
+    time: np.ndarray
+    flux: np.ndarray
+    flux_err: np.ndarray | None = None
+    stellar: StellarParams = field(default_factory=StellarParams)
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    @property
+    def baseline(self) -> float:
+        return float(self.time[-1] - self.time[0]) if len(self.time) else 0.0
+
+
+def _column(columns, candidates):
+    lowered = {str(name).lower(): name for name in columns}
+    return next((lowered[name] for name in candidates if name in lowered), None)
+
+
+def _curve(star, time, flux, flux_err=None, stellar=None) -> LightCurve:
+    """A light curve sorted by time, without non-finite points."""
+    time = np.asarray(time, dtype=np.float64)
+    flux = np.asarray(flux, dtype=np.float64)
+    if time.ndim != 1 or time.shape != flux.shape:
+        raise ValueError(f"Star {star}: time and flux must be 1-D arrays of the same length")
+    keep = np.isfinite(time) & np.isfinite(flux)
+    if flux_err is not None:
+        flux_err = np.asarray(flux_err, dtype=np.float64)
+        keep &= np.isfinite(flux_err) & (flux_err > 0)
+    rows = np.flatnonzero(keep)
+    rows = rows[np.argsort(time[rows], kind="stable")]
+    return LightCurve(
+        star=str(star),
+        time=time[rows],
+        flux=flux[rows],
+        flux_err=None if flux_err is None else flux_err[rows],
+        stellar=stellar or StellarParams(),
+    )
+
+
+def read_light_curves(
+    body: bytes,
+    content_type: str,
+    stellar: StellarParams | None = None,
+    max_points=Constants.LIGHTCURVE_MAX_POINTS,
+) -> list[LightCurve]:
+    """Decode a request body into one light curve per star.
+
+    CSV bodies need a time and a flux column (flux_err is optional) and may
+    hold many stars, grouped by a star/kepid column; `koi_srad`, `koi_smass`
+    and `koi_steff` columns override `stellar` per star. `.npy` bodies are
+    one star as an (n, 2) or (n, 3) array of time, flux[, flux_err]. `.npz`
+    archives hold equal-length `time` and `flux` arrays, plus optional
+    `flux_err` and `star`.
+
+    Bodies with more than `max_points` points raise `TooManyPoints` before
+    they are decoded: arrays are checked from their `.npy` headers and CSVs
+    are read only up to one row past the limit.
+    """
+    stellar = stellar or StellarParams()
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type == NPY:
+        _check_points(BytesIO(body), max_points)
+        array = np.load(BytesIO(body), allow_pickle=False)
+        if array.ndim != 2 or array.shape[1] not in (2, 3):
+            raise ValueError(f"Expected an (n, 2) or (n, 3) array, got shape {array.shape}")
+        flux_err = array[:, 2] if array.shape[1] == 3 else None
+        return [_curve("0", array[:, 0], array[:, 1], flux_err, stellar)]
+    if media_type == NPZ:
+        with np.load(BytesIO(body), allow_pickle=False) as archive:
+            if "time" in archive.files:
+                with archive.zip.open("time.npy") as f:
+                    _check_points(f, max_points)
+            arrays = {name: archive[name] for name in archive.files}
+        missing = {"time", "flux"} - set(arrays)
+        if missing:
+            raise ValueError(f"Missing arrays: {', '.join(sorted(missing))}")
+        stars = arrays.get("star", np.zeros(len(arrays["time"]), dtype=np.int64))
+        return _split_stars(stars, arrays["time"], arrays["flux"], arrays.get("flux_err"), stellar)
+    if media_type == CSV:
+        return _read_csv(body, stellar, max_points)
+    raise UnsupportedMediaType(
+        f"Unsupported content type {media_type!r}; "
+        f"use one of {', '.join(LIGHT_CURVE_MEDIA_TYPES)}"
+    )
+
+
+def _check_points(f, max_points):
+    # the shape is in the header, so nothing past it is read
+    version = np.lib.format.read_magic(f)
+    read_header = (
+        np.lib.format.read_array_header_1_0
+        if version == (1, 0)
+        else np.lib.format.read_array_header_2_0
+    )
+    shape = read_header(f)[0]
+    if shape and shape[0] > max_points:
+        raise TooManyPoints(max_points)
+
+
+def _split_stars(stars, time, flux, flux_err, stellar, overrides=None) -> list[LightCurve]:
+    stars = np.asarray(stars)
+    if not len(stars) == len(time) == len(flux):
+        raise ValueError("time, flux and star must have one entry per point")
+    names, first, inverse = np.unique(stars, return_index=True, return_inverse=True)
+    if len(names) > Constants.LIGHTCURVE_MAX_STARS:
+        raise ValueError(f"At most {Constants.LIGHTCURVE_MAX_STARS} stars per request")
+    # rows of every star, contiguous after a stable sort by star
+    order = np.argsort(inverse, kind="stable")
+    ends = np.cumsum(np.bincount(inverse, minlength=len(names)))
+    starts = np.r_[0, ends[:-1]]
+    curves = []
+    for i, name in enumerate(names):
+        rows = order[starts[i] : ends[i]]
+        curves.append(
+            _curve(
+                name,
+                time[rows],
+                flux[rows],
+                None if flux_err is None else flux_err[rows],
+                _star_params(stellar, overrides or {}, first[i]),
+            )
+        )
+    return curves
+
+
+def _star_params(stellar: StellarParams, overrides: dict, row: int) -> StellarParams:
+    values = {
+        key: float(column[row]) for key, column in overrides.items() if np.isfinite(column[row])
+    }
+    if not values:
+        return stellar
+    # errors (and a missing mass) follow the overridden values
+    defaults = {"radius_err": None, "mass_err": None}
+    if "mass" not in values:
+        defaults["mass"] = None
+    return replace(stellar, **defaults, **values)
+
+
+def _read_csv(body: bytes, stellar: StellarParams, max_points: int) -> list[LightCurve]:
+    import pandas as pd
+
+    df = pd.read_csv(BytesIO(body), comment="#", nrows=max_points + 1)
+    if len(df) > max_points:
+        raise TooManyPoints(max_points)
+    time_col = _column(df.columns, TIME_COLUMNS)
+    flux_col = _column(df.columns, FLUX_COLUMNS)
+    if time_col is None or flux_col is None:
+        raise ValueError(
+            f"Light curve CSVs need a time column ({', '.join(TIME_COLUMNS)}) "
+            f"and a flux column ({', '.join(FLUX_COLUMNS)})"
+        )
+
+    def numeric(column):
+        return pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=np.float64)
+
+    err_col = _column(df.columns, FLUX_ERR_COLUMNS)
+    star_col = _column(df.columns, STAR_COLUMNS)
+    overrides = {}
+    for key, name in STELLAR_COLUMNS.items():
+        column = _column(df.columns, (name,))
+        if column is not None:
+            overrides[key] = numeric(column)
+    return _split_stars(
+        df[star_col].astype(str).to_numpy() if star_col else np.zeros(len(df), dtype=np.int64),
+        numeric(time_col),
+        numeric(flux_col),
+        numeric(err_col) if err_col else None,
+        stellar,
+        overrides,
+    )
+
+
+@dataclass
+class PreparedCurve:
+    """A detrended light curve: relative flux `y` (0 out of transit) and
+    per-point inverse variances `w`."""
+
+    time: np.ndarray
+    y: np.ndarray
+    w: np.ndarray
+
+
+def running_median(
+    time: np.ndarray, values: np.ndarray, window: float, steps=4, at: np.ndarray | None = None
+) -> np.ndarray:
+    """Median of `values` over `window`-day windows every `window / steps` days,
+    interpolated at `at` (default `time`).
+
+    Each of the `steps` shifted window grids takes one lexsort to find the
+    median of every window at once.
+    """
+    centres, medians = [], []
+    for offset in np.arange(steps) * window / steps:
+        bins = np.floor((time - time[0] + offset) / window).astype(np.int64)
+        order = np.lexsort((values, bins))
+        sorted_values = values[order]
+        starts = np.flatnonzero(np.r_[True, np.diff(bins[order]) != 0])
+        counts = np.diff(np.r_[starts, len(values)])
+        medians.append(
+            (sorted_values[starts + (counts - 1) // 2] + sorted_values[starts + counts // 2]) / 2
+        )
+        centres.append(np.bincount(bins, weights=time)[np.unique(bins)] / counts)
+    centres = np.concatenate(centres)
+    order = np.argsort(centres, kind="stable")
+    return np.interp(time if at is None else at, centres[order], np.concatenate(medians)[order])
+
+
+def bin_in_time(time, y, w, width):
+    """Inverse-variance weighted means of `y` in `width`-day bins."""
+    bins = np.floor((time - time[0]) / width).astype(np.int64)
+    total = np.bincount(bins, weights=w)
+    occupied = total > 0
+    total = total[occupied]
+    return (
+        np.bincount(bins, weights=w * time)[occupied] / total,
+        np.bincount(bins, weights=w * y)[occupied] / total,
+        total,
+    )
+
+
+def prepare(curve: LightCurve, detrend_window: float, clip_sigma=5.0, mask=None) -> PreparedCurve:
+    """Divide out a running median, drop upward outliers (flares, cosmic rays)
+    and derive per-point weights from flux_err, or from the scatter.
+
+    Points in `mask` (e.g. known transits) are left out of the median so
+    they do not drag the trend down with them.
+    """
+    if mask is None or mask.all():
+        trend = running_median(curve.time, curve.flux, detrend_window)
+    else:
+        keep = ~mask
+        trend = running_median(curve.time[keep], curve.flux[keep], detrend_window, at=curve.time)
+    y = curve.flux / trend - 1.0
+    scatter = 1.4826 * np.median(np.abs(y - np.median(y))) or np.std(y) or 1.0
+    keep = np.isfinite(y) & (y < clip_sigma * scatter)
+    if curve.flux_err is not None:
+        sigma = (curve.flux_err / trend)[keep]
+    else:
+        sigma = np.full(int(keep.sum()), scatter)
+    return PreparedCurve(curve.time[keep], y[keep], 1.0 / sigma**2)
+
+
+def _best_boxes(CW, CS, n_bins, width, duration_bins, max_duty, oversample) -> tuple:
+    """Strongest dip per row from cumulative phase-binned weights `CW` and
+    weighted fluxes `CS` (each row padded past `width` so boxes may wrap)."""
+    k = len(CW)
+    best_power = np.zeros(k)
+    best_depth = np.zeros(k)
+    best_phase = np.zeros(k)
+    best_k = np.ones(k, dtype=np.int64)
+    rows_k = np.arange(k)
+    for kd in duration_bins:
+        allowed = kd <= max_duty * n_bins
+        if not allowed.any():
+            continue
+        # long boxes are tried every `stride` bins, a fraction of their length
+        stride = max(1, int(kd) // oversample)
+        r = CW[:, kd : kd + width : stride] - CW[:, :width:stride]
+        s = CS[:, kd : kd + width : stride] - CS[:, :width:stride]
+        # power = min(s, 0)^2 / (r (1 - r)), in place: only dips count, and
+        # empty and all-in boxes have s == 0, so power 0
+        power = np.minimum(s, 0.0, out=s)
+        np.square(power, out=power)
+        denominator = np.square(r)
+        np.subtract(r, denominator, out=denominator)
+        denominator += 1e-30
+        power /= denominator
+        j = power.argmax(axis=1)
+        p = np.where(allowed, power[rows_k, j], 0.0)
+        better = p > best_power
+        start = j * stride
+        rj = CW[rows_k, start + kd] - CW[rows_k, start]
+        sj = CS[rows_k, start + kd] - CS[rows_k, start]
+        best_power = np.where(better, p, best_power)
+        best_depth = np.where(better, -sj / (rj * (1 - rj) + 1e-30), best_depth)
+        best_phase = np.where(better, j * stride + kd / 2, best_phase)
+        best_k = np.where(better, kd, best_k)
+    return best_power, best_depth, best_phase, best_k
+
+
+def _take_columns(a: np.ndarray, columns: np.ndarray) -> np.ndarray:
+    """`np.take_along_axis(a, columns, axis=-1)` as one flat `take`, several
+    times faster for gathers of this size."""
+    a = np.ascontiguousarray(a)
+    width = a.shape[-1]
+    rows = np.arange(a.size // width).reshape(*a.shape[:-1], 1) * width
+    return a.ravel().take(rows + columns)
+
+
+def _cumulative(W, S) -> tuple[np.ndarray, np.ndarray]:
+    # float32 halves the memory traffic of the box loop; box sums are
+    # differences of cumulative sums bounded by 1, so it loses little
+    k, width = W.shape
+    CW = np.zeros((k, width + 1), dtype=np.float32)
+    CS = np.zeros((k, width + 1), dtype=np.float32)
+    np.cumsum(W, axis=1, out=CW[:, 1:])
+    np.cumsum(S, axis=1, out=CS[:, 1:])
+    return CW, CS
+
+
+def _normalise(y, w) -> tuple[np.ndarray, np.ndarray, float]:
+    total = np.sum(w)
+    wn = w / total
+    return wn, wn * (y - np.sum(wn * y)), float(total)
+
+
+def bls_power(
+    time, y, w, periods, durations, bin_width, max_duty=0.25, oversample=3
+) -> dict[str, np.ndarray]:
+    """Box least squares over arbitrary `periods`, every duration, every epoch.
+
+    For each period the data are folded into phase bins of about
+    `bin_width` days with one `bincount`; cumulative sums then give the
+    in-transit weight and flux of every (epoch, duration) box at once.
+    Periods are folded in blocks, so the Python loop runs once per block
+    and duration rather than per period. Returns, per period, the best
+    power (delta chi-squared), depth, mid-transit time and duration.
+    """
+    wn, wy, total = _normalise(y, w)
+    t_ref = time[0]
+    time = time - t_ref
+    duration_bins = np.unique(np.maximum(1, np.round(np.asarray(durations) / bin_width))).astype(np.int64)
+    max_k = int(duration_bins.max())
+    n = len(time)
+
+    best = {name: np.zeros(len(periods)) for name in ("power", "depth", "t0", "duration")}
+    rows = max(1, 2_000_000 // max(n, 1))
+    tiled_w, tiled_wy = np.tile(wn, rows), np.tile(wy, rows)
+    for start in range(0, len(periods), rows):
+        P = periods[start : start + rows]
+        k = len(P)
+        n_bins = np.maximum(np.ceil(P / bin_width).astype(np.int64), 2)
+        width = int(n_bins.max())
+        # phase bin of every (period, point), offset so each period has its
+        # own row; floor-then-modulo in int32 is several times cheaper than a
+        # float modulo
+        index = np.multiply.outer(n_bins / P, time).astype(np.int32)
+        np.remainder(index, n_bins.astype(np.int32)[:, np.newaxis], out=index)
+        index += (np.arange(k, dtype=np.int32) * width)[:, np.newaxis]
+        flat = index.ravel()
+        W = np.bincount(flat, tiled_w[: k * n], k * width).reshape(k, width)
+        S = np.bincount(flat, tiled_wy[: k * n], k * width).reshape(k, width)
+        # boxes may wrap around phase 1 -> 0; windows starting past a row's
+        # own bin count repeat earlier ones and are harmless
+        wrap = np.arange(width + max_k)[np.newaxis, :] % n_bins[:, np.newaxis]
+        CW, CS = _cumulative(_take_columns(W, wrap), _take_columns(S, wrap))
+        power, depth, phase, kd = _best_boxes(
+            CW, CS, n_bins, width, duration_bins, max_duty, oversample
+        )
+        window = slice(start, start + k)
+        best["power"][window] = power * total
+        best["depth"][window] = depth
+        best["t0"][window] = t_ref + (phase / n_bins % 1.0) * P
+        best["duration"][window] = kd * P / n_bins
+    return best
+
+
+def ffa(x: np.ndarray, p=None) -> np.ndarray:
+    """Fast folding algorithm (Staelin 1969) over the last two axes.
+
+    `x[..., i, j]` is bin `j` of the `i`-th period-long row of an evenly
+    sampled series, with a power-of-two number of rows `m`. Row `s` of the
+    result is the sum of all rows with row `i` shifted left by about
+    `i * s / (m - 1)` bins, i.e. the series folded at `p + s / (m - 1)`
+    bins. All `m` folds cost `m * p * log2(m)` additions instead of the
+    `m * m * p` of folding each trial period separately.
+
+    `p` (broadcast against the leading axes) lets rows of different series
+    use only their first `p` columns; it defaults to the full width.
+    """
+    *lead, m, width = x.shape
+    p = np.asarray(width if p is None else p)
+    cols = np.arange(width)
+    n = 1
+    while n < m:
+        blocks = x.reshape(*lead, m // (2 * n), 2, n, width)
+        head, tail = blocks[..., 0, :, :], blocks[..., 1, :, :]
+        # fold pairs of n-row blocks into 2n-row blocks: shift s of the pair
+        # is shift ~s/2 of both halves, the tail rolled by ~s/2 more bins
+        s = np.arange(2 * n)
+        inner = np.rint(s * (n - 1) / max(2 * n - 1, 1)).astype(np.intp)
+        roll = np.rint(s * n / (2 * n - 1)).astype(np.intp)
+        shifted = (cols + roll[:, np.newaxis]) % p[..., np.newaxis, np.newaxis, np.newaxis]
+        x = head[..., inner, :] + _take_columns(tail[..., inner, :], shifted)
+        n *= 2
+    return x.reshape(*lead, m, width)
+
+
+def ffa_power(
+    time, y, w, base_periods, durations, bin_width, max_duty=0.25, oversample=2
+) -> dict[str, np.ndarray]:
+    """Box least squares on every period from `base_periods[0]` to
+    `base_periods[-1] + 1` bins of `bin_width` days.
+
+    The data are binned onto an even grid once; for each whole number of
+    bins `p` the series is cut into rows of `p` bins and `ffa` folds it at
+    all periods between `p` and `p + 1` bins that drift apart by at most a
+    bin over the baseline. Base periods with the same power-of-two row
+    count are folded and searched together in blocks. Returns the same
+    per-period arrays as `bls_power`, plus the trial `period`s themselves.
+    """
+    wn, wy, total = _normalise(y, w)
+    t_ref = time[0]
+    index = np.floor((time - t_ref) / bin_width).astype(np.int64)
+    n = int(index[-1]) + 1
+    # one spare zero bin for the padding rows below to point at
+    series = np.zeros((2, n + 1), dtype=np.float32)
+    series[0, :n] = np.bincount(index, wn, n)
+    series[1, :n] = np.bincount(index, wy, n)
+    duration_bins = np.unique(np.maximum(1, np.round(np.asarray(durations) / bin_width))).astype(np.int64)
+    max_k = int(duration_bins.max())
+
+    base_periods = np.asarray(base_periods, dtype=np.int64)
+    rows = -(-n // base_periods)
+    base_periods, rows = base_periods[rows >= 2], rows[rows >= 2]
+    row_counts = 1 << np.ceil(np.log2(rows)).astype(np.int64)
+    results = {name: [] for name in ("period", "power", "depth", "t0", "duration")}
+    for m in np.unique(row_counts):
+        group = base_periods[row_counts == m]
+        # small blocks keep the widths within one block close together
+        block = max(1, 500_000 // (2 * int(m) * int(group.max())))
+        for start in range(0, len(group), block):
+            p = group[start : start + block]
+            width = int(p.max())
+            cols = np.arange(width)
+            # bin i * p + j of the series goes to row i, column j
+            flat = np.arange(m)[:, np.newaxis] * p[:, np.newaxis, np.newaxis] + cols
+            flat[(flat >= n) | (cols >= p[:, np.newaxis, np.newaxis])] = n
+            folded = ffa(series[:, flat].transpose(1, 0, 2, 3), p[:, np.newaxis])
+            n_bins = np.repeat(p, m)
+            wrap = np.arange(width + max_k) % n_bins[:, np.newaxis]
+            W = folded[:, 0].reshape(-1, width)
+            S = folded[:, 1].reshape(-1, width)
+            CW, CS = _cumulative(_take_columns(W, wrap), _take_columns(S, wrap))
+            power, depth, phase, kd = _best_boxes(
+                CW, CS, n_bins, width, duration_bins, max_duty, oversample
+            )
+            results["period"].append(((p[:, np.newaxis] + np.arange(m) / (m - 1)).ravel()) * bin_width)
+            results["power"].append(power * total)
+            results["depth"].append(depth)
+            results["t0"].append(t_ref + (phase % n_bins) * bin_width)
+            results["duration"].append(kd * bin_width)
+    if not results["period"]:
+        return {name: np.empty(0) for name in results}
+    order = np.argsort(np.concatenate(results["period"]), kind="stable")
+    return {name: np.concatenate(arrays)[order] for name, arrays in results.items()}
+
+
+@dataclass
+class Transit:
+    """Best transit found in one light curve and the features derived from it."""
+
+    star: str
+    period: float
+    t0: float
+    duration: float
+    depth: float
+    snr: float
+    n_points: int
+    features: dict = field(default_factory=dict)
+
+    @property
+    def detected(self) -> bool:
+        return self.snr >= Constants.LIGHTCURVE_MIN_SNR
+
+    def feature_vector(self) -> list[float]:
+        return [self.features[name] for name in Constants.FEATURES_REQUIRED_TO_PREDICT]
+
+    def to_dict(self) -> dict:
+        return {
+            "star": self.star,
+            "detected": self.detected,
+            "n_points": self.n_points,
+            "period": self.period,
+            "t0": self.t0,
+            "duration_hours": self.duration * 24,
+            "depth_ppm": self.depth * 1e6,
+            "snr": self.snr,
+            "features": self.features,
+        }
+
+
+def _in_transit(time, period, t0, duration):
+    return np.abs((time - t0 + period / 2) % period - period / 2) < duration / 2
+
+
+def _box_depth(y, w, inside) -> tuple[float, float]:
+    """Depth of a box and its error from inverse-variance weights."""
+    w_in, w_out = w[inside].sum(), w[~inside].sum()
+    if w_in == 0 or w_out == 0:
+        return 0.0, float("inf")
+    depth = np.sum(w[~inside] * y[~inside]) / w_out - np.sum(w[inside] * y[inside]) / w_in
+    return float(depth), float(np.sqrt(1 / w_in + 1 / w_out))
+
+
+def transit_features(curve: PreparedCurve, stellar: StellarParams, period, t0, duration) -> dict:
+    """The classifier's KOI features for a box transit.
+
+    Timing errors follow Carter et al. (2008) with the ingress estimated as
+    duration * Rp/R*; the period error comes from a linear ephemeris over
+    the observed transits. Odd-even depth agreement is reported as a
+    two-sided probability (1 means the depths agree).
+    """
+    inside = _in_transit(curve.time, period, t0, duration)
+    depth, depth_err = _box_depth(curve.y, curve.w, inside)
+    depth = max(depth, 0.0)
+    epochs = np.round((curve.time - t0) / period).astype(np.int64)
+    n_transits = len(np.unique(epochs[inside]))
+    # scatter of transit-long averages out of transit: correlated noise the
+    # detrending left behind (like Kepler's CDPP) caps the SNR too
+    outside = ~inside
+    _, means, _ = bin_in_time(curve.time[outside], curve.y[outside], curve.w[outside], duration)
+    if len(means) > 2 and n_transits:
+        red = 1.4826 * np.median(np.abs(means - np.median(means))) / sqrt(n_transits)
+        depth_err = max(depth_err, float(red))
+    snr = depth / depth_err if depth_err > 0 else 0.0
+
+    odd = inside & (epochs % 2 == 1)
+    even = inside & (epochs % 2 == 0)
+    depth_odd, err_odd = _box_depth(curve.y, curve.w, odd)
+    depth_even, err_even = _box_depth(curve.y, curve.w, even)
+    if np.isfinite(err_odd) and np.isfinite(err_even):
+        z = abs(depth_odd - depth_even) / sqrt(err_odd**2 + err_even**2)
+        odd_even = erfc(z / sqrt(2))
+    else:
+        odd_even = 1.0
+
+    ratio = sqrt(depth)
+    q = max(snr, 1e-6)
+    ingress = duration * ratio
+    t0_err = duration / q * sqrt(max(ingress, 1e-9) / (2 * duration))
+    duration_err = duration / q * sqrt(2 * max(ingress, 1e-9) / duration)
+    if n_transits > 1:
+        single = t0_err * sqrt(n_transits)
+        period_err = single * sqrt(12 / (n_transits * (n_transits**2 - 1)))
+    else:
+        period_err = period
+
+    sma = (stellar.mass * (period / DAYS_PER_YEAR) ** 2) ** (1 / 3)
+    a_over_r = sma * SOLAR_RADII_PER_AU / stellar.radius
+    impact_sq = (1 + ratio) ** 2 - (pi * duration * a_over_r / period) ** 2
+    impact = sqrt(max(impact_sq, 0.0))
+    prad = ratio * stellar.radius * EARTH_RADII_PER_SOLAR_RADIUS
+    depth_rel_err = depth_err / (2 * depth) if depth > 0 else 0.0
+    prad_err = prad * sqrt(depth_rel_err**2 + (stellar.radius_err / stellar.radius) ** 2)
+    insol = (stellar.teff / SOLAR_TEFF) ** 4 * stellar.radius**2 / sma**2
+    insol_err = insol * sqrt(
+        (2 * stellar.radius_err / stellar.radius) ** 2
+        + (4 * stellar.teff_err / stellar.teff) ** 2
+        + (2 / 3 * stellar.mass_err / stellar.mass) ** 2
+    )
+    return {
+        "koi_period": period,
+        "koi_period_err1": period_err,
+        "koi_period_err2": -period_err,
+        "koi_time0bk_err1": t0_err,
+        "koi_time0bk_err2": -t0_err,
+        "koi_time0_err1": t0_err,
+        "koi_time0_err2": -t0_err,
+        "koi_impact": impact,
+        "koi_duration": duration * 24,
+        "koi_duration_err1": duration_err * 24,
+        "koi_duration_err2": -duration_err * 24,
+        "koi_depth": depth * 1e6,
+        "koi_prad": prad,
+        "koi_prad_err1": prad_err,
+        "koi_sma": sma,
+        "koi_insol_err1": insol_err,
+        "koi_insol_err2": -insol_err,
+        "koi_model_snr": snr,
+        "koi_num_transits": n_transits,
+        "koi_bin_oedp_sig": odd_even,
+        "koi_srad": stellar.radius,
+    }
+
+
+class TransitSearch:
+    """Box least squares transit search feeding `ExoPlanetsClassifier`.
+
+    Each light curve is detrended with a running median and searched on an
+    even grid of bins as long as the shortest trial duration: `ffa_power`
+    covers every period whose phase drifts by less than a bin across the
+    baseline. The strongest `refine_peaks` peaks are searched again around
+    their period with `refine_oversample` times finer bins, and the features
+    come from the winner after detrending once more with its transits
+    masked.
+
+    `search()` splits the period ranges of all curves into one slice per
+    pool worker (`run` is e.g. `InferencePool.run` of a process pool), so a
+    single long curve and a batch of many stars both use every core.
+    """
+
+    # the span of trial durations Kepler's pipeline searched
+    DURATIONS_HOURS = (1.5, 2.0, 3.0, 4.5, 6.0, 9.0, 12.0, 15.0)
+
+    def __init__(
+        self,
+        min_period=0.5,
+        max_period=None,
+        durations_hours=DURATIONS_HOURS,
+        oversample=1,
+        refine_peaks=5,
+        refine_oversample=3,
+        detrend_window=1.0,
+        min_points=100,
+    ):
+        self.min_period = min_period
+        self.max_period = max_period
+        self.durations = np.asarray(durations_hours, dtype=np.float64) / 24
+        self.oversample = oversample
+        self.refine_peaks = refine_peaks
+        self.refine_oversample = refine_oversample
+        self.detrend_window = detrend_window
+        self.min_points = min_points
+
+    @classmethod
+    def from_env(cls):
+        max_period = os.getenv("EXOVISION_LIGHTCURVE_MAX_PERIOD")
+        return cls(
+            min_period=float(os.getenv("EXOVISION_LIGHTCURVE_MIN_PERIOD", "0.5")),
+            max_period=float(max_period) if max_period else None,
+            oversample=int(os.getenv("EXOVISION_LIGHTCURVE_OVERSAMPLE", "1")),
+        )
+
+    def with_periods(self, min_period=None, max_period=None) -> "TransitSearch":
+        search = copy.copy(self)
+        if min_period is not None:
+            search.min_period = min_period
+        if max_period is not None:
+            search.max_period = max_period
+        return search
+
+    @property
+    def bin_width(self) -> float:
+        return float(self.durations.min()) / self.oversample
+
+    def base_periods(self, baseline: float) -> np.ndarray:
+        """Whole numbers of bins `p` whose `ffa_power` trials, `p` to `p + 1`
+        bins, cover the period range; two transits must fit the baseline."""
+        max_period = baseline / 2
+        if self.max_period is not None:
+            max_period = min(max_period, self.max_period)
+        low = max(1, int(self.min_period / self.bin_width))
+        high = int(max_period / self.bin_width)
+        return np.arange(low, high + 1) if max_period > self.min_period else np.empty(0, np.int64)
+
+    def check(self, curve: LightCurve):
+        if len(curve) < self.min_points:
+            raise ValueError(
+                f"Star {curve.star}: need at least {self.min_points} points, got {len(curve)}"
+            )
+        if len(self.base_periods(curve.baseline)) == 0:
+            raise ValueError(
+                f"Star {curve.star}: a {curve.baseline:.2f} day baseline cannot show "
+                f"two transits of period >= {self.min_period} days"
+            )
+
+    def prepare(self, curve: LightCurve, mask=None) -> PreparedCurve:
+        return prepare(curve, self.detrend_window, mask=mask)
+
+    def split(self, curves: list[LightCurve], n_tasks: int) -> list[list[tuple]]:
+        """(curve index, first, last base period) slices in up to `n_tasks`
+        groups of about equal work."""
+        n_tasks = max(n_tasks, 1)
+        periods, costs = [], []
+        for curve in curves:
+            p = self.base_periods(curve.baseline)
+            rows = np.ceil((curve.baseline / self.bin_width + 1) / p)
+            m = 2.0 ** np.ceil(np.log2(np.maximum(rows, 2)))
+            periods.append(p)
+            # ffa levels plus the box search
+            costs.append(m * p * (np.log2(m) + len(self.durations)))
+        cost = np.concatenate(costs)
+        before = np.cumsum(cost) - cost
+        task_of = np.minimum((before / (cost.sum() / n_tasks)).astype(np.int64), n_tasks - 1)
+        tasks = [[] for _ in range(n_tasks)]
+        offset = 0
+        for i, p in enumerate(periods):
+            ids = task_of[offset : offset + len(p)]
+            offset += len(p)
+            starts = np.flatnonzero(np.r_[True, np.diff(ids) != 0])
+            for start, stop in zip(starts, np.r_[starts[1:], len(p)]):
+                tasks[ids[start]].append((i, int(p[start]), int(p[stop - 1])))
+        return [task for task in tasks if task]
+
+    async def search(self, curves: list[LightCurve], run, workers=1) -> list[Transit]:
+        for curve in curves:
+            self.check(curve)
+        tasks = self.split(curves, workers)
+        results = await asyncio.gather(
+            *(
+                run(periodogram_task, self, {i: curves[i] for i, _, _ in task}, task)
+                for task in tasks
+            )
+        )
+        parts = [[] for _ in curves]
+        for task, slices in zip(tasks, results):
+            for (i, first, _), values in zip(task, slices):
+                parts[i].append((first, values))
+        spectra = [
+            {
+                name: np.concatenate([values[name] for _, values in sorted(part, key=lambda x: x[0])])
+                for name in ("period", "power", "depth", "t0", "duration")
+            }
+            for part in parts
+        ]
+
+        # refine and characterise, one task per group of curves
+        groups = np.array_split(np.arange(len(curves)), min(len(curves), max(workers, 1)))
+        refined = await asyncio.gather(
+            *(
+                run(refine_task, self, [curves[i] for i in group], [spectra[i] for i in group])
+                for group in groups
+            )
+        )
+        return [transit for group in refined for transit in group]
+
+    def peaks(self, periods, power) -> list[int]:
+        """Indices of the strongest peaks, at least 1% apart in period."""
+        chosen = []
+        for i in np.argsort(power)[::-1]:
+            if len(chosen) == self.refine_peaks or power[i] <= 0:
+                break
+            if all(abs(periods[i] - periods[j]) > 0.01 * periods[j] for j in chosen):
+                chosen.append(int(i))
+        return chosen
+
+    def refine(self, curve: LightCurve, spectrum: dict) -> Transit:
+        prepared = self.prepare(curve)
+        bin_width = self.bin_width / self.refine_oversample
+        time, y, w = bin_in_time(prepared.time, prepared.y, prepared.w, bin_width)
+        candidates = []
+        for i in self.peaks(spectrum["period"], spectrum["power"]):
+            # the search trials are about bin_width * period / baseline apart
+            period = spectrum["period"][i]
+            spacing = self.bin_width * period / curve.baseline
+            fine = np.linspace(
+                period - 2 * spacing, period + 2 * spacing, 4 * self.refine_oversample + 1
+            )
+            durations = np.clip(
+                spectrum["duration"][i] * np.array([0.5, 0.7, 0.85, 1.0, 1.2, 1.4, 2.0]),
+                self.durations.min(),
+                self.durations.max(),
+            )
+            result = bls_power(time, y, w, fine, durations, bin_width)
+            j = int(np.argmax(result["power"]))
+            candidates.append(
+                (result["power"][j], fine[j], result["t0"][j], result["duration"][j])
+            )
+        if not candidates:
+            period, t0, duration = self.min_period, prepared.time[0], float(self.durations.min())
+        else:
+            _, period, t0, duration = max(candidates)
+            # the median can only bridge transits well inside its window
+            if 3 * duration <= self.detrend_window:
+                prepared = self.prepare(curve, _in_transit(curve.time, period, t0, 1.5 * duration))
+        features = transit_features(prepared, curve.stellar, period, t0, duration)
+        return Transit(
+            star=curve.star,
+            period=float(period),
+            t0=float(t0),
+            duration=float(duration),
+            depth=features["koi_depth"] / 1e6,
+            snr=features["koi_model_snr"],
+            n_points=len(curve),
+            features=features,
+        )
+
+
+def periodogram_task(search: TransitSearch, curves: dict, slices: list) -> list[dict]:
+    """Worker entry point: BLS power over base-period slices of the curves."""
+    prepared = {i: search.prepare(curve) for i, curve in curves.items()}
+    results = []
+    for i, first, last in slices:
+        curve = prepared[i]
+        results.append(
+            ffa_power(
+                curve.time,
+                curve.y,
+                curve.w,
+                np.arange(first, last + 1),
+                search.durations,
+                search.bin_width,
+            )
+        )
+    return results
+
+
+def refine_task(search: TransitSearch, curves: list, spectra: list) -> list[Transit]:
+    """Worker entry point: refine the best peaks and derive the features."""
+    return [search.refine(curve, spectrum) for curve, spectrum in zip(curves, spectra)]
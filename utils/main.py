@@ -1,37 +1,169 @@
-from sklearn.preprocessing import LabelEncoder
+from typing import TYPE_CHECKING
 from schemas.schemas import ModelInputForm
-from sklearn.pipeline import Pipeline
+from utils.flat_forest import FlatForest
+from utils.governor import limit_n_jobs
+from utils.constants import Constants
+from utils.metrics import metrics, ROWS_PER_SECOND_BUCKETS
 from joblib import load
+import numpy as np
+import hashlib
+import time
+import os
 import random
 
+if TYPE_CHECKING:
+    # sklearn is only needed once an artifact is unpickled
+    from sklearn.preprocessing import LabelEncoder
+    from sklearn.pipeline import Pipeline
+
+LABELS_DISPLAY_NAMES = {
+    "CONFIRMED": "Confirmed",
+    "CANDIDATE": "Candidate",
+    "FALSE POSITIVE": "False Positive",
+}
+
+
+def disposition_key(label) -> str:
+    # "FALSE POSITIVE", "False Positive" and "false_positive" are one label
+    return " ".join(str(label).replace("_", " ").split()).upper()
+
+
+def to_display_label(label) -> str:
+    """Display name of a disposition in any case; unknown labels are a ValueError."""
+    try:
+        return LABELS_DISPLAY_NAMES[disposition_key(label)]
+    except KeyError:
+        raise ValueError(f"Unknown disposition {label!r}") from None
+
+
+def file_hash(path, chunk_size=1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 
 class ExoPlanetsClassifier:
 
-    def __init__(self, artifact_path):
-        artifact = load(artifact_path)
-        print(artifact)
-        self.model: Pipeline = artifact.get("model")
-        self.le: LabelEncoder = artifact.get("label_encoder")
+    def __init__(
+        self, artifact_path, name=None, version=None, artifact_hash=None, mmap_mode=None, n_jobs=None
+    ):
+        # with mmap_mode="r" the numpy arrays of an uncompressed artifact are
+        # mapped from the file instead of copied into this process
+        artifact = load(artifact_path, mmap_mode=mmap_mode)
+        self.name = name or os.path.basename(artifact_path).removesuffix(".joblib")
+        self.version = version
+        # versioned artifacts record their hash in the manifest
+        self.artifact_hash = artifact_hash or file_hash(artifact_path)
+        self.model: "Pipeline" = artifact.get("model")
+        self.flat_model: FlatForest | None = artifact.get("flat_model")
+        self.le: "LabelEncoder" = artifact.get("label_encoder")
         self.scaler = artifact.get("scaler")
         self.features = artifact.get("features")
         self.confusion_matrix = artifact.get("confusion_matrix")
-        assert self.model is not None
+        assert self.model is not None or self.flat_model is not None
+        if n_jobs is not None and self.model is not None:
+            # forests keep the n_jobs they were trained with
+            limit_n_jobs(self.model, n_jobs)
         assert self.le is not None
+        # display label for every encoded class, so batches decode with one take();
+        # classes that are not dispositions keep their own name
+        self._display_labels = np.array(
+            [
+                LABELS_DISPLAY_NAMES.get(disposition_key(label), str(label))
+                for label in self.le.classes_
+            ],
+            dtype=object,
+        )
+
+    def predictor(self, n_rows: int):
+        # the flattened forest gives identical predictions without sklearn's
+        # per-call overhead, but sklearn wins once batches grow
+        if self.flat_model is not None and (
+            self.model is None or n_rows <= Constants.FLAT_FOREST_MAX_ROWS
+        ):
+            return self.flat_model
+        return self.model
 
     def predict(self, data: list[float]):
         if self.scaler is not None:
             scaled_data = self.scaler.transform([data])
         else:
             scaled_data = [data]
-        y_pred = self.model.predict(scaled_data)
-        y_pred = self.le.inverse_transform(y_pred)
+        y_pred = self.predictor(1).predict(scaled_data)
+        return self._display_labels[int(y_pred[0])]
 
-        if y_pred[0] == "CONFIRMED":
-            return "Confirmed"
-        elif y_pred[0] == "CANDIDATE":
-            return "Candidate"
-        else:
-            return "False Positive"
+    def predict_batch(self, X) -> tuple[np.ndarray, dict[str, int]]:
+        """Predict a whole feature matrix in one pass.
+
+        `X` must be ordered like `Constants.FEATURES_REQUIRED_TO_PREDICT`.
+        Returns the display labels and the count of each class.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if len(X) == 0:
+            return np.empty(0, dtype=object), self._count(np.empty(0, dtype=object))
+        started = time.perf_counter()
+        if self.scaler is not None:
+            with metrics.timer("scale"):
+                X = self.scaler.transform(X)
+        with metrics.timer("predict", model=self.name):
+            y_pred = self.predictor(len(X)).predict(X)
+        with metrics.timer("decode"):
+            labels = self._display_labels[np.asarray(y_pred, dtype=np.intp)]
+        metrics.inc("rows_predicted_total", len(X), model=self.name)
+        metrics.observe(
+            "rows_per_second",
+            len(X) / (time.perf_counter() - started),
+            buckets=ROWS_PER_SECOND_BUCKETS,
+            model=self.name,
+        )
+        return labels, self._count(labels)
+
+    @property
+    def classes(self) -> list[str]:
+        """Display labels in the column order of `predict_proba_batch`."""
+        return self._display_labels.tolist()
+
+    def predict_proba_batch(self, X) -> tuple[np.ndarray, dict[str, int], np.ndarray]:
+        """Like `predict_batch`, plus the (n_rows, n_classes) class probabilities."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if len(X) == 0:
+            labels = np.empty(0, dtype=object)
+            return labels, self._count(labels), np.empty((0, len(self._display_labels)))
+        started = time.perf_counter()
+        if self.scaler is not None:
+            with metrics.timer("scale"):
+                X = self.scaler.transform(X)
+        predictor = self.predictor(len(X))
+        with metrics.timer("predict_proba", model=self.name):
+            proba = predictor.predict_proba(X)
+        with metrics.timer("decode"):
+            # the forest's own predict() is the argmax of these probabilities
+            encoded = np.asarray(predictor.classes_, dtype=np.intp)[proba.argmax(axis=1)]
+            labels = self._display_labels[encoded]
+            probabilities = np.zeros((len(X), len(self._display_labels)))
+            probabilities[:, np.asarray(predictor.classes_, dtype=np.intp)] = proba
+        metrics.inc("rows_predicted_total", len(X), model=self.name)
+        metrics.observe(
+            "rows_per_second",
+            len(X) / (time.perf_counter() - started),
+            buckets=ROWS_PER_SECOND_BUCKETS,
+            model=self.name,
+        )
+        return labels, self._count(labels), probabilities
+
+    @staticmethod
+    def _count(labels) -> dict[str, int]:
+        return {
+            "Confirmed": int(np.count_nonzero(labels == "Confirmed")),
+            "Candidate": int(np.count_nonzero(labels == "Candidate")),
+            "False Positive": int(np.count_nonzero(labels == "False Positive")),
+        }
 
     def __str__(self):
         return f"model features: {self.features} scaler: {self.scaler}"
@@ -0,0 +1,68 @@
+import os
+
+
+def _kb_fields(lines) -> dict[str, int]:
+    fields = {}
+    for line in lines:
+        key, _, rest = line.partition(":")
+        parts = rest.split()
+        if len(parts) == 2 and parts[1] == "kB":
+            fields[key] = fields.get(key, 0) + int(parts[0]) * 1024
+    return fields
+
+
+def process_memory(pid="self") -> dict:
+    """Resident bytes of a process split into private and shared pages.
+
+    Read from /proc/<pid>/smaps_rollup, so Linux only. `pss` charges each
+    shared page to the processes mapping it in equal parts, so summing it
+    over workers gives their real combined footprint.
+    """
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        fields = _kb_fields(f)
+    return {
+        "pid": os.getpid() if pid == "self" else int(pid),
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+    }
+
+
+def mapped_files(root: str, pid="self") -> dict:
+    """Resident bytes of the files under `root` that a process has mapped."""
+    root = os.path.abspath(root) + os.sep
+    totals = {"files": 0, "rss": 0, "shared": 0}
+    paths = set()
+    current = None
+    with open(f"/proc/{pid}/smaps") as f:
+        for line in f:
+            head = line.split(maxsplit=5)
+            # mapping headers start with an address range, fields with "Name:"
+            if "-" in head[0] and not head[0].endswith(":"):
+                current = head[5].strip() if len(head) == 6 else None
+                if current is not None and not current.startswith(root):
+                    current = None
+                continue
+            if current is None:
+                continue
+            fields = _kb_fields([line])
+            if "Rss" in fields:
+                paths.add(current)
+                totals["rss"] += fields["Rss"]
+            totals["shared"] += fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)
+    totals["files"] = len(paths)
+    return totals
+
+
+def child_pids(pid: int) -> list[int]:
+    children = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            children.extend(int(child) for child in f.read().split())
+    return children
+
+
+def memory_report(pid="self", models_dir="models") -> dict:
+    """Memory of a process plus the model files it maps from `models_dir`."""
+    return {**process_memory(pid), "models_mapped": mapped_files(models_dir, pid)}
@@ -0,0 +1,185 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import threading
+import bisect
+import time
+
+
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+ROWS_PER_SECOND_BUCKETS = (100, 1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+
+# (stage, seconds) pairs of the current request, for the Server-Timing header
+request_timings: ContextVar[list | None] = ContextVar("request_timings", default=None)
+# False inside `Metrics.paused()`
+_recording: ContextVar[bool] = ContextVar("metrics_recording", default=True)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """In-process counters, gauges and histograms rendered as Prometheus text.
+
+    Every update is a dict lookup and a few additions under one lock, cheap
+    enough to leave on in production.
+    """
+
+    def __init__(self, namespace="exovision"):
+        self.namespace = namespace
+        self._counters: dict[tuple, float] = {}
+        self._gauges: dict[tuple, float] = {}
+        self._histograms: dict[tuple, Histogram] = {}
+        self._help: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    @contextmanager
+    def paused(self):
+        """Drop counter and histogram updates made in this context (e.g. by
+        warm-up predictions, which are not traffic)."""
+        token = _recording.set(False)
+        try:
+            yield
+        finally:
+            _recording.reset(token)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not _recording.get():
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def clear(self, name: str, **labels):
+        """Remove the `name` gauges whose labels include `labels`."""
+        match = set(labels.items())
+        with self._lock:
+            for key in [key for key in self._gauges if key[0] == name and match <= set(key[1])]:
+                del self._gauges[key]
+
+    def observe(self, name: str, value: float, buckets=DEFAULT_BUCKETS, **labels):
+        if not _recording.get():
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        """Time a block into `stage_seconds{stage=...}` and the request's Server-Timing."""
+        timing = Timing()
+        started = time.perf_counter()
+        try:
+            yield timing
+        finally:
+            timing.seconds = time.perf_counter() - started
+            self.observe("stage_seconds", timing.seconds, stage=stage, **labels)
+            timings = request_timings.get()
+            if timings is not None:
+                timings.append((stage, timing.seconds))
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        pairs = [*labels, *extra]
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {
+                key: (h.buckets, list(h.counts), h.sum, h.count)
+                for key, h in self._histograms.items()
+            }
+
+        def header(name, kind):
+            full = f"{self.namespace}_{name}"
+            if name in self._help:
+                lines.append(f"# HELP {full} {self._help[name]}")
+            lines.append(f"# TYPE {full} {kind}")
+            return full
+
+        for kind, samples in (("counter", counters), ("gauge", gauges)):
+            for name in sorted({key[0] for key in samples}):
+                full = header(name, kind)
+                for (sample_name, labels), value in sorted(samples.items()):
+                    if sample_name == name:
+                        lines.append(f"{full}{self._format_labels(labels)} {value}")
+
+        for name in sorted({key[0] for key in histograms}):
+            full = header(name, "histogram")
+            for (sample_name, labels), (buckets, counts, total, count) in sorted(
+                histograms.items()
+            ):
+                if sample_name != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip([*buckets, "+Inf"], counts):
+                    cumulative += bucket_count
+                    le = bound if bound == "+Inf" else repr(float(bound))
+                    lines.append(
+                        f"{full}_bucket{self._format_labels(labels, [('le', le)])} {cumulative}"
+                    )
+                lines.append(f"{full}_sum{self._format_labels(labels)} {total}")
+                lines.append(f"{full}_count{self._format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class Timing:
+    seconds: float = 0.0
+
+
+def server_timing_header(timings: list[tuple[str, float]]) -> str:
+    # repeated stages (e.g. one predict per chunk) are summed
+    totals: dict[str, float] = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in totals.items())
+
+
+metrics = Metrics()
+metrics.describe("stage_seconds", "Wall-clock seconds spent in each processing stage.")
+metrics.describe("http_requests_total", "HTTP requests by route, method and status.")
+metrics.describe("http_request_seconds", "HTTP request latency by route.")
+metrics.describe("model_requests_total", "Prediction requests per model.")
+metrics.describe("rows_predicted_total", "Rows predicted per model.")
+metrics.describe("rows_per_second", "Prediction throughput of each batch call.")
+metrics.describe("model_load_seconds", "Time to load a model artifact.")
+metrics.describe("training_stage_seconds", "Duration of background training stages.")
+metrics.describe("warmup_seconds", "Time spent loading and warming models at startup.")
+metrics.describe("chat_requests_total", "Chat replies by outcome (ok, timeout, rejected, error).")
+metrics.describe("process_memory_bytes", "Resident memory of this worker, private or shared.")
+metrics.describe("chat_first_token_seconds", "Time from starting a chat reply to its first token.")
+metrics.describe("effective_threads", "Native threads per thread pool API, for serving and running training jobs.")
@@ -1,49 +1,120 @@
 import os
+import math
+import time
+import hashlib
+import warnings
+import itertools
 import joblib
+from joblib import parallel_config
 import pandas as pd
-from sklearn.model_selection import train_test_split, RandomizedSearchCV
+from sklearn.model_selection import train_test_split, RandomizedSearchCV, ParameterSampler
 from sklearn.preprocessing import LabelEncoder, StandardScaler
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.base import clone
 from sklearn.metrics import (
+    get_scorer,
     classification_report,
     confusion_matrix,
     balanced_accuracy_score,
 )
-from imblearn.over_sampling import SMOTE
 from utils.constants import Constants
+from utils.flat_forest import FlatForest
+from utils.model_store import ModelStore
+from utils.metrics import metrics
 
 
 class ExoplanetRandomForestModelGenerator:
     REQUIRED_FEATURES = Constants.FEATURES_REQUIRED_TO_PREDICT
+    PARAM_DISTRIBUTIONS = {
+        "n_estimators": [100, 200, 300],
+        "max_depth": [10, 20, None],
+        "min_samples_split": [2, 5, 10],
+        "min_samples_leaf": [1, 2, 4],
+    }
 
-    def __init__(self, csv_paths, target_col="koi_disposition", random_state=42):
+    def __init__(
+        self,
+        csv_paths=None,
+        target_col="koi_disposition",
+        random_state=42,
+        cache_dir=None,
+        dataset_ids=None,
+        dataset_store=None,
+        n_jobs=-1,
+    ):
+        csv_paths = csv_paths or []
         self.csv_paths = csv_paths if isinstance(csv_paths, list) else [csv_paths]
+        # datasets already ingested into a DatasetStore load without parsing
+        self.dataset_ids = dataset_ids or []
+        self.dataset_store = dataset_store
         self.target_col = target_col
         self.random_state = random_state
+        # cores the search and the final forest may use
+        self.n_jobs = n_jobs
+        # when set, preprocess() reuses scaled + SMOTE-resampled matrices
+        # computed earlier for the same data and seed
+        self.cache_dir = cache_dir
         self.label_encoder = LabelEncoder()
         self.model = None
         self.labels_names = None
         self.conf_matrix = None
+        self.scores = {}
         self.best_params = None
         self.scaler = None
         self.features = Constants.FEATURES_REQUIRED_TO_PREDICT
+        # wall-clock seconds of the preprocessing sub-stages of the last run
+        self.stage_seconds = {}
 
     def load_and_validate(self):
         dfs = []
+        if self.dataset_ids:
+            with metrics.timer("train_load_datasets"):
+                dfs.append(self.dataset_store.load_frame(self.dataset_ids))
         for path in self.csv_paths:
-            df = pd.read_csv(path)
+            with metrics.timer("train_read_csv"):
+                df = pd.read_csv(path)
             # ensure all required features and target exist
             required_plus_target = set(self.REQUIRED_FEATURES + [self.target_col])
             missing = required_plus_target - set(df.columns)
             if missing:
                 raise ValueError(f"File {path} is missing features: {missing}")
             dfs.append(df)
-        self.df = pd.concat(dfs, ignore_index=True)
+        # a lone stored dataset stays backed by its memory-mapped matrix
+        self.df = dfs[0] if len(dfs) == 1 else pd.concat(dfs, ignore_index=True)
         return self.df
 
+    def dataset_hash(self) -> str:
+        digest = hashlib.sha256()
+        if self.dataset_ids and not self.csv_paths:
+            # stored datasets are already content-addressed
+            digest.update(",".join(self.dataset_ids).encode())
+            return digest.hexdigest()
+        digest.update(
+            pd.util.hash_pandas_object(
+                self.df[self.features + [self.target_col]], index=False
+            ).values.tobytes()
+        )
+        return digest.hexdigest()
+
+    def _preprocess_cache_path(self):
+        if self.cache_dir is None:
+            return None
+        key = f"{self.dataset_hash()}-{self.random_state}"
+        return os.path.join(self.cache_dir, f"{key}.joblib")
+
     def preprocess(self):
         # Reorder and select features to match the app's expected order
         self.df = self.df[self.features + [self.target_col]]
+        cache_path = self._preprocess_cache_path()
+        if cache_path is not None and os.path.exists(cache_path):
+            with metrics.timer("train_preprocess_cache_load"):
+                cached = joblib.load(cache_path)
+            self.label_encoder = cached["label_encoder"]
+            self.labels_names = list(self.label_encoder.classes_)
+            self.scaler = cached["scaler"]
+            self.stage_seconds.update(scale=0.0, smote=0.0)
+            return cached["matrices"]
+
         X = self.df[self.features].values
         y_raw = self.df[self.target_col].values
         y = self.label_encoder.fit_transform(y_raw)
@@ -54,40 +125,175 @@ class ExoplanetRandomForestModelGenerator:
         )
 
         # Fit scaler on training data and transform
-        self.scaler = StandardScaler()
-        X_train_scaled = self.scaler.fit_transform(X_train)
-        X_test_scaled = self.scaler.transform(X_test)
+        with metrics.timer("train_scale") as timing:
+            self.scaler = StandardScaler()
+            X_train_scaled = self.scaler.fit_transform(X_train)
+            X_test_scaled = self.scaler.transform(X_test)
+        self.stage_seconds["scale"] = timing.seconds
 
-        # Handle class imbalance with SMOTE on scaled data
-        sm = SMOTE(random_state=self.random_state)
-        X_train_res, y_train_res = sm.fit_resample(X_train_scaled, y_train)
+        # Handle class imbalance with SMOTE on scaled data; imblearn is slow to
+        # import and only training needs it
+        from imblearn.over_sampling import SMOTE
 
-        return X_train_res, X_test_scaled, y_train_res, y_test
+        with metrics.timer("train_smote") as timing:
+            sm = SMOTE(random_state=self.random_state)
+            X_train_res, y_train_res = sm.fit_resample(X_train_scaled, y_train)
+        self.stage_seconds["smote"] = timing.seconds
 
-    def train(self, X_train_res, y_train_res):
-        param_dist = {
-            "n_estimators": [100, 200, 300],
-            "max_depth": [10, 20, None],
-            "min_samples_split": [2, 5, 10],
-            "min_samples_leaf": [1, 2, 4],
-        }
+        matrices = X_train_res, X_test_scaled, y_train_res, y_test
+        if cache_path is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # write then rename so concurrent jobs never read a partial file
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            joblib.dump(
+                {
+                    "matrices": matrices,
+                    "scaler": self.scaler,
+                    "label_encoder": self.label_encoder,
+                },
+                tmp_path,
+            )
+            os.replace(tmp_path, cache_path)
+        return matrices
 
-        rf = RandomForestClassifier(random_state=self.random_state, n_jobs=-1)
+    def train(self, X_train_res, y_train_res, on_fold=None):
+        param_dist = self.PARAM_DISTRIBUTIONS
+
+        # candidates fit in parallel, each forest on one core, so the search
+        # never runs n_jobs forests of n_jobs threads each
+        rf = RandomForestClassifier(random_state=self.random_state, n_jobs=1)
+        n_iter, cv = 5, 3
+
+        scoring = "balanced_accuracy"
+        if on_fold is not None:
+            # report every scored CV fold; folds run on threads so the
+            # callback stays in this process
+            balanced_accuracy = get_scorer("balanced_accuracy")
+            folds_done = itertools.count(1)
+
+            def scoring(estimator, X, y):
+                score = balanced_accuracy(estimator, X, y)
+                on_fold(next(folds_done), n_iter * cv)
+                return score
 
         search = RandomizedSearchCV(
             rf,
             param_distributions=param_dist,
-            n_iter=5,
-            scoring="balanced_accuracy",
-            cv=3,
+            n_iter=n_iter,
+            scoring=scoring,
+            cv=cv,
             random_state=self.random_state,
             verbose=1,
-            n_jobs=-1,
+            n_jobs=self.n_jobs,
+            refit=False,
         )
-        search.fit(X_train_res, y_train_res)
-        self.model = search.best_estimator_
+        with metrics.timer("train_search"):
+            if on_fold is not None:
+                with parallel_config(backend="threading"):
+                    search.fit(X_train_res, y_train_res)
+            else:
+                search.fit(X_train_res, y_train_res)
+            self.model = clone(rf).set_params(**search.best_params_, n_jobs=self.n_jobs)
+            self.model.fit(X_train_res, y_train_res)
         self.best_params = search.best_params_
 
+    def train_halving(
+        self,
+        X_train_res,
+        y_train_res,
+        n_candidates=12,
+        min_trees=25,
+        max_trees=300,
+        factor=3,
+        time_budget=None,
+        n_jobs=-1,
+        on_fold=None,
+    ):
+        """Successive-halving search with trees as the resource.
+
+        Every candidate starts as a small warm-started forest scored on its
+        out-of-bag balanced accuracy; the best 1/`factor` keep growing
+        (existing trees are reused) until one is left or `max_trees` is
+        reached. Once `time_budget` seconds have passed no new fits start and
+        the best forest of the last rung reached wins. `n_jobs` caps the
+        cores used.
+        """
+        if time_budget is not None and time_budget < 0:
+            raise ValueError("time_budget must not be negative")
+        param_dist = {
+            name: values
+            for name, values in self.PARAM_DISTRIBUTIONS.items()
+            if name != "n_estimators"
+        }
+        candidates = [
+            {
+                "params": params,
+                "forest": RandomForestClassifier(
+                    **params,
+                    n_estimators=0,
+                    warm_start=True,
+                    oob_score=balanced_accuracy_score,
+                    random_state=self.random_state,
+                    n_jobs=n_jobs,
+                ),
+                "score": None,
+            }
+            for params in ParameterSampler(
+                param_dist, n_iter=n_candidates, random_state=self.random_state
+            )
+        ]
+
+        # fits planned across all rungs, for progress reporting
+        rungs, alive, trees = [], len(candidates), min_trees
+        while True:
+            rungs.append((alive, trees))
+            if alive == 1 or trees >= max_trees:
+                break
+            alive, trees = math.ceil(alive / factor), min(trees * factor, max_trees)
+        total_fits = sum(alive for alive, _ in rungs)
+
+        started = time.perf_counter()
+        fits_done, alive = 0, candidates
+        with metrics.timer("train_search"):
+            for _, trees in rungs:
+                for candidate in alive:
+                    over_budget = (
+                        time_budget is not None
+                        and time.perf_counter() - started > time_budget
+                    )
+                    if over_budget and any(c["score"] is not None for c in candidates):
+                        break
+                    forest = candidate["forest"]
+                    forest.set_params(n_estimators=trees)
+                    with warnings.catch_warnings():
+                        # few trees leave some samples without OOB votes
+                        warnings.simplefilter("ignore", UserWarning)
+                        forest.fit(X_train_res, y_train_res)
+                    candidate["score"] = forest.oob_score_
+                    candidate["trees"] = trees
+                    fits_done += 1
+                    if on_fold is not None:
+                        on_fold(fits_done, total_fits)
+                scored = [c for c in alive if c["score"] is not None]
+                scored.sort(key=lambda c: c["score"], reverse=True)
+                if len(scored) < len(alive):
+                    alive = scored
+                    break
+                alive = scored[: math.ceil(len(scored) / factor)]
+
+        # only forests grown in the last rung reached compete: a candidate
+        # dropped early was scored on fewer trees, and a noisy OOB score of a
+        # small forest must not beat the finalists
+        scored = [c for c in candidates if c["score"] is not None]
+        last_rung = max(c["trees"] for c in scored)
+        best = max((c for c in scored if c["trees"] == last_rung), key=lambda c: c["score"])
+        self.model = best["forest"]
+        # later fits should not grow the forest any further, and the per-sample
+        # OOB votes would only bloat the saved artifact
+        self.model.set_params(warm_start=False)
+        del self.model.oob_decision_function_
+        self.best_params = {**best["params"], "n_estimators": len(self.model.estimators_)}
+
     def evaluate(self, X_test, y_test):
         y_pred = self.model.predict(X_test)
         acc = balanced_accuracy_score(y_test, y_pred)
@@ -95,6 +301,12 @@ class ExoplanetRandomForestModelGenerator:
         conf_mat = confusion_matrix(y_test, y_pred)
 
         self.conf_matrix = conf_mat
+        self.scores = {
+            "balanced_accuracy": float(acc),
+            "classification_report": classification_report(
+                y_test, y_pred, target_names=self.labels_names, output_dict=True
+            ),
+        }
 
         print("\n=== Tuned RandomForest with SMOTE ===")
         print("Best Params:", self.best_params)
@@ -104,18 +316,50 @@ class ExoplanetRandomForestModelGenerator:
 
         return acc, report, conf_mat
 
-    def save(self, output_name, output_dir="models"):
-        os.makedirs(output_dir, exist_ok=True)
-        joblib.dump(
+    def flatten(self):
+        """Flatten the forest for fast serving, checked against sklearn on the loaded data."""
+        with metrics.timer("train_flatten"):
+            flat = FlatForest.from_sklearn(self.model)
+        sample = self.df.sample(n=min(len(self.df), 2000), random_state=self.random_state)
+        X = self.scaler.transform(sample[self.features].values)
+        if not flat.verify(self.model, X):
+            print("Flattened forest disagrees with sklearn, serving the sklearn model")
+            return None
+        return flat
+
+    def manifest(self) -> dict:
+        """What the artifact was trained on and how well it did, saved next to it."""
+        import sklearn
+
+        return {
+            "features": self.features,
+            "target": self.target_col,
+            "classes": [str(label) for label in self.label_encoder.classes_],
+            "dataset_hash": self.dataset_hash(),
+            "dataset_ids": self.dataset_ids,
+            "csv_files": [os.path.basename(path) for path in self.csv_paths],
+            "n_rows": len(self.df),
+            "random_state": self.random_state,
+            "params": self.best_params,
+            "metrics": self.scores,
+            "confusion_matrix": None if self.conf_matrix is None else self.conf_matrix.tolist(),
+            "sklearn_version": sklearn.__version__,
+        }
+
+    def save(self, output_name, output_dir="models", promote=True):
+        """Save the artifact as a new version of `output_name`; returns the version."""
+        version = ModelStore(output_dir).save(
+            output_name,
             {
                 "model": self.model,
+                "flat_model": self.flatten(),
                 "label_encoder": self.label_encoder,
                 "confusion_matrix": self.conf_matrix,
                 "scaler": self.scaler,
                 "features": self.features,
             },
-            os.path.join(output_dir, f"{output_name}.joblib"),
+            manifest=self.manifest(),
+            promote=promote,
         )
-        print(f"Artifacts saved to {output_dir}")
-
-
+        print(f"Artifacts saved to {output_dir} as {output_name} version {version}")
+        return version
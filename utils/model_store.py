@@ -0,0 +1,207 @@
+from utils.main import file_hash
+import joblib
+import shutil
+import json
+import time
+import uuid
+import os
+
+# "name@version" pins a request to one version instead of the current one
+VERSION_SEPARATOR = "@"
+# bare models/<name>.joblib files from before versioning
+LEGACY_VERSION = "0"
+
+
+def split_model_key(key: str) -> tuple[str, str | None]:
+    name, _, version = key.partition(VERSION_SEPARATOR)
+    return name, version or None
+
+
+class ModelStore:
+    """Versioned model artifacts on disk.
+
+    Every save creates a new immutable version next to the older ones:
+
+        models/<name>/versions/<n>/model.joblib
+        models/<name>/versions/<n>/manifest.json
+        models/<name>/versions/<n>/shared.joblib
+        models/<name>/CURRENT
+
+    A version is written into a temporary directory and renamed into place,
+    so readers never see a half-written artifact. `CURRENT` holds the
+    promoted version and is replaced atomically; without it the newest
+    version is current. Legacy `models/<name>.joblib` files are listed as
+    version "0".
+
+    `shared.joblib` is the serving copy of a flattened artifact: no sklearn
+    forest and uncompressed, so `joblib.load(mmap_mode="r")` maps its arrays
+    straight from the page cache and every worker process shares them.
+    """
+
+    VERSIONS_DIR = "versions"
+    ARTIFACT_FILE = "model.joblib"
+    SHARED_FILE = "shared.joblib"
+    # shared copies of legacy artifacts, hidden from names()
+    LEGACY_SHARED_DIR = ".shared"
+    MANIFEST_FILE = "manifest.json"
+    CURRENT_FILE = "CURRENT"
+
+    def __init__(self, root="models"):
+        self.root = root
+
+    @staticmethod
+    def check_name(name: str):
+        if not name or name.startswith(".") or not all(
+            c.isalnum() or c in "-_." for c in name
+        ):
+            raise ValueError(
+                f"Invalid model name {name!r}: use letters, digits, '-', '_' and '.'"
+            )
+
+    def names(self) -> list[str]:
+        if not os.path.isdir(self.root):
+            return []
+        names = set()
+        for entry in os.scandir(self.root):
+            if entry.name.startswith("."):
+                continue
+            if entry.is_file() and entry.name.endswith(".joblib"):
+                names.add(entry.name.removesuffix(".joblib"))
+            elif entry.is_dir() and os.path.isdir(os.path.join(entry.path, self.VERSIONS_DIR)):
+                if self.versions(entry.name):
+                    names.add(entry.name)
+        return sorted(names)
+
+    def _legacy_path(self, name: str) -> str:
+        return os.path.join(self.root, f"{name}.joblib")
+
+    def _version_dir(self, name: str, version: str) -> str:
+        return os.path.join(self.root, name, self.VERSIONS_DIR, version)
+
+    def versions(self, name: str) -> list[str]:
+        """Versions of `name`, oldest first."""
+        versions = []
+        if os.path.isfile(self._legacy_path(name)):
+            versions.append(LEGACY_VERSION)
+        versions_dir = os.path.join(self.root, name, self.VERSIONS_DIR)
+        if os.path.isdir(versions_dir):
+            versions.extend(
+                entry.name
+                for entry in os.scandir(versions_dir)
+                if entry.is_dir() and entry.name.isdigit()
+            )
+        return sorted(versions, key=int)
+
+    def current(self, name: str) -> str | None:
+        try:
+            with open(os.path.join(self.root, name, self.CURRENT_FILE)) as f:
+                version = f.read().strip()
+        except (FileNotFoundError, NotADirectoryError):
+            version = None
+        if version is not None and self.has_version(name, version):
+            return version
+        versions = self.versions(name)
+        return versions[-1] if versions else None
+
+    def has_version(self, name: str, version: str) -> bool:
+        if not version.isdigit():
+            return False
+        if version == LEGACY_VERSION:
+            return os.path.isfile(self._legacy_path(name))
+        return os.path.isfile(os.path.join(self._version_dir(name, version), self.ARTIFACT_FILE))
+
+    def artifact_path(self, name: str, version: str) -> str:
+        if version == LEGACY_VERSION:
+            return self._legacy_path(name)
+        return os.path.join(self._version_dir(name, version), self.ARTIFACT_FILE)
+
+    def shared_path(self, name: str, version: str) -> str:
+        if version == LEGACY_VERSION:
+            return os.path.join(self.root, self.LEGACY_SHARED_DIR, f"{name}.joblib")
+        return os.path.join(self._version_dir(name, version), self.SHARED_FILE)
+
+    @staticmethod
+    def _dump_shared(artifact: dict, path: str):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            joblib.dump({**artifact, "model": None}, tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def ensure_shared(self, name: str, version: str) -> str | None:
+        """Path of the memory-mappable copy, written on first use.
+
+        Returns None when the artifact has no flattened forest, since the
+        sklearn forest cannot be served from mapped memory.
+        """
+        path = self.shared_path(name, version)
+        source = self.artifact_path(name, version)
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source):
+            return path
+        artifact = joblib.load(source)
+        if artifact.get("flat_model") is None:
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._dump_shared(artifact, path)
+        return path
+
+    def manifest(self, name: str, version: str) -> dict:
+        if not self.has_version(name, version):
+            raise KeyError(f"{name}{VERSION_SEPARATOR}{version}")
+        if version == LEGACY_VERSION:
+            stat = os.stat(self._legacy_path(name))
+            return {"name": name, "version": version, "legacy": True, "saved_at": stat.st_mtime}
+        with open(os.path.join(self._version_dir(name, version), self.MANIFEST_FILE)) as f:
+            return json.load(f)
+
+    def save(self, name: str, artifact: dict, manifest: dict | None = None, promote=True) -> str:
+        """Write `artifact` as the next version of `name`; returns the version."""
+        self.check_name(name)
+        versions_dir = os.path.join(self.root, name, self.VERSIONS_DIR)
+        os.makedirs(versions_dir, exist_ok=True)
+        tmp_dir = os.path.join(versions_dir, f".{uuid.uuid4().hex}.tmp")
+        os.makedirs(tmp_dir)
+        try:
+            artifact_path = os.path.join(tmp_dir, self.ARTIFACT_FILE)
+            joblib.dump(artifact, artifact_path)
+            if artifact.get("flat_model") is not None:
+                self._dump_shared(artifact, os.path.join(tmp_dir, self.SHARED_FILE))
+            manifest = {
+                **(manifest or {}),
+                "name": name,
+                "artifact_sha256": file_hash(artifact_path),
+                "artifact_bytes": os.path.getsize(artifact_path),
+                "saved_at": time.time(),
+            }
+            while True:
+                # a concurrent save may take the same number; renaming onto
+                # its (non-empty) directory fails and we try the next one
+                version = str(max(map(int, self.versions(name)), default=0) + 1)
+                with open(os.path.join(tmp_dir, self.MANIFEST_FILE), "w") as f:
+                    json.dump({**manifest, "version": version}, f, indent=2, default=str)
+                try:
+                    os.rename(tmp_dir, self._version_dir(name, version))
+                    break
+                except OSError:
+                    if not os.path.isdir(self._version_dir(name, version)):
+                        raise
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        if promote:
+            self.promote(name, version)
+        return version
+
+    def promote(self, name: str, version: str):
+        """Make `version` the one served for `name`."""
+        if not self.has_version(name, version):
+            raise KeyError(f"{name}{VERSION_SEPARATOR}{version}")
+        os.makedirs(os.path.join(self.root, name), exist_ok=True)
+        path = os.path.join(self.root, name, self.CURRENT_FILE)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(version)
+        os.replace(tmp_path, path)
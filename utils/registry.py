@@ -0,0 +1,241 @@
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass
+from utils.main import ExoPlanetsClassifier, file_hash
+from utils.metrics import metrics
+from utils.model_store import ModelStore, VERSION_SEPARATOR, split_model_key
+import threading
+import time
+import os
+
+
+def estimate_nbytes(classifier: ExoPlanetsClassifier, fallback: int = 0) -> int:
+    """Approximate resident size of a classifier from its tree arrays."""
+    total = 0
+    if classifier.flat_model is not None:
+        total += classifier.flat_model.nbytes
+    estimators = getattr(classifier.model, "estimators_", None) or []
+    for estimator in estimators:
+        tree = getattr(estimator, "tree_", None)
+        if tree is None:
+            continue
+        state = tree.__getstate__()
+        total += state["nodes"].nbytes + state["values"].nbytes
+    return total or fallback
+
+
+@dataclass
+class ArtifactInfo:
+    path: str
+    mtime_ns: int
+    size: int
+    version: str | None = None
+
+
+@dataclass
+class LoadedModel:
+    classifier: ExoPlanetsClassifier
+    artifact: ArtifactInfo
+    nbytes: int
+    load_seconds: float
+
+
+class ModelRegistry(Mapping):
+    """Dict-like view over the models in a `ModelStore`, loaded on first use.
+
+    `registry[name]` is the current version of `name`; `registry["name@3"]`
+    pins version 3. Loaded models are kept in LRU order and the least
+    recently used ones are evicted once their estimated size exceeds
+    `memory_budget` bytes (the model being requested is never evicted).
+    `registry[name]` unpickles a model that is not resident yet, so async
+    callers check `peek(name)` first and load off the event loop otherwise.
+    `refresh()` rescans the store and only reloads models whose current
+    version (or legacy artifact) changed; the new model is fully loaded
+    before it replaces the old one, and every other model stays as it is.
+
+    With `shared=True` flattened models are served from the store's
+    memory-mapped copy, so worker processes share one page-cache copy of
+    the forest arrays; models without a flat forest are loaded privately.
+    """
+
+    def __init__(self, models_dir="models", memory_budget=None, shared=False, n_jobs=None):
+        self.store = ModelStore(models_dir)
+        self.memory_budget = memory_budget
+        self.shared = shared
+        # cores a loaded sklearn model may predict on (None keeps its own)
+        self.n_jobs = n_jobs
+        # name -> artifact of its current version
+        self._artifacts: dict[str, ArtifactInfo] = {}
+        # keyed by name for current versions and "name@version" for pinned ones
+        self._loaded: OrderedDict[str, LoadedModel] = OrderedDict()
+        self._lock = threading.RLock()
+        self.refresh()
+
+    @classmethod
+    def from_env(cls, models_dir="models", n_jobs=None):
+        budget_mb = os.getenv("EXOVISION_MODEL_MEMORY_BUDGET_MB")
+        return cls(
+            models_dir,
+            memory_budget=int(float(budget_mb) * 1024 * 1024) if budget_mb else None,
+            shared=os.getenv("EXOVISION_SHARED_MODELS", "0") == "1",
+            n_jobs=n_jobs,
+        )
+
+    @property
+    def models_dir(self) -> str:
+        return self.store.root
+
+    def _info(self, name: str, version: str) -> ArtifactInfo:
+        path = self.store.artifact_path(name, version)
+        stat = os.stat(path)
+        return ArtifactInfo(path=path, mtime_ns=stat.st_mtime_ns, size=stat.st_size, version=version)
+
+    def _scan(self) -> dict[str, ArtifactInfo]:
+        artifacts = {}
+        for name in self.store.names():
+            version = self.store.current(name)
+            try:
+                artifacts[name] = self._info(name, version)
+            except (FileNotFoundError, TypeError):
+                # removed between listing and stat
+                continue
+        return artifacts
+
+    def refresh(self) -> list[str]:
+        """Pick up added, promoted, changed and removed models; returns changed names."""
+        artifacts = self._scan()
+        changed = []
+        with self._lock:
+            for key in list(self._loaded):
+                name, version = split_model_key(key)
+                if name not in artifacts or (
+                    version is not None and not self.store.has_version(name, version)
+                ):
+                    del self._loaded[key]
+            for name, info in artifacts.items():
+                old = self._artifacts.get(name)
+                if old is None or (old.path, old.mtime_ns, old.size) != (
+                    info.path,
+                    info.mtime_ns,
+                    info.size,
+                ):
+                    changed.append(name)
+            self._artifacts = artifacts
+            reload = [name for name in changed if name in self._loaded]
+        for name in reload:
+            self._load(name, artifacts[name])
+        return changed
+
+    def _resolve(self, key: str) -> tuple[str, ArtifactInfo]:
+        """Cache key and artifact for a model name, pinned or not."""
+        name, version = split_model_key(key)
+        current = self._artifacts.get(name)
+        if current is None:
+            raise KeyError(key)
+        if version is None or version == current.version:
+            # pinning the current version shares the loaded model
+            return name, current
+        if not self.store.has_version(name, version):
+            raise KeyError(key)
+        try:
+            return f"{name}{VERSION_SEPARATOR}{version}", self._info(name, version)
+        except FileNotFoundError:
+            raise KeyError(key) from None
+
+    def _load(self, key: str, info: ArtifactInfo) -> ExoPlanetsClassifier:
+        name, _ = split_model_key(key)
+        started = time.perf_counter()
+        manifest = self.store.manifest(name, info.version)
+        shared_path = self.store.ensure_shared(name, info.version) if self.shared else None
+        classifier = ExoPlanetsClassifier(
+            artifact_path=shared_path or info.path,
+            name=name,
+            version=info.version,
+            # keyed by the full artifact, so shared and private loads share cache entries
+            artifact_hash=manifest.get("artifact_sha256") or file_hash(info.path),
+            mmap_mode="r" if shared_path else None,
+            n_jobs=self.n_jobs,
+        )
+        loaded = LoadedModel(
+            classifier=classifier,
+            artifact=info,
+            nbytes=estimate_nbytes(classifier, fallback=info.size),
+            load_seconds=time.perf_counter() - started,
+        )
+        metrics.observe("model_load_seconds", loaded.load_seconds, model=name)
+        with self._lock:
+            self._loaded[key] = loaded
+            self._loaded.move_to_end(key)
+            self._evict(keep=key)
+        return classifier
+
+    def _evict(self, keep: str):
+        if self.memory_budget is None:
+            return
+        while self.resident_bytes > self.memory_budget:
+            victim = next((name for name in self._loaded if name != keep), None)
+            if victim is None:
+                break
+            del self._loaded[victim]
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(loaded.nbytes for loaded in self._loaded.values())
+
+    def __getitem__(self, key: str) -> ExoPlanetsClassifier:
+        with self._lock:
+            key, info = self._resolve(key)
+            loaded = self._loaded.get(key)
+            if loaded is not None and loaded.artifact == info:
+                self._loaded.move_to_end(key)
+                return loaded.classifier
+        return self._load(key, info)
+
+    def peek(self, key: str) -> ExoPlanetsClassifier | None:
+        """The model for `key` if it is loaded and current, without loading it."""
+        with self._lock:
+            try:
+                key, info = self._resolve(key)
+            except KeyError:
+                return None
+            loaded = self._loaded.get(key)
+            if loaded is None or loaded.artifact != info:
+                return None
+            self._loaded.move_to_end(key)
+            return loaded.classifier
+
+    def __contains__(self, key) -> bool:
+        try:
+            self._resolve(key)
+        except KeyError:
+            return False
+        return True
+
+    def promote(self, name: str, version: str) -> list[str]:
+        """Serve `version` as the current `name`; only that model is reloaded."""
+        self.store.promote(name, version)
+        return self.refresh()
+
+    def __iter__(self):
+        return iter(list(self._artifacts))
+
+    def __len__(self) -> int:
+        return len(self._artifacts)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory_budget": self.memory_budget,
+                "shared": self.shared,
+                "resident_bytes": self.resident_bytes,
+                "known": sorted(self._artifacts),
+                "current": {name: info.version for name, info in self._artifacts.items()},
+                "loaded": {
+                    key: {
+                        "version": loaded.artifact.version,
+                        "nbytes": loaded.nbytes,
+                        "load_seconds": loaded.load_seconds,
+                    }
+                    for key, loaded in self._loaded.items()
+                },
+            }
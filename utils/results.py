@@ -0,0 +1,195 @@
+from collections import OrderedDict
+from typing import TYPE_CHECKING
+from utils.utils import DISPLAY_LABELS
+import numpy as np
+import threading
+import shutil
+import json
+import time
+import uuid
+import os
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class ResultNotFound(KeyError):
+    pass
+
+
+class ResultStore:
+    """Prediction runs stored on disk, one `.npy` file per column.
+
+    Numeric columns keep their dtype, text columns become fixed-width
+    unicode arrays and predictions are int8 codes into `DISPLAY_LABELS`, so
+    every column can be memory-mapped and a page only touches the rows it
+    returns. Runs expire after `ttl` seconds and at most `max_runs` are kept;
+    both are enforced whenever a new run is saved.
+    """
+
+    PREDICTION = "prediction"
+    META_FILE = "meta.json"
+
+    def __init__(self, root=os.path.join("dataset", "results"), ttl=3600.0, max_runs=100):
+        self.root = root
+        self.ttl = ttl
+        self.max_runs = max_runs
+        # (result id, column, descending) -> row order, for repeated paging
+        self._orders: OrderedDict[tuple, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            root=os.getenv("EXOVISION_RESULT_DIR", os.path.join("dataset", "results")),
+            ttl=float(os.getenv("EXOVISION_RESULT_TTL_SECONDS", "3600")),
+            max_runs=int(os.getenv("EXOVISION_RESULT_MAX_RUNS", "100")),
+        )
+
+    def path(self, result_id: str) -> str:
+        if not result_id.isalnum():
+            raise ResultNotFound(result_id)
+        return os.path.join(self.root, result_id)
+
+    def column_names(self, columns) -> list[str]:
+        """Stored names of the input `columns`: ones that clash with the
+        prediction column or with each other get an `_input` / `_<n>` suffix."""
+        names = []
+        taken = {self.PREDICTION}
+        for name in map(str, columns):
+            unique = f"{name}_input" if name in taken else name
+            n = 2
+            while unique in taken:
+                unique = f"{name}_{n}"
+                n += 1
+            taken.add(unique)
+            names.append(unique)
+        return names
+
+    def save(self, df: "pd.DataFrame", predictions, counts: dict[str, int], **extra) -> str:
+        """Store `df` with its predicted display labels; returns the result id."""
+        result_id = uuid.uuid4().hex
+        tmp_dir = os.path.join(self.root, f".{result_id}.tmp")
+        os.makedirs(tmp_dir)
+        codes = {label: code for code, label in enumerate(DISPLAY_LABELS)}
+        np.save(
+            os.path.join(tmp_dir, "0.npy"),
+            np.array([codes[label] for label in predictions], dtype=np.int8),
+        )
+        columns = self.column_names(df.columns)
+        for i in range(1, len(columns) + 1):
+            series = df.iloc[:, i - 1]
+            values = series.to_numpy()
+            if values.dtype.kind not in "biuf":
+                values = series.where(series.notna(), "").astype(str).to_numpy(dtype=str)
+            np.save(os.path.join(tmp_dir, f"{i}.npy"), values)
+        with open(os.path.join(tmp_dir, self.META_FILE), "w") as f:
+            json.dump(
+                {
+                    "result_id": result_id,
+                    "columns": [self.PREDICTION, *columns],
+                    "n_rows": len(df),
+                    "counts": counts,
+                    "created_at": time.time(),
+                    **extra,
+                },
+                f,
+            )
+        os.rename(tmp_dir, self.path(result_id))
+        self.expire()
+        return result_id
+
+    def meta(self, result_id: str) -> dict:
+        try:
+            with open(os.path.join(self.path(result_id), self.META_FILE)) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            raise ResultNotFound(result_id) from None
+        if meta["created_at"] + self.ttl <= time.time():
+            raise ResultNotFound(result_id)
+        return meta
+
+    def column(self, result_id: str, name: str, meta: dict | None = None) -> np.ndarray:
+        meta = meta or self.meta(result_id)
+        if name not in meta["columns"]:
+            raise ValueError(f"Unknown column {name!r}")
+        index = meta["columns"].index(name)
+        return np.load(os.path.join(self.path(result_id), f"{index}.npy"), mmap_mode="r")
+
+    def _order(self, result_id: str, meta: dict, sort: str, descending: bool) -> np.ndarray:
+        key = (result_id, sort, descending)
+        with self._lock:
+            if key in self._orders:
+                self._orders.move_to_end(key)
+                return self._orders[key]
+        values = self.column(result_id, sort, meta)
+        order = np.argsort(values, kind="stable")
+        if descending:
+            # reverse the values but keep missing ones last
+            missing = np.zeros(len(order), dtype=bool)
+            if values.dtype.kind == "f":
+                missing = np.isnan(values[order])
+            order = np.concatenate([order[~missing][::-1], order[missing]])
+        with self._lock:
+            self._orders[key] = order
+            while len(self._orders) > 16:
+                self._orders.popitem(last=False)
+        return order
+
+    def select(
+        self, result_id: str, sort: str | None = None, descending=False, predictions=None
+    ) -> tuple[dict, np.ndarray]:
+        """Metadata and row indices after filtering by predicted label and sorting."""
+        meta = self.meta(result_id)
+        rows = (
+            self._order(result_id, meta, sort, descending)
+            if sort
+            else np.arange(meta["n_rows"])
+        )
+        if predictions:
+            unknown = set(predictions) - set(DISPLAY_LABELS)
+            if unknown:
+                raise ValueError(f"Unknown prediction {', '.join(sorted(unknown))}")
+            codes = [DISPLAY_LABELS.index(label) for label in predictions]
+            keep = np.isin(self.column(result_id, self.PREDICTION, meta), codes)
+            rows = rows[keep[rows]]
+        return meta, rows
+
+    def rows(self, result_id: str, meta: dict, rows: np.ndarray) -> list[list]:
+        """Values of `rows` (in that order) as lists, predictions decoded."""
+        columns = []
+        for name in meta["columns"]:
+            values = self.column(result_id, name, meta)[rows]
+            if name == self.PREDICTION:
+                columns.append([DISPLAY_LABELS[code] for code in values])
+            else:
+                columns.append(values.tolist())
+        return [list(row) for row in zip(*columns)]
+
+    def iter_csv(self, result_id: str, meta: dict, rows: np.ndarray, chunk_rows=10_000):
+        import pandas as pd
+
+        for start in range(0, max(len(rows), 1), chunk_rows):
+            chunk = rows[start : start + chunk_rows]
+            frame = pd.DataFrame(self.rows(result_id, meta, chunk), columns=meta["columns"])
+            yield frame.to_csv(index=False, header=start == 0)
+
+    def delete(self, result_id: str):
+        shutil.rmtree(self.path(result_id), ignore_errors=True)
+        with self._lock:
+            for key in [key for key in self._orders if key[0] == result_id]:
+                del self._orders[key]
+
+    def expire(self):
+        """Delete expired runs and the oldest ones beyond `max_runs`."""
+        if not os.path.isdir(self.root):
+            return
+        runs = []
+        for entry in os.scandir(self.root):
+            if entry.is_dir() and not entry.name.startswith("."):
+                runs.append((entry.stat().st_mtime, entry.name))
+        runs.sort(reverse=True)
+        now = time.time()
+        for i, (mtime, result_id) in enumerate(runs):
+            if i >= self.max_runs or mtime + self.ttl <= now:
+                self.delete(result_id)
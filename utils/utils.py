@@ -1,26 +1,69 @@
-from utils.main import ExoPlanetsClassifier
-import os
+from utils.main import ExoPlanetsClassifier, to_display_label
+from utils.metrics import metrics
+from utils.model_store import ModelStore
+from typing import TYPE_CHECKING
+from io import BytesIO
+import numpy as np
 
+if TYPE_CHECKING:
+    import pandas as pd
 
-def get_models_names() -> list[str]:
-    models_dirs = os.listdir("models")
-    models = []
-    for i in range(len(models_dirs)):
-        if models_dirs[i].endswith(".joblib"):
-            models.append(models_dirs[i].removesuffix(".joblib"))
 
-    return models
+def get_models_names() -> list[str]:
+    return ModelStore("models").names()
 
 
 def get_models() -> dict[str, ExoPlanetsClassifier]:
+    # the current version of every model
+    store = ModelStore("models")
     models = {}
-    models_dirs = os.listdir("models")
-    for i in range(len(models_dirs)):
-        if models_dirs[i].endswith(".joblib"):
-            model_name = models_dirs[i].removesuffix(".joblib")
-            models[model_name] = ExoPlanetsClassifier(
-                artifact_path=os.path.join("models", models_dirs[i])
-            )
+    for model_name in store.names():
+        version = store.current(model_name)
+        models[model_name] = ExoPlanetsClassifier(
+            artifact_path=store.artifact_path(model_name, version),
+            name=model_name,
+            version=version,
+        )
     return models
 
 
+def read_csv_bytes(contents: bytes) -> "pd.DataFrame":
+    # pandas is imported on first use to keep app startup fast
+    import pandas as pd
+
+    with metrics.timer("read_csv"), BytesIO(contents) as data_buffer:
+        return pd.read_csv(data_buffer, comment="#")
+
+
+DISPLAY_LABELS = ["Confirmed", "Candidate", "False Positive"]
+
+
+def display_confusion_matrix(actual, predicted) -> list[list[int]]:
+    """Rows are actual and columns predicted, both in DISPLAY_LABELS order.
+
+    Labels may be raw dispositions or display names in any case (e.g.
+    "FALSE POSITIVE", "Confirmed"); rows without an actual label are
+    skipped and any other label raises ValueError.
+    """
+    import pandas as pd
+
+    index = {label: i for i, label in enumerate(DISPLAY_LABELS)}
+    labelled = pd.notna(np.asarray(actual))
+
+    def codes(labels, kind):
+        labels = pd.Series(np.asarray(labels)[labelled], dtype=object)
+        mapping = {}
+        for label in labels.unique():
+            try:
+                mapping[label] = index[to_display_label(label)]
+            except ValueError:
+                raise ValueError(
+                    f"Unknown {kind} label {label!r}, expected one of {', '.join(DISPLAY_LABELS)}"
+                ) from None
+        return labels.map(mapping).to_numpy(dtype=int)
+
+    actual_codes = codes(actual, "actual")
+    predicted_codes = codes(predicted, "predicted")
+    matrix = np.zeros((len(DISPLAY_LABELS), len(DISPLAY_LABELS)), dtype=int)
+    np.add.at(matrix, (actual_codes, predicted_codes), 1)
+    return matrix.tolist()
@@ -0,0 +1,147 @@
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+from utils.constants import Constants
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+ERROR_KINDS = ("non_numeric", "infinite", "missing")
+
+
+@dataclass
+class ValidationReport:
+    """Which cells of a feature matrix are unusable, and why.
+
+    `errors` is an (n_rows, n_features) array of codes: 0 for a usable cell,
+    otherwise 1 + the index of the kind in `ERROR_KINDS`. Missing values only
+    count as errors when the validator was told not to allow them.
+    """
+
+    n_rows: int
+    valid: np.ndarray
+    errors: np.ndarray
+    missing_columns: list[str] = field(default_factory=list)
+    samples: dict = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return not self.missing_columns and bool(self.valid.all())
+
+    @property
+    def n_invalid(self) -> int:
+        return int(self.n_rows - self.valid.sum())
+
+    def message(self) -> str:
+        if self.missing_columns:
+            return f"Missing required features: {', '.join(self.missing_columns)}"
+        return (
+            f"{self.n_invalid} of {self.n_rows} rows have invalid feature values; "
+            "fix them or resend with skip_invalid to predict the remaining rows"
+        )
+
+    def to_dict(self, max_errors=100, row_offset=0) -> dict:
+        """JSON-ready summary with per-column counts and the first `max_errors` cells."""
+        features = Constants.FEATURES_REQUIRED_TO_PREDICT
+        by_column = {}
+        for j, name in enumerate(features):
+            counts = np.bincount(self.errors[:, j], minlength=len(ERROR_KINDS) + 1)[1:]
+            if counts.any():
+                by_column[name] = {
+                    kind: int(count) for kind, count in zip(ERROR_KINDS, counts) if count
+                }
+        rows, columns = np.nonzero(self.errors)
+        return {
+            "n_rows": self.n_rows,
+            "n_valid": self.n_rows - self.n_invalid,
+            "n_invalid": self.n_invalid,
+            "missing_columns": self.missing_columns,
+            "errors_by_column": by_column,
+            "errors": [
+                {
+                    "row": int(row) + row_offset,
+                    "column": features[column],
+                    "error": ERROR_KINDS[self.errors[row, column] - 1],
+                    "value": self.samples.get((int(row), int(column))),
+                }
+                for row, column in zip(rows[:max_errors], columns[:max_errors])
+            ],
+        }
+
+
+def validate_matrix(
+    X: np.ndarray,
+    non_numeric: np.ndarray | None = None,
+    allow_missing=True,
+    max_samples=100,
+    text_cells: dict | None = None,
+) -> ValidationReport:
+    """Report on a float matrix ordered like `Constants.FEATURES_REQUIRED_TO_PREDICT`.
+
+    `non_numeric` marks cells that were text before coercion (they are NaN in
+    `X`); `text_cells` gives them as `{(row, column): text}` instead, as
+    `decode_features` returns them.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    nan = np.isnan(X)
+    if non_numeric is None:
+        non_numeric = np.zeros(X.shape, dtype=bool)
+    if text_cells:
+        non_numeric = non_numeric.copy()
+        for row, j in text_cells:
+            non_numeric[row, j] = True
+    errors = np.zeros(X.shape, dtype=np.int8)
+    if not allow_missing:
+        errors[nan & ~non_numeric] = 1 + ERROR_KINDS.index("missing")
+    errors[np.isinf(X)] = 1 + ERROR_KINDS.index("infinite")
+    errors[non_numeric] = 1 + ERROR_KINDS.index("non_numeric")
+    report = ValidationReport(n_rows=len(X), valid=~errors.any(axis=1), errors=errors)
+    rows, columns = np.nonzero(np.isinf(X))
+    for row, j in zip(rows[:max_samples], columns[:max_samples]):
+        report.samples[(int(row), int(j))] = str(X[row, j])
+    for cell in sorted(text_cells or ())[:max_samples]:
+        report.samples[cell] = text_cells[cell]
+    return report
+
+
+def validate_frame(
+    df: "pd.DataFrame", allow_missing=True, max_samples=100
+) -> tuple[np.ndarray, ValidationReport]:
+    """Coerce the feature columns of `df` to one float matrix and validate it.
+
+    Numeric columns are converted as they are; text columns go through
+    `pd.to_numeric` once, and cells that fail to parse are reported as
+    non-numeric (the offending text is kept for the first `max_samples`).
+    Returns the matrix (unusable cells as NaN/inf) and the report.
+    """
+    import pandas as pd
+
+    features = Constants.FEATURES_REQUIRED_TO_PREDICT
+    missing_columns = [name for name in features if name not in df.columns]
+    if missing_columns:
+        empty = np.zeros((len(df), len(features)), dtype=np.int8)
+        return np.empty((0, len(features))), ValidationReport(
+            n_rows=len(df),
+            valid=np.zeros(len(df), dtype=bool),
+            errors=empty,
+            missing_columns=missing_columns,
+        )
+
+    X = np.empty((len(df), len(features)), dtype=np.float64)
+    non_numeric = np.zeros(X.shape, dtype=bool)
+    for j, name in enumerate(features):
+        column = df[name]
+        if pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column):
+            X[:, j] = column.to_numpy(dtype=np.float64, na_value=np.nan)
+            continue
+        coerced = pd.to_numeric(column, errors="coerce")
+        X[:, j] = coerced.to_numpy(dtype=np.float64, na_value=np.nan)
+        non_numeric[:, j] = (coerced.isna() & column.notna()).to_numpy()
+
+    report = validate_matrix(X, non_numeric, allow_missing=allow_missing, max_samples=max_samples)
+    # keep the text of the first few bad cells for the error report
+    rows, columns = np.nonzero(non_numeric)
+    for row, j in zip(rows[:max_samples], columns[:max_samples]):
+        report.samples[(int(row), int(j))] = str(df[features[j]].iat[row])
+    return X, report
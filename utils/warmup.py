@@ -0,0 +1,99 @@
+from collections.abc import Mapping
+from utils.constants import Constants
+from utils.metrics import metrics
+import importlib
+import numpy as np
+import time
+import os
+
+
+class Warmup:
+    """Loads models and runs warm-up predictions once the app has started.
+
+    `main` imports only what serving needs, so the first request of each kind
+    would otherwise pay for unpickling a model (and importing sklearn) or for
+    importing pandas. Running this from the lifespan hook moves that cost to
+    startup, while `/ready` reports whether it has finished.
+    """
+
+    # imported up front so the first CSV upload does not wait for them
+    PRELOAD_MODULES = ("pandas", "sklearn.ensemble")
+
+    def __init__(self, models: Mapping, names=None, enabled=True):
+        self.models = models
+        # None warms every model in the registry
+        self.names = names
+        self.enabled = enabled
+        self.status = "pending" if enabled else "skipped"
+        self.warmed: dict[str, float] = {}
+        self.errors: dict[str, str] = {}
+        self.seconds = None
+
+    @classmethod
+    def from_env(cls, models: Mapping):
+        names = os.getenv("EXOVISION_WARMUP_MODELS")
+        return cls(
+            models,
+            names=[name.strip() for name in names.split(",") if name.strip()]
+            if names is not None
+            else None,
+            enabled=os.getenv("EXOVISION_WARMUP", "1") == "1",
+        )
+
+    @property
+    def ready(self) -> bool:
+        # a failed warm-up leaves models to load on first use, like a skipped one
+        return self.status in ("ready", "skipped", "failed")
+
+    def run(self):
+        """Blocking; call it from a worker thread."""
+        if not self.enabled:
+            return
+        self.status = "running"
+        started = time.perf_counter()
+        # anything escaping the per-model handling must not leave /ready at 503
+        try:
+            for module in self.PRELOAD_MODULES:
+                importlib.import_module(module)
+
+            budget = getattr(self.models, "memory_budget", None)
+            for name in self.names if self.names is not None else list(self.models):
+                # warming past the memory budget would only evict the models warmed first
+                if budget is not None and self.models.resident_bytes >= budget:
+                    print(f"Warm-up stopped at {name}: memory budget reached")
+                    break
+                try:
+                    self.warmed[name] = self.warm(name)
+                except Exception as e:
+                    self.errors[name] = str(e)
+                    print(f"Warm-up of {name} failed: {e}")
+            self.status = "ready"
+        except Exception as e:
+            self.errors["*"] = str(e)
+            print(f"Warm-up failed: {e}")
+        finally:
+            if self.status == "running":
+                self.status = "failed"
+            self.seconds = time.perf_counter() - started
+            metrics.set("warmup_seconds", self.seconds)
+
+    def warm(self, name: str) -> float:
+        started = time.perf_counter()
+        classifier = self.models[name]
+        # one small and one large batch, so both the flat forest and sklearn
+        # paths have run once; they are not traffic, so they stay out of metrics
+        with metrics.paused():
+            for n_rows in (1, Constants.FLAT_FOREST_MAX_ROWS + 1):
+                classifier.predict_batch(
+                    np.zeros((n_rows, len(Constants.FEATURES_REQUIRED_TO_PREDICT)))
+                )
+        return time.perf_counter() - started
+
+    def stats(self) -> dict:
+        return {
+            "status": self.status,
+            "ready": self.ready,
+            "seconds": self.seconds,
+            "warmed": self.warmed,
+            "errors": self.errors,
+        }